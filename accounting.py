@@ -0,0 +1,236 @@
+"""Per-process memory accounting and quotas.
+
+Usage is charged and released as allocations happen, so every per-process
+query is a dictionary lookup instead of a scan over the blocks. An
+allocation is accounted in two phases: `reserve` checks the hard quota and
+holds the amount before the allocator runs, then `commit` turns it into
+usage (or `cancel` gives it back when the allocation failed), so two
+threads allocating for one process can not overshoot its quota together.
+
+A hard quota refuses the allocation with QuotaExceeded, a MemoryError, so
+callers that already handle an exhausted pool handle it too. A soft quota
+never refuses anything; processes over it are listed in `stats()` and
+reported by `commit`.
+
+The largest consumers come from a max-heap that gets an entry whenever a
+process's usage changes; entries made stale by a later change are
+dropped when they reach the top, so `top(n)` pops about n entries instead
+of sorting every process.
+"""
+from heapq import heapify, heappop, heappush
+import threading
+import metrics
+
+QUOTA_DENIALS = metrics.counter("accounting.quota_denials")
+
+
+class QuotaExceeded(MemoryError):
+    pass
+
+
+class ProcessUsage:
+    __slots__ = ('current', 'pending', 'peak', 'allocations', 'frees', 'hard', 'soft', 'mark')
+
+    def __init__(self):
+        self.current = 0
+        self.pending = 0
+        self.peak = 0
+        self.allocations = 0
+        self.frees = 0
+        # None: use the default quota of the Accounting
+        self.hard = None
+        self.soft = None
+        # Sequence number of the process's current entry in the usage heap
+        self.mark = None
+
+    def as_dict(self):
+        return {
+            "current": self.current,
+            "peak": self.peak,
+            "allocations": self.allocations,
+            "frees": self.frees
+        }
+
+
+class Accounting:
+    """Memory usage, peak usage and allocation counts per process, with quotas in blocks."""
+
+    def __init__(self, hard_quota=None, soft_quota=None):
+        self.hard_quota = hard_quota
+        self.soft_quota = soft_quota
+        self.used = 0
+        self.denials = 0
+        self._processes = {}
+        self._over_soft = set()
+        # (-current, mark, process_id); only the entry whose mark matches the record is current
+        self._heap = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _record(self, process_id):
+        record = self._processes.get(process_id)
+        if record is None:
+            record = self._processes[process_id] = ProcessUsage()
+        return record
+
+    def _limits(self, record):
+        hard = self.hard_quota if record.hard is None else record.hard
+        soft = self.soft_quota if record.soft is None else record.soft
+        return hard, soft
+
+    def _push(self, process_id, record):
+        record.mark = self._sequence
+        self._sequence += 1
+        heap = self._heap
+        if len(heap) > 2 * len(self._processes) + 16:
+            # Mostly stale entries: rebuild from the records
+            heap[:] = [(-usage.current, usage.mark, pid) for pid, usage in self._processes.items()
+                       if usage.mark is not None]
+            heapify(heap)
+        else:
+            heappush(heap, (-record.current, record.mark, process_id))
+
+    def set_quota(self, process_id, hard=None, soft=None):
+        """Set the quotas of one process; None falls back to the default quota."""
+        with self._lock:
+            record = self._record(process_id)
+            record.hard = hard
+            record.soft = soft
+            self._update_soft(process_id, record)
+
+    def quota(self, process_id):
+        """Return the effective (hard, soft) quota of a process."""
+        record = self._processes.get(process_id)
+        if record is None:
+            return self.hard_quota, self.soft_quota
+        return self._limits(record)
+
+    def _update_soft(self, process_id, record):
+        soft = self._limits(record)[1]
+        if soft is not None and record.current > soft:
+            self._over_soft.add(process_id)
+        else:
+            self._over_soft.discard(process_id)
+
+    def reserve(self, process_id, amount):
+        """Hold `amount` blocks for an allocation; raise QuotaExceeded if it would break the hard quota."""
+        with self._lock:
+            record = self._record(process_id)
+            hard = self._limits(record)[0]
+            if hard is not None and record.current + record.pending + amount > hard:
+                self.denials += 1
+                if metrics.enabled:
+                    QUOTA_DENIALS.inc()
+                raise QuotaExceeded(f"Process {process_id} would exceed its memory quota "
+                                    f"({record.current + record.pending + amount} > {hard} blocks)")
+            record.pending += amount
+
+    def commit(self, process_id, amount):
+        """Charge a reserved allocation; return True if the process is now over its soft quota."""
+        with self._lock:
+            record = self._processes[process_id]
+            record.pending -= amount
+            record.current += amount
+            record.allocations += 1
+            if record.current > record.peak:
+                record.peak = record.current
+            self.used += amount
+            self._update_soft(process_id, record)
+            self._push(process_id, record)
+            return process_id in self._over_soft
+
+    def cancel(self, process_id, amount):
+        """Give back a reservation whose allocation failed."""
+        with self._lock:
+            self._processes[process_id].pending -= amount
+
+    def charge(self, process_id, amount):
+        """Reserve and commit in one go (for callers that allocate under their own lock)."""
+        self.reserve(process_id, amount)
+        return self.commit(process_id, amount)
+
+    def release(self, process_id, amount):
+        """Return `amount` freed blocks of a process."""
+        with self._lock:
+            record = self._processes.get(process_id)
+            if record is None or not amount:
+                return
+            record.current -= amount
+            record.frees += 1
+            self.used -= amount
+            self._update_soft(process_id, record)
+            self._push(process_id, record)
+
+    def usage(self, process_id):
+        record = self._processes.get(process_id)
+        return record.current if record is not None else 0
+
+    def peak(self, process_id):
+        record = self._processes.get(process_id)
+        return record.peak if record is not None else 0
+
+    def get(self, process_id):
+        """Usage, peak, counts and effective quotas of one process."""
+        record = self._processes.get(process_id)
+        if record is None:
+            return None
+        info = record.as_dict()
+        info["hard_quota"], info["soft_quota"] = self._limits(record)
+        return info
+
+    def over_soft_quota(self, process_id):
+        return process_id in self._over_soft
+
+    def _top(self, count):
+        heap = self._heap
+        processes = self._processes
+        top = []
+        kept = []
+        while heap and len(top) < count and heap[0][0]:
+            entry = heappop(heap)
+            record = processes.get(entry[2])
+            if record is not None and record.mark == entry[1]:
+                top.append((entry[2], -entry[0]))
+                kept.append(entry)
+        for entry in kept:
+            heappush(heap, entry)
+        return top
+
+    def top(self, count=5):
+        """The `count` processes using the most memory, as (process_id, blocks) pairs."""
+        with self._lock:
+            return self._top(count)
+
+    def export(self):
+        """Rows of (process_id, current, peak, allocations, frees, hard, soft) for every process."""
+        with self._lock:
+            return [(process_id, record.current, record.peak, record.allocations, record.frees,
+                     record.hard, record.soft) for process_id, record in self._processes.items()]
+
+    def load(self, rows):
+        """Replace all records with rows made by `export`."""
+        with self._lock:
+            self._processes = {}
+            self._over_soft = set()
+            self._heap = []
+            self.used = 0
+            for process_id, current, peak, allocations, frees, hard, soft in rows:
+                record = self._processes[process_id] = ProcessUsage()
+                record.current, record.peak = current, peak
+                record.allocations, record.frees = allocations, frees
+                record.hard, record.soft = hard, soft
+                self.used += current
+                self._update_soft(process_id, record)
+                self._push(process_id, record)
+
+    def stats(self, top=5):
+        with self._lock:
+            return {
+                "used_blocks": self.used,
+                "processes_with_memory": sum(1 for record in self._processes.values() if record.current),
+                "hard_quota": self.hard_quota,
+                "soft_quota": self.soft_quota,
+                "quota_denials": self.denials,
+                "over_soft_quota": sorted(self._over_soft, key=str),
+                "top_consumers": self._top(top)
+            }
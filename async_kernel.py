@@ -0,0 +1,94 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from events import EventChannel
+from file_system import FileSystem
+from kernel import Kernel
+
+
+class AsyncKernel:
+    """Asyncio facade over Kernel and FileSystem.
+
+    Every call runs on a dedicated executor thread, so blocking work (and
+    FilesLog persistence behind it) never runs on the event loop. The
+    executor has a single worker by default, which keeps Kernel state
+    consistent without extra locking. At most `max_in_flight` requests are
+    queued at once; further callers wait, which gives back-pressure.
+
+    The Kernel and FileSystem created by default report to `events`, a
+    silent channel unless one is given, so executor threads do not print.
+    """
+
+    def __init__(self, kernel=None, file_system=None, max_in_flight=64, executor=None, events=None):
+        events = events if events is not None else EventChannel()
+        self.kernel = kernel if kernel is not None else Kernel(events=events)
+        self.file_system = file_system if file_system is not None else FileSystem(events=events)
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="kernel")
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def _call(self, function, *args):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+
+    async def allocate(self, process_id, amount):
+        """Allocate memory and return its address."""
+        return await self._call(self.kernel.allocate_memory, process_id, amount)
+
+    async def deallocate(self, process_id):
+        return await self._call(self.kernel.deallocate_memory, process_id)
+
+    async def read(self, address, length):
+        return await self._call(self.kernel.read_memory, address, length)
+
+    async def write(self, address, data):
+        return await self._call(self.kernel.write_memory, address, data)
+
+    async def create_file(self, path, content=""):
+        return await self._call(self.file_system.create_file, path, content)
+
+    async def read_file(self, path):
+        return await self._call(self.file_system.read_file, path)
+
+    async def delete_file(self, path):
+        return await self._call(self.file_system.delete_file, path)
+
+    async def create_directory(self, path):
+        return await self._call(self.file_system.create_directory, path)
+
+    async def delete_directory(self, path):
+        return await self._call(self.file_system.delete_directory, path)
+
+    async def list_files(self, path):
+        return await self._call(self.file_system.list_files, path)
+
+    def _flush(self):
+        self.kernel.files_log.memory_journal.flush()
+        self.kernel.sync_memory()
+
+    async def flush(self):
+        """Write pending journal entries and the RAM image to disk."""
+        return await self._call(self._flush)
+
+    async def close(self):
+        await self.flush()
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+
+if __name__ == "__main__":
+    async def main():
+        async with AsyncKernel() as kernel:
+            addresses = await asyncio.gather(*(kernel.allocate(pid, 4) for pid in range(1, 11)))
+            await kernel.write(addresses[0], [1, 2, 3, 4])
+            print(await kernel.read(addresses[0], 4))
+            await asyncio.gather(*(kernel.deallocate(pid) for pid in range(1, 11)))
+
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+"""Benchmarks for the memory, kernel, file system, logging and shell hot paths.
+
+Run with ``python -m benchmark``; the results are printed as JSON so runs
+can be stored and compared. Every workload is seeded, so the same seed and
+operation count always produce the same sequence of operations. Everything
+runs inside a temporary directory, so the benchmark never touches data/.
+
+Each workload reports operations per second, p50/p99 latency of single
+operations and the peak RSS of the process after the workload (the peak is
+process-wide, so it never goes down between workloads; it is None where
+the `resource` module is unavailable, e.g. on Windows).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _timed(operations):
+    """Run zero-argument callables one by one and return their latencies."""
+    latencies = []
+    clock = time.perf_counter
+    for operation in operations:
+        started = clock()
+        operation()
+        latencies.append(clock() - started)
+    return latencies
+
+
+def memory_manager_churn(rng, operations):
+    from memory import MemoryManager
+    manager = MemoryManager(size=1 << 16)
+    live = []
+
+    def allocate(pid, amount):
+        return lambda: manager.allocate(pid, amount)
+
+    def deallocate(pid):
+        return lambda: manager.deallocate(pid)
+
+    def steps():
+        for pid in range(operations):
+            if live and (len(live) > 256 or rng.random() < 0.4):
+                yield deallocate(live.pop(rng.randrange(len(live))))
+            else:
+                live.append(pid)
+                yield allocate(pid, rng.randint(1, 64))
+    return _timed(steps())
+
+
+def kernel_churn(rng, operations):
+    from events import EventChannel
+    from kernel import Kernel
+    kernel = Kernel(events=EventChannel())
+    live = []
+
+    def steps():
+        for pid in range(operations):
+            if live and (len(live) > 32 or rng.random() < 0.4):
+                yield lambda pid=live.pop(rng.randrange(len(live))): kernel.deallocate_memory(pid)
+            else:
+                live.append(pid)
+                yield lambda pid=pid, amount=rng.randint(1, 16): kernel.allocate_memory(pid, amount)
+    return _timed(steps())
+
+
+def memory_random_io(rng, operations):
+    from memory import MemoryManager
+    manager = MemoryManager(size=1 << 16)
+    blocks = manager.allocate(1, 1 << 16)
+
+    def steps():
+        for _ in range(operations):
+            address = rng.randrange(len(blocks) - 64)
+            if rng.random() < 0.5:
+                yield lambda address=address, value=rng.randrange(256): manager.write_memory(address, value)
+            else:
+                yield lambda address=address, length=rng.randint(1, 64): manager.read_memory(address, length)
+    return _timed(steps())
+
+
+def file_system_deep(rng, operations):
+    from events import EventChannel
+    from file_system import FileSystem
+    fs = FileSystem(events=EventChannel())
+
+    def steps():
+        # Chains of nested directories, 64 levels each, with a file on every level
+        path = ""
+        for index in range(max(1, operations // 2)):
+            path = f"/deep{index // 64}" if index % 64 == 0 else f"{path}/d{index % 64}"
+            yield lambda path=path: fs.create_directory(path)
+            yield lambda path=path: fs.create_file(path + "/file.txt", "x" * rng.randint(1, 256))
+    return _timed(steps())
+
+
+def file_system_wide(rng, operations):
+    from events import EventChannel
+    from file_system import FileSystem
+    fs = FileSystem(events=EventChannel())
+    fs.create_directory("/wide")
+    created = []
+
+    def steps():
+        for index in range(operations):
+            if created and rng.random() < 0.3:
+                yield lambda path=rng.choice(created): fs.read_file(path)
+            else:
+                created.append(f"/wide/f{index}")
+                yield lambda path=created[-1]: fs.create_file(path, "data" * rng.randint(1, 64))
+    return _timed(steps())
+
+
+def files_log_burst(rng, operations):
+    from files_log import FilesLog
+    log = FilesLog()
+
+    def steps():
+        for index in range(operations):
+            choice = rng.random()
+            if choice < 0.4:
+                yield lambda index=index: log.create_cpu_block(index, index % 64)
+            elif choice < 0.8:
+                yield lambda index=index: log.create_memory_block(index, 4, index % 64)
+            else:
+                yield lambda index=index: log.save_user(f"user{index}", "password")
+    return _timed(steps())
+
+
+def shell_throughput(rng, operations):
+    from kernel import Kernel
+    from shell import Shell
+    shell = Shell(Kernel())
+    shell.set_quiet()
+
+    def steps():
+        for index in range(operations):
+            pid = index % 32 + 1
+            line = rng.choice([
+                f"allocate {pid} {rng.randint(1, 8)}", f"deallocate {pid}",
+                f"write {rng.randrange(1000)} 1 2 3", f"read {rng.randrange(1000)} 8", "mem", "ver"
+            ])
+            yield lambda line=line: shell.execute(line)
+    return _timed(steps())
+
+
+def _flush_persistence():
+    """Write out everything the workloads queued before the temporary directory goes away."""
+    if "files_log" in sys.modules:
+        from files_log import FilesLog
+        log = FilesLog()
+        log.memory_journal.flush()
+        log.log.flush()
+        log.accounts.flush()
+
+
+WORKLOADS = {
+    "memory_manager_churn": memory_manager_churn,
+    "kernel_churn": kernel_churn,
+    "memory_random_io": memory_random_io,
+    "file_system_deep": file_system_deep,
+    "file_system_wide": file_system_wide,
+    "files_log_burst": files_log_burst,
+    "shell_throughput": shell_throughput,
+}
+
+
+def summarize(latencies):
+    """Throughput over the time spent in the operations themselves, plus percentiles."""
+    ordered = sorted(latencies)
+    elapsed = sum(ordered)
+    return {
+        "operations": len(ordered),
+        "seconds": elapsed,
+        "ops_per_second": len(ordered) / elapsed if elapsed else 0.0,
+        "p50_us": _percentile(ordered, 0.50) * 1e6 if ordered else None,
+        "p99_us": _percentile(ordered, 0.99) * 1e6 if ordered else None,
+    }
+
+
+def run(workloads=None, operations=10000, seed=0):
+    """Run the selected workloads (all by default) and return the results as a dict."""
+    names = list(workloads or WORKLOADS)
+    results = {}
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hso-bench-", ignore_cleanup_errors=True) as directory:
+        os.chdir(directory)
+        try:
+            for name in names:
+                rng = random.Random(f"{seed}:{name}")
+                # Components run with silent event channels; this only catches stray output
+                with contextlib.redirect_stdout(io.StringIO()):
+                    latencies = WORKLOADS[name](rng, operations)
+                result = summarize(latencies)
+                result["peak_rss_kb"] = peak_rss_kb()
+                results[name] = result
+            _flush_persistence()
+        finally:
+            os.chdir(previous)
+    return {
+        "seed": seed,
+        "operations": operations,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--operations", type=int, default=10000, help="operations per workload")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-w", "--workload", action="append", choices=sorted(WORKLOADS),
+                        help="run only this workload (can be repeated)")
+    parser.add_argument("-o", "--output", help="also write the JSON report to this file")
+    options = parser.parse_args(argv)
+
+    report = run(options.workload, options.operations, options.seed)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
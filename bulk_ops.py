@@ -0,0 +1,110 @@
+"""Bulk operations on simulated memory buffers.
+
+Buffers can be Python lists, bytearrays, memoryviews or NumPy arrays. NumPy
+is optional: when it is installed, ndarray buffers use vectorized paths,
+otherwise everything falls back to slice operations, which run at C speed
+for lists and bytes-like objects.
+"""
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _is_ndarray(buf):
+    return np is not None and isinstance(buf, np.ndarray)
+
+
+def _is_bytes_like(buf):
+    return isinstance(buf, (bytearray, memoryview))
+
+
+def fill(buf, start, length, value):
+    """Set `length` cells starting at `start` to `value`."""
+    if length <= 0:
+        return
+    if _is_ndarray(buf):
+        buf[start:start + length] = value
+    elif _is_bytes_like(buf):
+        buf[start:start + length] = bytes([value or 0]) * length
+    else:
+        buf[start:start + length] = [value] * length
+
+
+def memmove(buf, dst, src, length):
+    """Copy `length` cells from `src` to `dst` in the same buffer; ranges may overlap."""
+    if length <= 0 or dst == src:
+        return
+    if isinstance(buf, memoryview):
+        buf[dst:dst + length] = buf[src:src + length].tobytes()
+    elif _is_ndarray(buf):
+        buf[dst:dst + length] = buf[src:src + length].copy()
+    else:
+        buf[dst:dst + length] = buf[src:src + length]
+
+
+def memcpy(dst_buf, dst, src_buf, src, length):
+    """Copy `length` cells between two buffers."""
+    if dst_buf is src_buf:
+        memmove(dst_buf, dst, src, length)
+    elif length > 0:
+        dst_buf[dst:dst + length] = src_buf[src:src + length]
+
+
+def memcmp(buf_a, a, buf_b, b, length):
+    """Compare two ranges; return 0 if equal, otherwise -1 or 1 like C memcmp.
+
+    `None` (an unowned cell) sorts before any value.
+    """
+    left = buf_a[a:a + length]
+    right = buf_b[b:b + length]
+    if _is_ndarray(left) or _is_ndarray(right):
+        diff = np.flatnonzero(np.asarray(left) != np.asarray(right))
+        if not len(diff):
+            return 0
+        index = diff[0]
+        return -1 if left[index] < right[index] else 1
+    if left == right:
+        return 0
+    for x, y in zip(left, right):
+        if x != y:
+            if x is None:
+                return -1
+            if y is None:
+                return 1
+            return -1 if x < y else 1
+    return 0
+
+
+def find_owner_range(buf, owner, start=0, stop=None):
+    """Return (start, length) of the first run of cells equal to `owner`, or None."""
+    if stop is None:
+        stop = len(buf)
+    if _is_ndarray(buf):
+        hits = np.flatnonzero(buf[start:stop] == owner)
+        if not len(hits):
+            return None
+        first = start + int(hits[0])
+        misses = np.flatnonzero(buf[first:stop] != owner)
+        end = first + int(misses[0]) if len(misses) else stop
+        return first, end - first
+    try:
+        first = buf.index(owner, start, stop)
+    except ValueError:
+        return None
+    end = first + 1
+    while end < stop and buf[end] == owner:
+        end += 1
+    return first, end - first
+
+
+def owner_histogram(buf, start=0, stop=None):
+    """Return {owner: cell count} for the given range."""
+    if stop is None:
+        stop = len(buf)
+    if _is_ndarray(buf):
+        owners, counts = np.unique(buf[start:stop], return_counts=True)
+        return dict(zip(owners.tolist(), counts.tolist()))
+    return dict(Counter(buf[start:stop]))
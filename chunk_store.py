@@ -0,0 +1,122 @@
+from hashlib import blake2b
+
+CHUNK_SIZE = 4096
+DIGEST_SIZE = 16
+
+
+def chunk_digest(data):
+    """Content address of a chunk."""
+    return blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class ChunkStore:
+    """Content-addressed, reference-counted store of fixed-size file chunks.
+
+    A chunk id is the hash of its contents, so identical chunks - within a
+    file or across files - are stored once and shared by reference count.
+    Chunks are immutable: modifying one produces (or reuses) the chunk for
+    the new contents and drops a reference to the old one.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._chunks = {}  # digest -> bytes
+        self._refs = {}    # digest -> reference count
+        self._lazy = {}    # digest -> (length, load) for chunks not read from the image yet
+        self.chunk_count = 0
+        self.stored_bytes = 0
+        self.logical_bytes = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._refs
+
+    def register_lazy(self, chunk_id, length, refs, load):
+        """Register a chunk kept in a disk image; `load()` reads it on first use.
+
+        The image's totals are already counted, so a chunk that was
+        stored in the meantime under the same digest is merged instead of
+        being counted twice.
+        """
+        if chunk_id in self._refs:
+            self._refs[chunk_id] += refs
+            self.stored_bytes -= length
+            self.chunk_count -= 1
+        else:
+            self._refs[chunk_id] = refs
+            self._lazy[chunk_id] = (length, load)
+
+    def put(self, data):
+        """Store one chunk (or reuse an identical one) and return its id."""
+        chunk_id = chunk_digest(data)
+        refs = self._refs.get(chunk_id)
+        if refs is None:
+            self._chunks[chunk_id] = bytes(data)
+            self._refs[chunk_id] = 1
+            self.stored_bytes += len(data)
+            self.chunk_count += 1
+        else:
+            self._refs[chunk_id] = refs + 1
+        self.logical_bytes += len(data)
+        return chunk_id
+
+    def put_all(self, data):
+        """Split data into chunks and return the list of their ids."""
+        size = self.chunk_size
+        return [self.put(data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+    def get(self, chunk_id):
+        """Return chunk contents as bytes."""
+        chunk = self._chunks.get(chunk_id)
+        if chunk is None:
+            _, load = self._lazy.pop(chunk_id)
+            chunk = self._chunks[chunk_id] = bytes(load())
+        return chunk
+
+    def chunk_length(self, chunk_id):
+        lazy = self._lazy.get(chunk_id)
+        return lazy[0] if lazy is not None else len(self._chunks[chunk_id])
+
+    def load_all(self):
+        """Read every lazily registered chunk into memory."""
+        for chunk_id in list(self._lazy):
+            self.get(chunk_id)
+
+    def incref(self, chunk_id):
+        self._refs[chunk_id] += 1
+        self.logical_bytes += self.chunk_length(chunk_id)
+
+    def decref(self, chunk_id):
+        length = self.chunk_length(chunk_id)
+        self.logical_bytes -= length
+        refs = self._refs[chunk_id] - 1
+        if refs:
+            self._refs[chunk_id] = refs
+        else:
+            del self._refs[chunk_id]
+            self._chunks.pop(chunk_id, None)
+            self._lazy.pop(chunk_id, None)
+            self.stored_bytes -= length
+            self.chunk_count -= 1
+
+    def modify(self, chunk_id, offset, data):
+        """Write `data` at `offset` inside a chunk and return the id of the result."""
+        chunk = self.get(chunk_id)
+        if offset > len(chunk):
+            chunk += bytes(offset - len(chunk))
+        updated = chunk[:offset] + bytes(data) + chunk[offset + len(data):]
+        new_id = self.put(updated)
+        self.decref(chunk_id)
+        return new_id
+
+    def stats(self):
+        """Return chunk count, stored and logical bytes, dedup ratio and bytes saved."""
+        return {
+            'chunks': self.chunk_count,
+            'stored_bytes': self.stored_bytes,
+            'logical_bytes': self.logical_bytes,
+            'dedup_ratio': self.logical_bytes / self.stored_bytes if self.stored_bytes else 1.0,
+            'bytes_saved': self.logical_bytes - self.stored_bytes
+        }
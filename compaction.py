@@ -0,0 +1,155 @@
+import time
+
+
+class Compactor:
+    """Online compaction: slides live extents down into free holes, a bounded slice at a time.
+
+    `extents` is the owner's process_id -> [(start, length)] map and `lock`
+    the lock that guards it; `move(process_id, source, target, length)`
+    copies the contents and owner data of one extent to a lower address,
+    the two ranges may overlap. The owner reports every extent it adds or
+    removes with `track` and `untrack` (under the lock), which keeps an
+    index of live extents by start.
+
+    A pass walks the holes from the bottom of memory up, with a cursor
+    kept across steps: the extent right above a hole slides down to the
+    start of the hole, so the hole moves up and merges with the next one
+    and free space gathers at the top of memory. Holes and extents are
+    found by lookups in the allocator's and the compactor's indexes, never
+    by scanning. A step copies at most `budget` blocks (one extent if that
+    alone is larger), looks at no more than `budget` holes and holds the
+    lock only while it runs, so allocations and frees proceed between
+    steps.
+
+    Extents parked in thread caches of the allocator are neither live nor
+    free in an arena; they are pinned, as are extents that would have to
+    cross an arena boundary, and the cursor moves past them.
+
+    A move changes the address of a live extent, so whoever keeps an
+    address must follow it: listeners added with `add_listener` are called
+    as `listener(process_id, source, target, length)` after every move,
+    still under the lock.
+    """
+
+    def __init__(self, allocator, extents, lock, move, budget=256):
+        self.allocator = allocator
+        self.extents = extents
+        self.lock = lock
+        self.move = move
+        self.budget = budget
+        self.moved_blocks = 0
+        self.moved_extents = 0
+        self.steps = 0
+        self.passes = 0
+        self.listeners = []
+        # start -> (length, process_id) of every live extent
+        self._live = {}
+        # Address the next step continues the current pass from
+        self._cursor = 0
+        self.reset(allocator)
+
+    def add_listener(self, callback):
+        """Call `callback(process_id, source, target, length)` after every move."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def notify(self, process_id, source, target, length):
+        """Tell the listeners that an extent now lives at `target` (also used when a snapshot restore moves one)."""
+        for listener in self.listeners:
+            listener(process_id, source, target, length)
+
+    def track(self, process_id, start, length):
+        """Index a new live extent (call under the lock)."""
+        self._live[start] = (length, process_id)
+
+    def untrack(self, start):
+        """Drop a live extent that is being freed (call under the lock)."""
+        self._live.pop(start, None)
+
+    def reset(self, allocator):
+        """Switch to another allocator and re-index `extents` after they were replaced (call under the lock)."""
+        self.allocator = allocator
+        self._live = {start: (length, process_id)
+                      for process_id, extents in self.extents.items()
+                      for start, length in extents}
+        self._cursor = 0
+
+    def _slide(self, process_id, source, target, length):
+        """Move the extent at `source` down to the free blocks starting at `target`; report whether it moved."""
+        allocator = self.allocator
+        if allocator.arena_of(target) is not allocator.arena_of(target + length - 1):
+            return False
+        gap = source - target
+        try:
+            # Only the part of the target that is not the extent itself has to be free
+            allocator.reserve(target, min(length, gap))
+        except ValueError:
+            # Taken by an allocation since the hole was looked up
+            return False
+        self.move(process_id, source, target, length)
+        allocator.free(max(source, target + length), min(length, gap), cache=False)
+        del self._live[source]
+        self._live[target] = (length, process_id)
+        extents = self.extents[process_id]
+        extents[extents.index((source, length))] = (target, length)
+        self.notify(process_id, source, target, length)
+        return True
+
+    def step(self, budget=None):
+        """Run one bounded compaction slice; return the number of blocks moved."""
+        budget = self.budget if budget is None else budget
+        moved = 0
+        with self.lock:
+            for _ in range(max(1, budget)):
+                hole = self.allocator.next_free(self._cursor)
+                if hole is None:
+                    # The pass reached the top of memory
+                    self._cursor = 0
+                    self.passes += 1
+                    break
+                target, gap = hole
+                source = target + gap
+                live = self._live.get(source)
+                if live is not None:
+                    length, process_id = live
+                    if moved and moved + length > budget:
+                        break
+                    if self._slide(process_id, source, target, length):
+                        moved += length
+                        self.moved_extents += 1
+                        # The hole is now right above the moved extent
+                        self._cursor = target + length
+                        continue
+                # End of an arena, a cached extent or a blocked move: go on above it
+                self._cursor = source
+        self.steps += 1
+        self.moved_blocks += moved
+        return moved
+
+    def compact(self, wanted=None, budget=None, deadline=None):
+        """Run slices until a free extent of `wanted` blocks exists, a pass moves nothing or `deadline` (seconds) passes.
+
+        Return True when the goal was reached (with no `wanted`, when the
+        memory could not be compacted any further).
+        """
+        if wanted is not None and wanted > min(self.allocator.free_total, self.allocator.max_extent):
+            return False
+        stop_at = None if deadline is None else time.perf_counter() + deadline
+        with self.lock:
+            # Start a fresh pass, so that one pass that moves nothing means nothing can move
+            self._cursor = 0
+        passes = self.passes
+        moved = 0
+        while True:
+            if wanted is not None and self.allocator.largest_free >= wanted:
+                return True
+            moved += self.step(budget)
+            if self.passes != passes:
+                if not moved:
+                    return wanted is None
+                passes = self.passes
+                moved = 0
+            if stop_at is not None and time.perf_counter() >= stop_at:
+                return wanted is not None and self.allocator.largest_free >= wanted
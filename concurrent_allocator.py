@@ -0,0 +1,253 @@
+import threading
+import time
+from bisect import bisect_right
+from extent_allocator import BUDDY, ExtentAllocator, FIRST_FIT
+
+
+class Arena:
+    """One slice of the block range with its own allocator and lock."""
+
+    def __init__(self, base, size, policy):
+        self.base = base
+        self.size = size
+        self.allocator = ExtentAllocator(size, policy)
+        self.lock = threading.Lock()
+
+
+class ThreadCache:
+    """Per-thread free lists of small extents, keyed by length."""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # only contended while caches are being drained
+        self.free_lists = {}
+        self.blocks = 0
+
+
+class ConcurrentAllocator:
+    """Thread-safe extent allocator with arenas and thread-local caches.
+
+    The block range is split into `arenas` equal arenas, each guarded by
+    its own lock; a thread starts at its home arena and moves on only when
+    that arena is full. Small requests (up to `small_size` blocks) are
+    served from a per-thread cache that is refilled `batch` extents at a
+    time and holds at most `cache_limit` blocks, so most small
+    allocate/free pairs never touch an arena lock. An allocation can not
+    span arenas; with `arenas=1` the whole range is one arena.
+    """
+
+    def __init__(self, total, arenas=1, policy=FIRST_FIT, small_size=8, batch=16, cache_limit=256):
+        self.total = total
+        self.small_size = small_size
+        self.batch = batch
+        self.cache_limit = cache_limit
+        self.policy = policy
+        arenas = max(1, min(arenas, total or 1))
+        size, extra = divmod(total, arenas)
+        self.arenas = []
+        base = 0
+        for index in range(arenas):
+            arena_size = size + (1 if index < extra else 0)
+            self.arenas.append(Arena(base, arena_size, policy))
+            base += arena_size
+        self._bases = [arena.base for arena in self.arenas]
+        self._local = threading.local()
+        self._caches = []
+        self._caches_lock = threading.Lock()
+
+    def footprint(self, length):
+        """Blocks an extent of `length` really takes: the buddy policy rounds up to a power of two."""
+        return 1 << (length - 1).bit_length() if self.policy == BUDDY else length
+
+    @property
+    def free_total(self):
+        """Free blocks, counting extents parked in thread caches as free."""
+        return sum(arena.allocator.free_total for arena in self.arenas) + sum(cache.blocks for cache in self._caches)
+
+    @property
+    def cached_total(self):
+        """Free blocks parked in thread caches (free, but not in any arena's free extents)."""
+        return sum(cache.blocks for cache in self._caches)
+
+    def arena_of(self, start):
+        return self.arenas[bisect_right(self._bases, start) - 1]
+
+    def _cache(self):
+        cache = getattr(self._local, 'cache', None)
+        if cache is None:
+            cache = self._local.cache = ThreadCache()
+            with self._caches_lock:
+                self._caches.append(cache)
+        return cache
+
+    def _home(self):
+        return threading.get_ident() % len(self.arenas)
+
+    def _allocate_from_arenas(self, length, count=1):
+        """Take up to `count` extents from the first arena that has room."""
+        home = self._home()
+        arenas = self.arenas
+        for offset in range(len(arenas)):
+            arena = arenas[(home + offset) % len(arenas)]
+            if arena.size < length:
+                continue
+            starts = []
+            with arena.lock:
+                try:
+                    for _ in range(count):
+                        starts.append(arena.base + arena.allocator.allocate(length))
+                except MemoryError:
+                    pass
+            if starts:
+                return starts
+        return []
+
+    def allocate(self, length):
+        """Return the start of a contiguous range of `length` blocks."""
+        if length <= 0:
+            raise ValueError("Allocation length must be positive")
+        if length <= self.small_size:
+            cache = self._cache()
+            with cache.lock:
+                free_list = cache.free_lists.get(length)
+                if free_list:
+                    cache.blocks -= self.footprint(length)
+                    return free_list.pop()
+            starts = self._allocate_from_arenas(length, self.batch)
+            if starts:
+                # Hand out the lowest address and cache the rest so that pop() keeps going up
+                with cache.lock:
+                    cache.free_lists.setdefault(length, []).extend(reversed(starts[1:]))
+                    cache.blocks += self.footprint(length) * (len(starts) - 1)
+                return starts[0]
+        else:
+            starts = self._allocate_from_arenas(length)
+            if starts:
+                return starts[0]
+
+        # Free blocks may be parked in thread caches - return them and retry once more
+        if self.drain_caches():
+            return self.allocate(length)
+        raise MemoryError("Not enough contiguous memory available")
+
+    def free(self, start, length, cache=True):
+        """Free a range; small ranges go to the thread cache first (unless `cache` is False)."""
+        if cache and length <= self.small_size:
+            cache = self._cache()
+            size = self.footprint(length)
+            if cache.blocks + size <= self.cache_limit:
+                with cache.lock:
+                    cache.free_lists.setdefault(length, []).append(start)
+                    cache.blocks += size
+                return
+        arena = self.arena_of(start)
+        with arena.lock:
+            arena.allocator.free(start - arena.base, length)
+
+    def reserve(self, start, length):
+        """Allocate exactly [start, start + length); the range must lie free inside one arena."""
+        arena = self.arena_of(start)
+        if start + length > arena.base + arena.size:
+            raise ValueError("Extent crosses an arena boundary")
+        with arena.lock:
+            arena.allocator.reserve(start - arena.base, length)
+
+    @property
+    def max_extent(self):
+        """Longest extent that can ever be allocated (the size of the largest arena)."""
+        return max(arena.size for arena in self.arenas)
+
+    @property
+    def largest_free(self):
+        """Largest free extent in the arenas (cached extents are pinned and not counted)."""
+        largest = 0
+        for arena in self.arenas:
+            with arena.lock:
+                largest = max(largest, arena.allocator.largest_free)
+        return largest
+
+    @property
+    def fragmentation(self):
+        """External fragmentation of the arenas: 1 - largest free extent / free blocks in arenas.
+
+        Like `largest_free` and `free_extents` it leaves out the thread
+        caches, so all three describe the same free space.
+        """
+        free = self.free_total - self.cached_total
+        return 1 - self.largest_free / free if free else 0.0
+
+    def free_histogram(self):
+        """Free extents per size class, summed over the arenas."""
+        histogram = {}
+        for arena in self.arenas:
+            with arena.lock:
+                for size, count in arena.allocator.free_histogram().items():
+                    histogram[size] = histogram.get(size, 0) + count
+        return dict(sorted(histogram.items()))
+
+    def drain_caches(self):
+        """Return every thread's cached extents to the arenas; report whether any were cached."""
+        drained = False
+        with self._caches_lock:
+            caches = list(self._caches)
+        for cache in caches:
+            with cache.lock:
+                free_lists = cache.free_lists
+                cache.free_lists = {}
+                cache.blocks = 0
+            for length, starts in free_lists.items():
+                for start in starts:
+                    drained = True
+                    arena = self.arena_of(start)
+                    with arena.lock:
+                        arena.allocator.free(start - arena.base, length)
+        return drained
+
+    def next_free(self, address):
+        """First free extent in the arenas starting at or after `address`, as (start, length), or None."""
+        for arena in self.arenas[max(0, bisect_right(self._bases, address) - 1):]:
+            with arena.lock:
+                extent = arena.allocator.next_free(max(0, address - arena.base))
+            if extent is not None:
+                return arena.base + extent[0], extent[1]
+        return None
+
+    def free_extents(self):
+        """Return free extents in arenas (not thread caches), sorted by address."""
+        extents = []
+        for arena in self.arenas:
+            with arena.lock:
+                extents.extend((arena.base + start, length) for start, length in arena.allocator.free_extents())
+        return extents
+
+
+def stress_benchmark(thread_counts=(1, 2, 4, 8), operations=20000, total=1 << 20, arenas=8):
+    """Measure allocate/free pairs per second for different thread counts."""
+    results = {}
+    for threads in thread_counts:
+        allocator = ConcurrentAllocator(total, arenas=arenas)
+
+        def worker(seed):
+            live = []
+            size = 1 + seed % 8
+            for i in range(operations):
+                live.append((allocator.allocate(size), size))
+                if len(live) > 32:
+                    start, length = live.pop(0)
+                    allocator.free(start, length)
+            for start, length in live:
+                allocator.free(start, length)
+
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        results[threads] = threads * operations / elapsed
+    return results
+
+
+if __name__ == "__main__":
+    for threads, rate in stress_benchmark().items():
+        print(f"{threads} threads: {rate:,.0f} allocations/s")
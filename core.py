@@ -1,23 +1,49 @@
+import os
+import time
+import metrics
+import snapshot
+from events import EventChannel
 from utils.helpers import greet, save_memory_status, read_memory_status
 from file_system import FileSystem
 from memory import MemoryManager
 from process_manager import ProcessManager
 from system_info import SystemInfo
 from files_log import FilesLog
+from ram_device import RamDevice, PAGE_SIZE
+
+ALLOCATE_TIME = metrics.histogram("core.allocate")
+DEALLOCATE_TIME = metrics.histogram("core.deallocate")
+PROCESSES_STARTED = metrics.counter("core.processes_started")
+ERRORS = metrics.counter("core.errors")
+
+DEFAULT_SNAPSHOT_PATH = os.path.join("data", "snapshots", "core.snap")
 
 class Core:
-    def __init__(self, memory_size=1024):
+    def __init__(self, memory_size=1024, ram_image=None, events=None, hard_quota=None, soft_quota=None,
+                 snapshot_path=None):
+        # Wszystkie komunikaty idą przez kanał zdarzeń; EventChannel() bez odbiorców = tryb cichy
+        self.events = events if events is not None else EventChannel.console()
         # Initialize components
-        self.memory_manager = MemoryManager(size=memory_size)
-        self.file_system = FileSystem()
+        ram_device = None
+        if ram_image is not None:
+            ram_device = RamDevice(ram_image, -(-memory_size // PAGE_SIZE))
+        self.memory_manager = MemoryManager(size=memory_size, ram_device=ram_device,
+                                            hard_quota=hard_quota, soft_quota=soft_quota)
+        self.file_system = FileSystem(events=self.events)
         self.process_manager = ProcessManager()
         self.system_info = SystemInfo()
         self.files_log = FilesLog()
         self.is_recovering = False
+        # Tryb odzyskiwania wczytuje ostatnią migawkę; bez ścieżki (ani wykonanej migawki) nie ma czego wczytać
+        self.snapshot_path = snapshot_path
+        self._snapshots = None
+        # Strony zapisane od ostatniej migawki: migawka koduje tylko je
+        manager = self.memory_manager
+        self._snapshot_changes = snapshot.Changes(manager.journal, blocks=manager.blocks.dirty, ram=manager.dirty_ram)
 
     def greet_user(self, name):
         """Wywołuje funkcję powitania z helpera."""
-        print(greet(name))
+        self.events.emit("greeting", text=greet(name))
 
     def save_memory_status(self, file_path):
         """Zapisuje status pamięci do pliku JSON."""
@@ -30,7 +56,7 @@ class Core:
 
     def create_file(self, path, content=""):
         """Tworzy plik z danym contentem w określonym folderze."""
-        self.file_system.create_file(path, content)
+        return self.file_system.create_file(path, content)
 
     def read_file(self, path):
         """Odczytuje zawartość pliku."""
@@ -40,51 +66,76 @@ class Core:
         """Usuwa plik."""
         self.file_system.delete_file(path)
 
+    def display_dedup_stats(self):
+        """Wyświetla statystyki deduplikacji danych plików."""
+        stats = self.file_system.dedup_stats()
+        self.events.emit("fs.dedup_stats", **stats)
+        return stats
+
     def create_directory(self, path):
         """Tworzy katalog (folder)."""
         try:
-            self.file_system.create_directory(path)
+            return self.file_system.create_directory(path)
         except FileExistsError as e:
-            print(f"Error: {e}")
+            self.events.emit("error", error=e)
 
     def delete_directory(self, path):
         """Usuwa katalog (folder) i jego zawartość."""
         try:
-            self.file_system.delete_directory(path)
+            return self.file_system.delete_directory(path)
         except FileNotFoundError as e:
-            print(f"Error: {e}")
+            self.events.emit("error", error=e)
 
     def list_files(self, path):
         """Wyświetla listę plików w katalogu."""
         try:
             files = self.file_system.list_files(path)
-            print("Files in directory:", files)
+            self.events.emit("fs.listing", path=path, files=files)
+            return files
         except FileNotFoundError as e:
-            print(f"Error: {e}")
+            self.events.emit("error", error=e)
 
     def allocate_memory(self, process_id, amount):
         """Przydziela pamięć dla procesu."""
+        started = time.perf_counter() if metrics.enabled else None
         try:
             address = self.memory_manager.allocate(process_id, amount)
-            print(f"Memory allocated at address {address}")
-            self.files_log.allocate_memory_block(address, process_id)
+            if started is not None:
+                ALLOCATE_TIME.record(time.perf_counter() - started)
+            self.events.emit("memory.allocated", address=address, process_id=process_id)
+            accounting = self.memory_manager.accounting
+            if accounting.over_soft_quota(process_id):
+                self.events.emit("memory.soft_quota", process_id=process_id,
+                                 usage=accounting.usage(process_id), quota=accounting.quota(process_id)[1])
+            return address
         except MemoryError as e:
             self.error_crash_system("Memory allocation failed", str(e))
 
     def deallocate_memory(self, process_id):
         """Zwalnia pamięć dla procesu."""
+        started = time.perf_counter() if metrics.enabled else None
         try:
-            address = self.memory_manager.deallocate(process_id)
-            print(f"Memory deallocated for process {process_id}")
-            self.files_log.deallocate_memory_block(address)
+            self.memory_manager.deallocate(process_id)
+            if started is not None:
+                DEALLOCATE_TIME.record(time.perf_counter() - started)
+            self.events.emit("memory.deallocated", process_id=process_id)
         except ValueError as e:
             self.error_crash_system("Memory deallocation failed", str(e))
 
+    def set_memory_quota(self, process_id, hard=None, soft=None):
+        """Ustawia twardy i miękki limit pamięci procesu (w blokach); None = limit domyślny."""
+        self.memory_manager.accounting.set_quota(process_id, hard, soft)
+
+    def get_memory_usage(self, process_id):
+        """Zwraca bieżące i szczytowe zużycie pamięci procesu, liczniki przydziałów i limity."""
+        return self.memory_manager.accounting.get(process_id)
+
     def write_memory(self, address, data):
         """Zapisuje dane do pamięci."""
         try:
             self.memory_manager.write_memory(address, data)
-            print("Data written to memory")
+            self.events.emit("memory.written", address=address)
+            return True
         except ValueError as e:
             self.error_crash_system("Memory write failed", str(e))
 
@@ -92,20 +143,23 @@ class Core:
         """Odczytuje dane z pamięci."""
         try:
             data = self.memory_manager.read_memory(address, length)
-            print(f"Data read from memory: {data}")
+            self.events.emit("memory.read", address=address, data=data)
+            return data
         except ValueError as e:
             self.error_crash_system("Memory read failed", str(e))
 
     def display_memory_status(self):
         """Wyświetla status pamięci."""
         status = self.memory_manager.get_memory_status()
-        print("Memory Status:")
-        print(f"Free blocks: {status['free_blocks']}")
-        print(f"Occupied blocks: {status['occupied_blocks']}")
+        self.events.emit("memory.status", **status)
+        return status
 
-    def start_process(self, process_id, process_function, *args):
-        """Uruchamia proces."""
-        self.process_manager.start_process(process_id, process_function, *args)
+    def start_process(self, process_id, process_function, *args, priority=0, cpu_bound=False):
+        """Uruchamia proces i zwraca Future z jego wynikiem."""
+        if metrics.enabled:
+            PROCESSES_STARTED.inc()
+        return self.process_manager.start_process(process_id, process_function, *args,
+                                                  priority=priority, cpu_bound=cpu_bound)
 
     def stop_process(self, process_id):
         """Zatrzymuje proces."""
@@ -113,23 +167,24 @@ class Core:
 
     def get_system_info(self):
         """Zwraca informacje o systemie."""
-        return self.system_info.get_info()
+        info = self.system_info.get_info()
+        info["memory_accounting"] = self.memory_manager.accounting.stats()
+        return info
 
     def compt(self):
         """Pokazuje dane o komputerze."""
         try:
             info = self.get_system_info()
-            print("System Information:")
-            for key, value in info.items():
-                print(f"{key}: {value}")
+            self.events.emit("system.info", info=info)
+            return info
         except Exception as e:
-            print(f"Error retrieving system information: {e}")
+            self.events.emit("system.info_error", error=e)
 
     def error_crash_system(self, error_message, error_code):
         """Wyświetla komunikat o błędzie systemowym i włącza tryb odzyskiwania."""
-        print("\nError Crash Of System")
-        print(f"Error Code: {error_code}")
-        print(f"Message: {error_message}\n")
+        if metrics.enabled:
+            ERRORS.inc()
+        self.events.emit("system.crash", code=error_code, message=error_message)
         self.is_recovering = True
         self.enter_recovery_mode()
 
@@ -137,19 +192,53 @@ class Core:
         """Wchodzi w tryb odzyskiwania systemu."""
         if not self.is_recovering:
             return
-        print("Entering Recovery Mode...")
-        self.files_log.create_initial_blocks()  # Re-create missing files
-        print("Recovery Mode: System is attempting to restore stability.")
+        self.events.emit("system.recovery")
+        if self.snapshot_path is not None:
+            try:
+                self.restore_snapshot()
+            except ValueError as e:
+                # Uszkodzona albo niepasująca migawka nie może przerwać odzyskiwania
+                self.events.emit("system.restore_failed", error=e)
+        else:
+            self.events.emit("system.no_snapshot")
+        self.events.emit("system.recovery_attempt")
         self.is_recovering = False  # Exit recovery mode after attempting restore
 
+    def _snapshot_file(self, path=None):
+        if path is not None:
+            self.snapshot_path = path
+        elif self.snapshot_path is None:
+            self.snapshot_path = DEFAULT_SNAPSHOT_PATH
+        if self._snapshots is None or self._snapshots.path != self.snapshot_path:
+            self._snapshots = snapshot.SnapshotFile(self.snapshot_path)
+            # W nowym pliku nie ma jeszcze nic ze stanu
+            self._snapshot_changes.reset()
+        return self._snapshots
+
+    def take_snapshot(self, path=None):
+        """Zapisuje migawkę pamięci, systemu plików i dziennika; zapisywane są tylko zmiany od poprzedniej."""
+        stats = snapshot.save(self._snapshot_file(path), snapshot.capture_core, self, self._snapshot_changes)
+        self.events.emit("system.snapshot", path=self.snapshot_path, **stats)
+        return stats
+
+    def restore_snapshot(self, path=None):
+        """Wczytuje ostatnią migawkę; zwraca jej numer albo None, gdy migawki nie ma."""
+        restored = snapshot.restore(self._snapshot_file(path), snapshot.restore_core, self, self._snapshot_changes)
+        if restored is None:
+            self.events.emit("system.no_snapshot")
+            return None
+        generation, elapsed = restored
+        self.events.emit("system.restored", generation=generation, milliseconds=elapsed * 1000)
+        return generation
+
     def self_tsc(self):
         """Automatycznie wykonuje TSC."""
-        print("Performing TSC...")
+        self.events.emit("system.self_tsc")
         self.error_crash_system("Tragic system crash", "0xTSC")
 
     def self_recoverysys(self):
         """Automatycznie wykonuje tryb odzyskiwania systemu."""
-        print("Performing system recovery...")
+        self.events.emit("system.self_recovery")
         self.enter_recovery_mode()
 
 # Testowanie funkcji core.py
@@ -173,6 +262,10 @@ if __name__ == "__main__":
     core.delete_file("example_dir/example_file.txt")
     core.delete_directory("example_dir")
 
+    # Migawka stanu, z której korzysta tryb odzyskiwania
+    core.create_file("notes.txt", "Snapshot me")
+    core.take_snapshot()
+
     # Symulacja awarii systemu
     core.self_tsc()
 
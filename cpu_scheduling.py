@@ -0,0 +1,227 @@
+"""Discrete-event CPU scheduling simulation for process.Process objects.
+
+The simulation runs on simulated time units: a policy picks the next ready
+process and the length of its time slice, the clock jumps forward by that
+slice, and arrivals that happened meanwhile are admitted. Policies:
+FIFO, RoundRobin, MLFQ and CFS (virtual runtime ordered in a heap).
+"""
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+class FIFO:
+    """First come, first served; every process runs to completion."""
+    name = "fifo"
+
+    def __init__(self):
+        self._ready = deque()
+
+    def __len__(self):
+        return len(self._ready)
+
+    def add(self, process, clock):
+        self._ready.append(process)
+
+    def next(self, clock):
+        return self._ready.popleft(), None
+
+    def preempted(self, process, ran, clock):
+        self._ready.append(process)
+
+
+class RoundRobin(FIFO):
+    """Round-robin with a fixed quantum."""
+    name = "round_robin"
+
+    def __init__(self, quantum=4):
+        super().__init__()
+        self.quantum = quantum
+
+    def next(self, clock):
+        return self._ready.popleft(), self.quantum
+
+
+class MLFQ:
+    """Multi-level feedback queue.
+
+    New processes enter the top level. A process that uses its whole
+    quantum drops one level; every `boost_interval` time units all
+    processes go back to the top level.
+    """
+    name = "mlfq"
+
+    def __init__(self, quanta=(2, 4, 8), boost_interval=200):
+        self.quanta = quanta
+        self.boost_interval = boost_interval
+        self._levels = [deque() for _ in quanta]
+        self._level_of = {}
+        self._count = 0
+        self._last_boost = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, process, clock):
+        self._level_of[process.pid] = 0
+        self._levels[0].append(process)
+        self._count += 1
+
+    def _boost(self, clock):
+        top = self._levels[0]
+        for level in self._levels[1:]:
+            for process in level:
+                self._level_of[process.pid] = 0
+            top.extend(level)
+            level.clear()
+        self._last_boost = clock
+
+    def next(self, clock):
+        if clock - self._last_boost >= self.boost_interval:
+            self._boost(clock)
+        for index, level in enumerate(self._levels):
+            if level:
+                self._count -= 1
+                return level.popleft(), self.quanta[index]
+
+    def preempted(self, process, ran, clock):
+        index = self._level_of[process.pid]
+        if ran >= self.quanta[index] and index + 1 < len(self._levels):
+            index += 1
+            self._level_of[process.pid] = index
+        self._levels[index].append(process)
+        self._count += 1
+
+
+class CFS:
+    """Completely-fair-scheduler style policy.
+
+    Ready processes sit in a heap ordered by virtual runtime, which grows
+    more slowly for processes with a higher weight (lower nice value). The
+    slice is the target latency split between ready processes, but never
+    shorter than `min_granularity`.
+    """
+    name = "cfs"
+
+    def __init__(self, target_latency=20, min_granularity=1):
+        self.target_latency = target_latency
+        self.min_granularity = min_granularity
+        self._heap = []
+        self._sequence = itertools.count()
+        self._vruntime = {}
+        self._min_vruntime = 0.0
+
+    def __len__(self):
+        return len(self._heap)
+
+    @staticmethod
+    def weight(process):
+        return 1024 / (1.25 ** process.priority)
+
+    def _push(self, process):
+        heapq.heappush(self._heap, (self._vruntime[process.pid], next(self._sequence), process))
+
+    def add(self, process, clock):
+        self._vruntime[process.pid] = max(self._vruntime.get(process.pid, 0.0), self._min_vruntime)
+        self._push(process)
+
+    def next(self, clock):
+        vruntime, _, process = heapq.heappop(self._heap)
+        self._min_vruntime = vruntime
+        share = self.target_latency / (len(self._heap) + 1)
+        return process, max(self.min_granularity, share)
+
+    def preempted(self, process, ran, clock):
+        self._vruntime[process.pid] += ran * 1024 / self.weight(process)
+        self._push(process)
+
+
+POLICIES = {policy.name: policy for policy in (FIFO, RoundRobin, MLFQ, CFS)}
+
+
+class SimulationResult:
+    def __init__(self, processes, policy, slices, clock, wall_time):
+        self.policy = policy.name
+        self.slices = slices
+        self.simulated_time = clock
+        self.wall_time = wall_time
+        self.processes = processes
+
+    def per_process(self):
+        """Return {pid: {'wait', 'turnaround', 'response'}}."""
+        return {
+            process.pid: {
+                'wait': process.finish_time - process.arrival_time - process.burst_time,
+                'turnaround': process.finish_time - process.arrival_time,
+                'response': process.start_time - process.arrival_time
+            }
+            for process in self.processes
+        }
+
+    def summary(self):
+        count = len(self.processes) or 1
+        turnaround = sum(p.finish_time - p.arrival_time for p in self.processes)
+        burst = sum(p.burst_time for p in self.processes)
+        response = sum(p.start_time - p.arrival_time for p in self.processes)
+        return {
+            'policy': self.policy,
+            'processes': len(self.processes),
+            'slices': self.slices,
+            'simulated_time': self.simulated_time,
+            'avg_wait': (turnaround - burst) / count,
+            'avg_turnaround': turnaround / count,
+            'avg_response': response / count,
+            'slices_per_second': self.slices / self.wall_time if self.wall_time else 0.0
+        }
+
+
+def simulate(processes, policy):
+    """Run all processes to completion under `policy` and return a SimulationResult."""
+    pending = sorted(processes, key=lambda process: process.arrival_time)
+    for process in pending:
+        process.remaining = process.burst_time
+        process.start_time = None
+        process.finish_time = None
+        process.state = "new"
+
+    started = time.perf_counter()
+    clock = 0
+    slices = 0
+    arrived = 0
+    total = len(pending)
+
+    while arrived < total or len(policy):
+        while arrived < total and pending[arrived].arrival_time <= clock:
+            process = pending[arrived]
+            process.state = "ready"
+            policy.add(process, clock)
+            arrived += 1
+        if not len(policy):
+            clock = pending[arrived].arrival_time
+            continue
+
+        process, time_slice = policy.next(clock)
+        process.state = "running"
+        if process.start_time is None:
+            process.start_time = clock
+        ran = process.remaining if time_slice is None else min(time_slice, process.remaining)
+        clock += ran
+        process.remaining -= ran
+        slices += 1
+
+        # Processes that arrived during the slice are queued ahead of the preempted one
+        while arrived < total and pending[arrived].arrival_time <= clock:
+            arriving = pending[arrived]
+            arriving.state = "ready"
+            policy.add(arriving, clock)
+            arrived += 1
+
+        if process.remaining <= 0:
+            process.finish_time = clock
+            process.state = "terminated"
+        else:
+            process.state = "ready"
+            policy.preempted(process, ran, clock)
+
+    return SimulationResult(pending, policy, slices, clock, time.perf_counter() - started)
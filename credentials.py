@@ -0,0 +1,223 @@
+"""Password hashing and login verification for Shell users.
+
+Passwords are stored as self-describing strings, e.g.
+``scrypt$16384$8$1$<salt>$<hash>`` or ``pbkdf2_sha256$200000$<salt>$<hash>``,
+so the cost can change without breaking existing accounts. The cost preset
+is picked with the `cost` argument or the HSO_PASSWORD_COST environment
+variable ("fast" is meant for automated tests).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+
+COST_PRESETS = {
+    "fast": {SCRYPT: {"n": 2 ** 10, "r": 8, "p": 1}, PBKDF2: {"iterations": 1000}},
+    "interactive": {SCRYPT: {"n": 2 ** 14, "r": 8, "p": 1}, PBKDF2: {"iterations": 200000}},
+    "strong": {SCRYPT: {"n": 2 ** 16, "r": 8, "p": 1}, PBKDF2: {"iterations": 600000}},
+}
+DEFAULT_COST = "interactive"
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _derive(algorithm, password, salt, params):
+    password = password.encode('utf-8')
+    if algorithm == SCRYPT:
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=HASH_SIZE)
+    if algorithm == PBKDF2:
+        return hashlib.pbkdf2_hmac('sha256', password, salt, params["iterations"], HASH_SIZE)
+    raise ValueError(f"Unknown password algorithm: {algorithm}")
+
+
+def _cost_params(algorithm, cost):
+    try:
+        return COST_PRESETS[cost][algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown cost preset {cost!r} for {algorithm}") from None
+
+
+def hash_password(password, algorithm=SCRYPT, cost=None):
+    """Hash a password and return the encoded string."""
+    params = _cost_params(algorithm, cost or os.environ.get("HSO_PASSWORD_COST", DEFAULT_COST))
+    salt = os.urandom(SALT_SIZE)
+    digest = _derive(algorithm, password, salt, params)
+    if algorithm == SCRYPT:
+        fields = [params["n"], params["r"], params["p"]]
+    else:
+        fields = [params["iterations"]]
+    return "$".join([algorithm, *map(str, fields), _b64(salt), _b64(digest)])
+
+
+def _decode(encoded):
+    parts = encoded.split("$")
+    algorithm = parts[0]
+    if algorithm == SCRYPT and len(parts) == 6:
+        params = {"n": int(parts[1]), "r": int(parts[2]), "p": int(parts[3])}
+    elif algorithm == PBKDF2 and len(parts) == 4:
+        params = {"iterations": int(parts[1])}
+    else:
+        raise ValueError("Not an encoded password hash")
+    return algorithm, params, base64.b64decode(parts[-2]), base64.b64decode(parts[-1])
+
+
+def is_hashed(value):
+    """Tell an encoded hash apart from a legacy plaintext password."""
+    try:
+        _decode(value)
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return True
+
+
+def verify_password(password, encoded):
+    algorithm, params, salt, digest = _decode(encoded)
+    return hmac.compare_digest(_derive(algorithm, password, salt, params), digest)
+
+
+def needs_rehash(encoded, algorithm=SCRYPT, cost=None):
+    """Whether a stored hash uses a different algorithm or cost than requested."""
+    stored_algorithm, params, _, _ = _decode(encoded)
+    wanted = _cost_params(algorithm, cost or os.environ.get("HSO_PASSWORD_COST", DEFAULT_COST))
+    return stored_algorithm != algorithm or params != wanted
+
+
+class SessionCache:
+    """Bounded cache of recently verified logins that expire after `ttl` seconds.
+
+    Entries hold an HMAC of the password (under a key that lives only in
+    this process) together with the stored hash it was checked against,
+    so neither plaintext passwords nor reusable hashes are kept, and a
+    password change invalidates the entry.
+    """
+
+    def __init__(self, capacity=1024, ttl=300.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tag(self, username, password, encoded):
+        message = "\0".join((username, password, encoded)).encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def check(self, username, password, encoded):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return False
+            tag, expires = entry
+            if expires < time.monotonic():
+                del self._entries[username]
+                return False
+        return hmac.compare_digest(tag, self._tag(username, password, encoded))
+
+    def add(self, username, password, encoded):
+        tag = self._tag(username, password, encoded)
+        with self._lock:
+            self._entries[username] = (tag, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def forget(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+class Credentials:
+    """Registers users and verifies logins against FilesLog.
+
+    Legacy plaintext passwords are accepted once and replaced by a hash;
+    hashes made with another algorithm or cost are upgraded on the next
+    successful login.
+    """
+
+    def __init__(self, files_log, algorithm=SCRYPT, cost=None, cache_size=1024, cache_ttl=300.0):
+        self.files_log = files_log
+        self.algorithm = algorithm
+        self.cost = cost or os.environ.get("HSO_PASSWORD_COST", DEFAULT_COST)
+        _cost_params(algorithm, self.cost)
+        self.sessions = SessionCache(cache_size, cache_ttl)
+
+    def register(self, username, password):
+        self.files_log.save_user(username, hash_password(password, self.algorithm, self.cost))
+        self.sessions.forget(username)
+
+    def verify(self, username, password):
+        """Return True if the password matches the stored one for `username`."""
+        user_data = self.files_log.get_user(username)
+        if user_data is None:
+            return False
+        stored = user_data['password']
+        if self.sessions.check(username, password, stored):
+            return True
+
+        if is_hashed(stored):
+            if not verify_password(password, stored):
+                return False
+            upgrade = needs_rehash(stored, self.algorithm, self.cost)
+        else:
+            if not hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8')):
+                return False
+            upgrade = True
+
+        if upgrade:
+            stored = hash_password(password, self.algorithm, self.cost)
+            self.files_log.save_user(username, stored)
+        self.sessions.add(username, password, stored)
+        return True
+
+
+class _MemoryUsers:
+    """Minimal FilesLog stand-in so the benchmark does not touch data/."""
+
+    def __init__(self):
+        self.users = {}
+
+    def save_user(self, username, password):
+        self.users[username] = {'username': username, 'password': password}
+
+    def get_user(self, username):
+        return self.users.get(username)
+
+
+def benchmark(logins=1000, users=20, algorithms=(SCRYPT, PBKDF2), costs=tuple(COST_PRESETS)):
+    """Measure logins per second for each algorithm and cost, with and without the session cache."""
+    results = {}
+    for algorithm in algorithms:
+        for cost in costs:
+            store = _MemoryUsers()
+            credentials = Credentials(store, algorithm, cost)
+            for index in range(users):
+                credentials.register(f"user{index}", f"password{index}")
+
+            # The first login of every user has to hash; later ones hit the cache
+            started = time.perf_counter()
+            for index in range(users):
+                credentials.verify(f"user{index}", f"password{index}")
+            uncached = users / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for index in range(logins):
+                credentials.verify(f"user{index % users}", f"password{index % users}")
+            cached = logins / (time.perf_counter() - started)
+            results[(algorithm, cost)] = (uncached, cached)
+    return results
+
+
+if __name__ == "__main__":
+    for (algorithm, cost), (uncached, cached) in benchmark().items():
+        print(f"{algorithm:14} {cost:12} {uncached:12,.1f} logins/s   cached: {cached:12,.1f} logins/s")
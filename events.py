@@ -0,0 +1,84 @@
+"""Structured output of Kernel, Core and FileSystem operations.
+
+Operations report what happened by emitting an event name with raw fields
+on an EventChannel instead of printing. Handlers subscribed to the channel
+decide how (and whether) to present it; `print_event` renders the same
+messages the console used to show. A channel without handlers is silent:
+emitting costs a function call and no message is ever formatted.
+"""
+
+MESSAGES = {
+    "memory.allocated": "Memory allocated at address {address} for process {process_id}",
+    "memory.deallocated": "Memory deallocated for process {process_id}",
+    "memory.written": "Data written to memory",
+    "memory.read": "Data read from memory: {data}",
+    "memory.soft_quota": "Process {process_id} is over its soft memory quota: {usage} of {quota} blocks",
+    "memory.status": "Memory Status:\nFree blocks: {free_blocks}\nOccupied blocks: {occupied_blocks}",
+    "kernel.updated": "Kernel version updated to {version}",
+    "kernel.tsc": "\nTSC (Tragic System Crash)\nError Message: {message}\nError Code: TSC-{count}",
+    "system.rebooting": "System rebooting...",
+    "system.recovery": "Entering Recovery Mode...",
+    "system.recovery_attempt": "Recovery Mode: System is attempting to restore stability.",
+    "system.scan": "Restoring the last snapshot...",
+    "system.snapshot": "Snapshot {generation} saved to {path}: {written} entries written, {deleted} removed ({bytes} bytes)",
+    "system.restored": "State restored from snapshot {generation} in {milliseconds:.2f} ms",
+    "system.no_snapshot": "No snapshot to restore from.",
+    "system.restore_failed": "Could not restore the snapshot: {error}",
+    "system.crash": "\nError Crash Of System\nError Code: {code}\nMessage: {message}\n",
+    "system.self_tsc": "Performing TSC...",
+    "system.self_recovery": "Performing system recovery...",
+    "system.info": "System Information:\n{lines}",
+    "system.info_error": "Error retrieving system information: {error}",
+    "greeting": "{text}",
+    "error": "Error: {error}",
+    "fs.file_created": "File created: {path}",
+    "fs.file_deleted": "File deleted: {path}",
+    "fs.directory_created": "Directory created: {path}",
+    "fs.directory_deleted": "Directory deleted: {path}",
+    "fs.renamed": "Renamed: {path} -> {new_path}",
+    "fs.listing": "Files in directory: {files}",
+    "fs.dedup_stats": ("File Data Deduplication:\nLogical bytes: {logical_bytes}\nStored bytes: {stored_bytes}\n"
+                       "Dedup ratio: {dedup_ratio:.2f}\nBytes saved: {bytes_saved}"),
+}
+
+
+def render(name, fields):
+    """Format an event as the console message for it."""
+    template = MESSAGES.get(name)
+    if template is None:
+        return f"{name}: {fields}"
+    if name == "system.info":
+        fields = {"lines": "\n".join(f"{key}: {value}" for key, value in fields["info"].items())}
+    elif any(isinstance(value, memoryview) for value in fields.values()):
+        fields = {key: value.tobytes() if isinstance(value, memoryview) else value
+                  for key, value in fields.items()}
+    return template.format(**fields)
+
+
+def print_event(name, fields):
+    print(render(name, fields))
+
+
+class EventChannel:
+    """Delivers events to the subscribed handlers, each called as handler(name, fields)."""
+
+    def __init__(self, *handlers):
+        self.handlers = list(handlers)
+
+    @classmethod
+    def console(cls):
+        return cls(print_event)
+
+    @property
+    def silent(self):
+        return not self.handlers
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def unsubscribe(self, handler):
+        self.handlers.remove(handler)
+
+    def emit(self, name, **fields):
+        for handler in self.handlers:
+            handler(name, fields)
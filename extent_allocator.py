@@ -0,0 +1,259 @@
+from bisect import bisect_left, bisect_right, insort
+
+FIRST_FIT = "first_fit"
+BEST_FIT = "best_fit"
+BUDDY = "buddy"
+POLICIES = (FIRST_FIT, BEST_FIT, BUDDY)
+
+
+class ExtentAllocator:
+    """Free-space index over a range of `total` blocks.
+
+    Free space is kept as coalesced extents (start, length) instead of a flat
+    list of blocks, so allocate/free cost depends on the number of extents,
+    not on the number of blocks. An address-ordered list of free starts
+    answers "which extent holds this block" and "next free extent" with a
+    bisect.
+
+    Policies:
+      * first_fit - the lowest-address extent that fits, found by descending
+        a max-tree over extent starts (each node holds the longest free
+        extent below it),
+      * best_fit  - smallest extent that fits, from a size-ordered index,
+      * buddy     - binary buddy system, requests are rounded up to a power
+        of two and freed blocks merge with their buddies.
+    """
+
+    def __init__(self, total, policy=FIRST_FIT):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown allocation policy: {policy}")
+        if total < 0:
+            raise ValueError("Allocator size must not be negative")
+        self.total = total
+        self.policy = policy
+        self.free_total = 0
+        # size class (power of two) -> number of free extents, kept up to date on insert/remove
+        self._class_counts = []
+
+        if policy == BUDDY:
+            # order -> set of free block starts, start -> order of live blocks
+            self._orders = {}
+            self._live = {}
+            start = 0
+            for order in range(total.bit_length() - 1, -1, -1):
+                if total & (1 << order):
+                    self._orders.setdefault(order, set()).add(start)
+                    start += 1 << order
+            self.free_total = total
+            return
+
+        self._free = {}         # start -> length
+        self._end_to_start = {}  # end -> start, used to coalesce with the left neighbour
+        self._starts = []        # sorted starts of free extents
+        if policy == BEST_FIT:
+            self._by_size = []  # sorted (length, start)
+        else:
+            # Max-tree over block positions: leaf `size + start` holds the length of the
+            # free extent starting there (0 if none), every inner node the max of its children
+            self._size = 1
+            while self._size < total:
+                self._size <<= 1
+            self._tree = [0] * (2 * self._size)
+        if total:
+            self._insert(0, total)
+
+    # Extent index (first_fit / best_fit)
+
+    def _insert(self, start, length):
+        self._free[start] = length
+        self._end_to_start[start + length] = start
+        insort(self._starts, start)
+        self.free_total += length
+        size_class = length.bit_length() - 1
+        while len(self._class_counts) <= size_class:
+            self._class_counts.append(0)
+        self._class_counts[size_class] += 1
+        if self.policy == BEST_FIT:
+            insort(self._by_size, (length, start))
+        else:
+            self._set_leaf(start, length)
+
+    def _remove(self, start):
+        length = self._free.pop(start)
+        del self._end_to_start[start + length]
+        starts = self._starts
+        del starts[bisect_left(starts, start)]
+        self.free_total -= length
+        self._class_counts[length.bit_length() - 1] -= 1
+        if self.policy == BEST_FIT:
+            index = bisect_left(self._by_size, (length, start))
+            del self._by_size[index]
+        else:
+            self._set_leaf(start, 0)
+        return length
+
+    def _set_leaf(self, start, length):
+        tree = self._tree
+        index = start + self._size
+        tree[index] = length
+        index >>= 1
+        while index:
+            left = tree[2 * index]
+            right = tree[2 * index + 1]
+            longest = left if left > right else right
+            if tree[index] == longest:
+                # Nothing above changes either
+                break
+            tree[index] = longest
+            index >>= 1
+
+    def _find_first_fit(self, length):
+        tree = self._tree
+        if tree[1] < length:
+            return None
+        # Go down to the leftmost leaf that fits: left child if it fits, else the right one
+        index = 1
+        size = self._size
+        while index < size:
+            index <<= 1
+            if tree[index] < length:
+                index += 1
+        return index - size
+
+    def _find_best_fit(self, length):
+        index = bisect_left(self._by_size, (length, -1))
+        if index == len(self._by_size):
+            return None
+        return self._by_size[index][1]
+
+    # Buddy system
+
+    def _allocate_buddy(self, length):
+        wanted = (length - 1).bit_length()
+        order = wanted
+        max_order = max(self._orders, default=-1)
+        while order <= max_order and not self._orders.get(order):
+            order += 1
+        if order > max_order:
+            return None
+        start = self._orders[order].pop()
+        while order > wanted:
+            order -= 1
+            self._orders.setdefault(order, set()).add(start + (1 << order))
+        self._live[start] = wanted
+        self.free_total -= 1 << wanted
+        return start
+
+    def _free_buddy(self, start):
+        order = self._live.pop(start, None)
+        if order is None:
+            raise ValueError(f"Block {start} is not allocated")
+        self.free_total += 1 << order
+        while True:
+            buddy = start ^ (1 << order)
+            free_set = self._orders.get(order)
+            if not free_set or buddy not in free_set:
+                break
+            free_set.remove(buddy)
+            start = min(start, buddy)
+            order += 1
+        self._orders.setdefault(order, set()).add(start)
+
+    # Public API
+
+    def allocate(self, length):
+        """Return the start of a contiguous range of `length` blocks."""
+        if length <= 0:
+            raise ValueError("Allocation length must be positive")
+        if self.policy == BUDDY:
+            start = self._allocate_buddy(length)
+        else:
+            if self.policy == BEST_FIT:
+                start = self._find_best_fit(length)
+            else:
+                start = self._find_first_fit(length)
+            if start is not None:
+                available = self._remove(start)
+                if available > length:
+                    self._insert(start + length, available - length)
+        if start is None:
+            raise MemoryError("Not enough contiguous memory available")
+        return start
+
+    def free(self, start, length):
+        """Free a range and coalesce it with neighbouring free extents."""
+        if self.policy == BUDDY:
+            self._free_buddy(start)
+            return
+        if length <= 0 or start < 0 or start + length > self.total:
+            raise ValueError("Invalid extent")
+        left = self._end_to_start.get(start)
+        if left is not None:
+            length += start - left
+            self._remove(left)
+            start = left
+        right_length = self._free.get(start + length)
+        if right_length is not None:
+            self._remove(start + length)
+            length += right_length
+        self._insert(start, length)
+
+    def reserve(self, start, length):
+        """Allocate exactly the blocks [start, start + length), which must be free.
+
+        Used by the compactor to move data into a chosen hole. Not supported
+        by the buddy policy, whose blocks are tied to power-of-two boundaries.
+        """
+        if self.policy == BUDDY:
+            raise NotImplementedError("The buddy allocator can not reserve arbitrary ranges")
+        if length <= 0 or start < 0 or start + length > self.total:
+            raise ValueError("Invalid extent")
+        index = bisect_right(self._starts, start) - 1
+        extent_start = self._starts[index] if index >= 0 else None
+        if extent_start is None or extent_start + self._free[extent_start] < start + length:
+            raise ValueError(f"Blocks {start}-{start + length - 1} are not free")
+        available = self._remove(extent_start)
+        if start > extent_start:
+            self._insert(extent_start, start - extent_start)
+        end = extent_start + available
+        if end > start + length:
+            self._insert(start + length, end - start - length)
+
+    def next_free(self, address):
+        """First free extent starting at or after `address`, as (start, length), or None."""
+        if self.policy == BUDDY:
+            raise NotImplementedError("The buddy allocator does not index free extents by address")
+        index = bisect_left(self._starts, address)
+        if index == len(self._starts):
+            return None
+        start = self._starts[index]
+        return start, self._free[start]
+
+    # Fragmentation metrics, maintained incrementally
+
+    @property
+    def largest_free(self):
+        """Length of the largest free extent."""
+        if self.policy == BUDDY:
+            return 1 << max((order for order, starts in self._orders.items() if starts), default=-1) if self.free_total else 0
+        if self.policy == BEST_FIT:
+            return self._by_size[-1][0] if self._by_size else 0
+        return self._tree[1]
+
+    @property
+    def fragmentation(self):
+        """External fragmentation: 1 - largest free extent / free space (0 = one free extent)."""
+        return 1 - self.largest_free / self.free_total if self.free_total else 0.0
+
+    def free_histogram(self):
+        """Number of free extents per size class, as {smallest length in class: count}."""
+        if self.policy == BUDDY:
+            return {1 << order: len(starts) for order, starts in sorted(self._orders.items()) if starts}
+        return {1 << size_class: count for size_class, count in enumerate(self._class_counts) if count}
+
+    def free_extents(self):
+        """Return free extents as (start, length) pairs sorted by address."""
+        if self.policy == BUDDY:
+            return sorted((start, 1 << order) for order, starts in self._orders.items() for start in starts)
+        free = self._free
+        return [(start, free[start]) for start in self._starts]
@@ -1,96 +1,509 @@
+import io
+import time
+from collections import OrderedDict
+import metrics
+from events import EventChannel
+from chunk_store import ChunkStore, CHUNK_SIZE
+from fs_image import DiskImage, KIND_DIRECTORY, write_image
+
+CREATE_FILE_TIME = metrics.histogram("fs.create_file")
+READ_FILE_TIME = metrics.histogram("fs.read_file")
+DELETE_FILE_TIME = metrics.histogram("fs.delete_file")
+BYTES_WRITTEN = metrics.counter("fs.bytes_written")
+BYTES_READ = metrics.counter("fs.bytes_read")
+PATH_CACHE_SIZE = 4096
+
+class Node:
+    """Wpis w drzewie katalogów (dentry)."""
+    __slots__ = ('name', 'parent')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+
+class DirectoryNode(Node):
+    """Katalog; wpisy z obrazu dysku są wczytywane przy pierwszym dostępie."""
+    __slots__ = ('_children', 'loader')
+
+    def __init__(self, name, parent, loader=None):
+        super().__init__(name, parent)
+        self._children = {} if loader is None else None
+        self.loader = loader
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = {}
+            self.loader(self)
+            self.loader = None
+        return self._children
+
+class FileNode(Node):
+    """Plik: lista identyfikatorów fragmentów w ChunkStore i rozmiar w bajtach."""
+    __slots__ = ('_chunks', 'loader', 'size', 'binary')
+
+    def __init__(self, name, parent, binary=False, size=0, loader=None):
+        super().__init__(name, parent)
+        self._chunks = [] if loader is None else None
+        self.loader = loader
+        self.size = size
+        self.binary = binary
+
+    @property
+    def chunks(self):
+        if self._chunks is None:
+            self._chunks = self.loader()
+            self.loader = None
+        return self._chunks
+
+    @chunks.setter
+    def chunks(self, value):
+        self._chunks = value
+        self.loader = None
+
+class FileHandle:
+    """Uchwyt do pliku w stylu open(): read(n), write, seek, append."""
+
+    def __init__(self, file_system, node, mode):
+        self.file_system = file_system
+        self.node = node
+        self.mode = mode
+        self.position = 0
+        self.closed = False
+        if mode == 'w':
+            file_system._release(node)
+        elif mode == 'a':
+            self.position = node.size
+
+    def _check(self, writing=False):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if writing and self.mode == 'r':
+            raise io.UnsupportedOperation("not writable")
+        if not writing and self.mode in ('w', 'a'):
+            raise io.UnsupportedOperation("not readable")
+
+    def read(self, n=-1):
+        """Odczytuje do n bajtów od bieżącej pozycji (n < 0: do końca)."""
+        self._check()
+        node = self.node
+        store = self.file_system.chunks
+        chunk_size = store.chunk_size
+        end = node.size if n < 0 else min(node.size, self.position + n)
+        parts = []
+        position = self.position
+        while position < end:
+            index, offset = divmod(position, chunk_size)
+            piece = store.get(node.chunks[index])[offset:offset + end - position]
+            parts.append(piece)
+            position += len(piece)
+        self.position = position
+        return b''.join(parts)
+
+    def write(self, data):
+        """Zapisuje dane od bieżącej pozycji; współdzielone fragmenty są kopiowane (COW)."""
+        self._check(writing=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        node = self.node
+        store = self.file_system.chunks
+        chunk_size = store.chunk_size
+        if self.mode == 'a':
+            self.position = node.size
+
+        position = self.position
+        payload = data
+        if position > node.size:
+            # Dziura za końcem pliku jest wypełniana zerami
+            payload = bytes(position - node.size) + data
+            position = node.size
+
+        written = 0
+        while written < len(payload):
+            index, offset = divmod(position, chunk_size)
+            piece = payload[written:written + chunk_size - offset]
+            if index == len(node.chunks):
+                node.chunks.append(store.put(piece))
+            else:
+                node.chunks[index] = store.modify(node.chunks[index], offset, piece)
+            position += len(piece)
+            written += len(piece)
+
+        node.size = max(node.size, position)
+        self.position = position
+        return len(data)
+
+    def append(self, data):
+        """Dopisuje dane na końcu pliku."""
+        self.seek(0, io.SEEK_END)
+        return self.write(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.node.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
 class FileSystem:
-    def __init__(self):
+    def __init__(self, chunk_size=CHUNK_SIZE, events=None, path_cache_size=PATH_CACHE_SIZE):
+        # Komunikaty o operacjach trafiają do kanału zdarzeń (EventChannel() = cisza)
+        self.events = events if events is not None else EventChannel.console()
         # Korzeń naszego systemu plików
-        self.files = {}
-        self.directories = {'/': {}}
-    
+        self.root = DirectoryNode('', None)
+        # Zawartość plików: fragmenty adresowane treścią (deduplikacja), z licznikiem referencji
+        self.chunks = ChunkStore(chunk_size)
+        # Zamontowany obraz dysku (fs_image) i ścieżka, do której zapisuje sync()
+        self.image = None
+        self.image_path = None
+        self._image_chunks = set()
+        # Pamięć podręczna LRU ścieżka -> (węzeł, epoka); zmiana katalogu podbija epokę,
+        # więc wpisy pod nim stają się nieważne bez przeglądania całej pamięci podręcznej
+        self.path_cache_size = path_cache_size
+        self._path_cache = OrderedDict()
+        self._epoch = 0
+
+    @classmethod
+    def mount(cls, image_path, events=None):
+        """Montuje obraz dysku; katalogi i zawartość plików są wczytywane leniwie."""
+        image = DiskImage(image_path)
+        file_system = cls(image.chunk_size, events)
+        file_system.image = image
+        file_system.image_path = image_path
+        file_system.chunks.chunk_count = image.chunk_count
+        file_system.chunks.stored_bytes = image.stored_bytes
+        file_system.chunks.logical_bytes = image.logical_bytes
+        file_system.root = file_system._image_node('', None, 0)
+        file_system._reset_path_cache()
+        return file_system
+
+    def _image_node(self, name, parent, number):
+        kind, binary, count, first, size = self.image.inode(number)
+        if kind == KIND_DIRECTORY:
+            return DirectoryNode(name, parent, lambda node: self._load_directory(node, first, count))
+        return FileNode(name, parent, bool(binary), size, lambda: self._load_chunks(first, count))
+
+    def _load_directory(self, node, first, count):
+        children = node._children
+        for name, number in self.image.dirents(first, count):
+            children[name] = self._image_node(name, node, number)
+
+    def _load_chunks(self, first, count):
+        image = self.image
+        chunks = []
+        for index in image.chunk_refs(first, count):
+            digest, offset, length, refs = image.chunk(index)
+            if digest not in self._image_chunks:
+                self._image_chunks.add(digest)
+                self.chunks.register_lazy(digest, length, refs, lambda o=offset, n=length: image.read(o, n))
+            chunks.append(digest)
+        return chunks
+
+    def sync(self, image_path=None):
+        """Zapisuje cały system plików do obrazu dysku (atomowo)."""
+        image_path = image_path or self.image_path
+        if image_path is None:
+            raise ValueError("No image path to sync to")
+        if self.image is not None:
+            # Wszystko z obecnego obrazu musi trafić do pamięci, zanim zostanie zastąpiony
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, DirectoryNode):
+                    stack.extend(node.children.values())
+                else:
+                    node.chunks
+            self.chunks.load_all()
+            self.image.close()
+            self.image = None
+        write_image(self, image_path)
+        self.image_path = image_path
+
+    def unmount(self):
+        """Zapisuje zmiany i zamyka obraz dysku."""
+        if self.image_path is not None:
+            self.sync()
+
+    @staticmethod
+    def _normalize(path):
+        """Helper function to turn a path into 'a/b/c' form."""
+        return '/'.join(part for part in path.split('/') if part)
+
     def _get_node(self, path):
         """Helper function to get the node at the given path."""
-        nodes = path.strip('/').split('/')
-        current_node = self.directories
-        
-        for node in nodes:
-            if node not in current_node:
+        path = self._normalize(path)
+        if not path:
+            return self.root
+        cache = self._path_cache
+        entry = cache.get(path)
+        if entry is not None and entry[1] == self._epoch:
+            cache.move_to_end(path)
+            return entry[0]
+
+        node = self.root
+        for name in path.split('/'):
+            if not isinstance(node, DirectoryNode):
+                return None
+            node = node.children.get(name)
+            if node is None:
                 return None
-            current_node = current_node[node]
-        
-        return current_node
-    
-    def _split_path(self, path, is_directory=False):
+        cache[path] = (node, self._epoch)
+        cache.move_to_end(path)
+        if len(cache) > self.path_cache_size:
+            cache.popitem(last=False)
+        return node
+
+    def _split_path(self, path):
         """Helper function to split path into directory and file name."""
-        nodes = path.strip('/').split('/')
-        if is_directory:
-            return '/'.join(nodes[:-1]), nodes[-1]
+        path = self._normalize(path)
+        folder_path, _, name = path.rpartition('/')
+        return folder_path, name
+
+    def _get_directory(self, path):
+        node = self._get_node(path)
+        if not isinstance(node, DirectoryNode):
+            return None
+        return node
+
+    def _path_of(self, node):
+        names = []
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/'.join(reversed(names))
+
+    def _invalidate(self, path, node):
+        """Unieważnia ścieżkę w pamięci podręcznej (dla katalogu także wszystko pod nią) w O(1)."""
+        if isinstance(node, DirectoryNode):
+            self._epoch += 1
         else:
-            return '/'.join(nodes[:-1]), nodes[-1]
+            self._path_cache.pop(path, None)
 
-    def create_file(self, path, content=""):
-        """Tworzy plik z danym contentem w określonym folderze."""
+    def _reset_path_cache(self):
+        self._path_cache.clear()
+        self._epoch += 1
+
+    def _release(self, node):
+        """Zwalnia fragmenty pliku (zmniejsza liczniki referencji)."""
+        for chunk_id in node.chunks:
+            self.chunks.decref(chunk_id)
+        node.chunks = []
+        node.size = 0
+
+    def _new_file(self, path, binary=False):
         folder_path, file_name = self._split_path(path)
-        if folder_path not in self.directories:
+        folder = self._get_directory(folder_path)
+        if folder is None:
             raise FileNotFoundError(f"Directory '{folder_path}' not found.")
-        
+        existing = folder.children.get(file_name)
+        if isinstance(existing, DirectoryNode):
+            raise IsADirectoryError(f"Is a directory: {path}")
+        if existing is not None:
+            self._release(existing)
+
+        node = FileNode(file_name, folder, binary)
+        folder.children[file_name] = node
+        self._path_cache.pop(self._normalize(path), None)
+        return node
+
+    def _get_file(self, path):
+        node = self._get_node(path)
+        if not isinstance(node, FileNode):
+            raise FileNotFoundError(f"No such file: {path}")
+        return node
+
+    def create_file(self, path, content=""):
+        """Tworzy plik z danym contentem w określonym folderze."""
+        started = time.perf_counter() if metrics.enabled else None
+        binary = not isinstance(content, str)
+        node = self._new_file(path, binary)
+
         # Zapisywanie zawartości pliku
+        data = bytes(content) if binary else content.encode('utf-8')
+        node.chunks = self.chunks.put_all(data)
+        node.size = len(data)
+        folder_path, file_name = self._split_path(path)
         full_path = folder_path + '/' + file_name
-        self.files[full_path] = content
-        print(f"File created: {full_path}")
+        if started is not None:
+            CREATE_FILE_TIME.record(time.perf_counter() - started)
+            BYTES_WRITTEN.inc(len(data))
+        self.events.emit("fs.file_created", path=full_path)
+        return full_path
 
     def read_file(self, path):
         """Odczytuje zawartość pliku."""
-        if path not in self.files:
+        started = time.perf_counter() if metrics.enabled else None
+        node = self._get_file(path)
+        data = b''.join(self.iter_chunks(path))
+        if started is not None:
+            READ_FILE_TIME.record(time.perf_counter() - started)
+            BYTES_READ.inc(len(data))
+        return data if node.binary else data.decode('utf-8')
+
+    def iter_chunks(self, path):
+        """Zwraca kolejne fragmenty pliku bez składania całej zawartości w pamięci."""
+        node = self._get_file(path)
+        store = self.chunks
+        for chunk_id in list(node.chunks):
+            yield store.get(chunk_id)
+
+    def open(self, path, mode='r'):
+        """Otwiera plik i zwraca uchwyt (tryby: 'r', 'r+', 'w', 'a')."""
+        if mode not in ('r', 'r+', 'w', 'a'):
+            raise ValueError(f"Invalid mode: {mode}")
+        node = self._get_node(path)
+        if node is None and mode in ('w', 'a'):
+            node = self._new_file(path, binary=True)
+        elif not isinstance(node, FileNode):
             raise FileNotFoundError(f"No such file: {path}")
-        return self.files[path]
+        return FileHandle(self, node, mode)
+
+    def copy_file(self, path, new_path):
+        """Kopiuje plik, współdzieląc fragmenty aż do pierwszej modyfikacji."""
+        source = self._get_file(path)
+        chunks = list(source.chunks)
+        for chunk_id in chunks:
+            self.chunks.incref(chunk_id)
+        node = self._new_file(new_path, source.binary)
+        node.chunks = chunks
+        node.size = source.size
+
+    def dedup_stats(self):
+        """Zwraca statystyki deduplikacji: współczynnik i zaoszczędzone bajty."""
+        return self.chunks.stats()
 
     def delete_file(self, path):
         """Usuwa plik."""
-        if path not in self.files:
-            raise FileNotFoundError(f"No such file: {path}")
-        del self.files[path]
-        print(f"File deleted: {path}")
+        started = time.perf_counter() if metrics.enabled else None
+        node = self._get_file(path)
+        self._release(node)
+        del node.parent.children[node.name]
+        self._invalidate(self._normalize(path), node)
+        if started is not None:
+            DELETE_FILE_TIME.record(time.perf_counter() - started)
+        self.events.emit("fs.file_deleted", path=path)
 
     def create_directory(self, path):
         """Tworzy katalog (folder)."""
-        nodes = path.strip('/').split('/')
-        current_node = self.directories
-        full_path = '/'
-        
-        for node in nodes:
-            if node not in current_node:
-                current_node[node] = {}
-            current_node = current_node[node]
-            full_path = f"{full_path}/{node}".strip('/')
-        
-        if full_path in self.directories:
+        full_path = self._normalize(path)
+        current_node = self.root
+        created = False
+        if not full_path:
+            raise FileExistsError("Directory '/' already exists.")
+
+        for name in full_path.split('/'):
+            child = current_node.children.get(name)
+            if child is None:
+                child = DirectoryNode(name, current_node)
+                current_node.children[name] = child
+                created = True
+            elif not isinstance(child, DirectoryNode):
+                raise NotADirectoryError(f"Not a directory: {self._path_of(child)}")
+            current_node = child
+
+        if not created:
             raise FileExistsError(f"Directory '{full_path}' already exists.")
-        
-        self.directories[full_path] = {}
-        print(f"Directory created: {full_path}")
+        self.events.emit("fs.directory_created", path=full_path)
+        return full_path
 
     def delete_directory(self, path):
         """Usuwa katalog (folder) i jego zawartość."""
-        if path not in self.directories:
+        node = self._get_directory(path)
+        if node is None:
             raise FileNotFoundError(f"No such directory: {path}")
+        if node is self.root:
+            raise PermissionError("Cannot delete the root directory")
 
-        # Usuwanie wszystkich plików w katalogu
-        to_delete = []
-        for file in self.files:
-            if file.startswith(path + '/'):
-                to_delete.append(file)
-        
-        for file in to_delete:
-            self.delete_file(file)
+        # Usuwanie wszystkich plików w katalogu (tylko to poddrzewo)
+        deleted = []
+        stack = [(self._normalize(path), node)]
+        while stack:
+            dir_path, directory = stack.pop()
+            for name, child in directory.children.items():
+                if isinstance(child, DirectoryNode):
+                    stack.append((dir_path + '/' + name, child))
+                else:
+                    self._release(child)
+                    deleted.append(f"{dir_path}/{name}")
+                    self.events.emit("fs.file_deleted", path=deleted[-1])
 
         # Usuwanie katalogu
-        parent_path, dir_name = self._split_path(path, True)
-        parent_node = self._get_node(parent_path)
-        if parent_node and dir_name in parent_node:
-            del parent_node[dir_name]
-            print(f"Directory deleted: {path}")
+        del node.parent.children[node.name]
+        self._invalidate(path, node)
+        self.events.emit("fs.directory_deleted", path=path)
+        return deleted
 
     def list_files(self, path):
         """Wyświetla listę plików w katalogu."""
-        if path not in self.directories:
+        directory = self._get_directory(path)
+        if directory is None:
             raise FileNotFoundError(f"No such directory: {path}")
 
-        files = [file for file in self.files if file.startswith(path + '/')]
-        return files
+        prefix = self._normalize(path)
+        prefix = prefix + '/' if prefix else ''
+        return [prefix + name for name, child in directory.children.items() if isinstance(child, FileNode)]
+
+    def list_directories(self, path):
+        """Zwraca listę podkatalogów w katalogu."""
+        directory = self._get_directory(path)
+        if directory is None:
+            raise FileNotFoundError(f"No such directory: {path}")
+
+        prefix = self._normalize(path)
+        prefix = prefix + '/' if prefix else ''
+        return [prefix + name for name, child in directory.children.items() if isinstance(child, DirectoryNode)]
+
+    def rename(self, path, new_path):
+        """Zmienia nazwę lub położenie pliku albo katalogu (przepięcie poddrzewa)."""
+        node = self._get_node(path)
+        if node is None or node is self.root:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+        folder_path, new_name = self._split_path(new_path)
+        folder = self._get_directory(folder_path)
+        if folder is None:
+            raise FileNotFoundError(f"Directory '{folder_path}' not found.")
+        if new_name in folder.children:
+            raise FileExistsError(f"'{self._normalize(new_path)}' already exists.")
+
+        # Nie można przenieść katalogu do jego własnego poddrzewa
+        ancestor = folder
+        while ancestor is not None:
+            if ancestor is node:
+                raise ValueError(f"Cannot move '{path}' into itself.")
+            ancestor = ancestor.parent
+
+        del node.parent.children[node.name]
+        node.name = new_name
+        node.parent = folder
+        folder.children[new_name] = node
+        self._invalidate(self._normalize(path), node)
+        self.events.emit("fs.renamed", path=path, new_path=new_path)
+        return self._path_of(node)
+
+    def move(self, path, destination):
+        """Przenosi plik lub katalog; jeśli cel jest katalogiem, trafia do jego środka."""
+        if self._get_directory(destination) is not None:
+            _, name = self._split_path(path)
+            destination = self._normalize(destination) + '/' + name
+        return self.rename(path, destination)
@@ -1,6 +1,14 @@
 import os
 import json
-from datetime import datetime
+import time
+import metrics
+from journal import open_journal
+from log_writer import open_writer
+from user_store import open_store
+
+MEMORY_BLOCK_TIME = metrics.histogram("files_log.memory_block")
+EVENTS = metrics.counter("files_log.events")
+ACCOUNT_WRITES = metrics.counter("files_log.account_writes")
 
 class FilesLog:
     def __init__(self):
@@ -12,105 +20,123 @@ class FilesLog:
         os.makedirs(self.memory_dir, exist_ok=True)
         os.makedirs(self.keys_dir, exist_ok=True)
         os.makedirs(self.users_dir, exist_ok=True)
+        # Bloki pamięci trafiają do wspólnego dziennika (ten sam co w MemoryManager)
+        self.memory_journal = open_journal(self.memory_dir)
+        # Pozostałe zdarzenia zapisuje wątek w tle; tutaj tylko trafiają do kolejki
+        self.log = open_writer(os.path.join(self.data_dir, 'logs', 'files_log.ndjson'))
+        # Użytkownicy i klucze w jednej bazie; przy pierwszym otwarciu importuje stare pliki JSON
+        self.accounts = open_store(os.path.join(self.data_dir, 'accounts.db'),
+                                   legacy_users_dir=self.users_dir, legacy_keys_dir=self.keys_dir)
 
     def create_memory_block(self, block_id, amount, process_id):
-        """Tworzy blok pamięci w formacie JSON."""
+        """Zapisuje blok pamięci w dzienniku."""
         memory_block = {
             'block_id': block_id,
             'amount': amount,
             'process_id': process_id,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': time.time()
         }
-        file_path = os.path.join(self.memory_dir, f'memory_block_{block_id}.json')
-        with open(file_path, 'w') as file:
-            json.dump(memory_block, file)
+        if metrics.enabled:
+            started = time.perf_counter()
+            self.memory_journal.put(f'memory_block_{block_id}', memory_block)
+            MEMORY_BLOCK_TIME.record(time.perf_counter() - started)
+        else:
+            self.memory_journal.put(f'memory_block_{block_id}', memory_block)
 
     def delete_memory_block(self, block_id):
-        """Usuwa blok pamięci w formacie JSON."""
-        file_path = os.path.join(self.memory_dir, f'memory_block_{block_id}.json')
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+        """Usuwa blok pamięci z dziennika."""
+        self.memory_journal.delete(f'memory_block_{block_id}')
 
     def save_user(self, username, password):
-        """Zapisuje użytkownika w formacie JSON."""
+        """Zapisuje użytkownika w bazie kont."""
         user_data = {
             'username': username,
             'password': password,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': time.time()
         }
-        file_path = os.path.join(self.users_dir, f'{username}.json')
-        with open(file_path, 'w') as file:
-            json.dump(user_data, file)
+        if metrics.enabled:
+            ACCOUNT_WRITES.inc()
+        self.accounts.put_user(username, user_data)
 
     def get_user(self, username):
-        """Odczytuje dane użytkownika z pliku JSON."""
-        file_path = os.path.join(self.users_dir, f'{username}.json')
-        if os.path.isfile(file_path):
-            with open(file_path, 'r') as file:
-                return json.load(file)
-        return None
+        """Odczytuje dane użytkownika z bazy kont."""
+        return self.accounts.get_user(username)
 
     def create_key_file(self, key_name, passkey):
-        """Tworzy plik klucza w formacie JSON."""
+        """Zapisuje klucz w bazie kont."""
         key_data = {
             'key_name': key_name,
             'passkey': passkey,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': time.time()
         }
-        file_path = os.path.join(self.keys_dir, f'{key_name}.json')
-        with open(file_path, 'w') as file:
-            json.dump(key_data, file)
+        if metrics.enabled:
+            ACCOUNT_WRITES.inc()
+        self.accounts.put_key(key_name, key_data)
+
+    def get_key(self, key_name):
+        """Odczytuje klucz z bazy kont."""
+        return self.accounts.get_key(key_name)
 
     def delete_key_file(self, key_name):
-        """Usuwa plik klucza w formacie JSON."""
-        file_path = os.path.join(self.keys_dir, f'{key_name}.json')
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+        """Usuwa klucz z bazy kont."""
+        if metrics.enabled:
+            ACCOUNT_WRITES.inc()
+        self.accounts.delete_key(key_name)
 
     def save_memory_status(self, status):
         """Zapisuje status pamięci do pliku JSON."""
         file_path = os.path.join(self.memory_dir, 'memory_status.json')
-        with open(file_path, 'w') as file:
-            json.dump(status, file)
+        self.log.write_json(file_path, status)
 
     def read_memory_status(self):
         """Odczytuje status pamięci z pliku JSON."""
         file_path = os.path.join(self.memory_dir, 'memory_status.json')
+        pending, status = self.log.pending_file(file_path)
+        if pending:
+            return status
         if os.path.isfile(file_path):
             with open(file_path, 'r') as file:
                 return json.load(file)
         return None
 
     def create_cpu_block(self, block_id, process_id):
-        """Tworzy blok procesora w formacie JSON."""
-        cpu_block = {
+        """Zapisuje utworzenie bloku procesora w dzienniku zdarzeń."""
+        if metrics.enabled:
+            EVENTS.inc()
+        self.log.append({
+            'event': 'create_cpu_block',
             'block_id': block_id,
             'process_id': process_id,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        file_path = os.path.join(self.memory_dir, f'cpu_block_{block_id}.json')
-        with open(file_path, 'w') as file:
-            json.dump(cpu_block, file)
+            'created_at': time.time()
+        })
 
     def delete_cpu_block(self, block_id):
-        """Usuwa blok procesora w formacie JSON."""
-        file_path = os.path.join(self.memory_dir, f'cpu_block_{block_id}.json')
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+        """Zapisuje usunięcie bloku procesora w dzienniku zdarzeń."""
+        if metrics.enabled:
+            EVENTS.inc()
+        self.log.append({
+            'event': 'delete_cpu_block',
+            'block_id': block_id,
+            'created_at': time.time()
+        })
 
     def create_ram_block(self, block_id, process_id):
-        """Tworzy blok pamięci RAM w formacie JSON."""
-        ram_block = {
+        """Zapisuje utworzenie bloku pamięci RAM w dzienniku zdarzeń."""
+        if metrics.enabled:
+            EVENTS.inc()
+        self.log.append({
+            'event': 'create_ram_block',
             'block_id': block_id,
             'process_id': process_id,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        file_path = os.path.join(self.memory_dir, f'ram_block_{block_id}.json')
-        with open(file_path, 'w') as file:
-            json.dump(ram_block, file)
+            'created_at': time.time()
+        })
 
     def delete_ram_block(self, block_id):
-        """Usuwa blok pamięci RAM w formacie JSON."""
-        file_path = os.path.join(self.memory_dir, f'ram_block_{block_id}.json')
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+        """Zapisuje usunięcie bloku pamięci RAM w dzienniku zdarzeń."""
+        if metrics.enabled:
+            EVENTS.inc()
+        self.log.append({
+            'event': 'delete_ram_block',
+            'block_id': block_id,
+            'created_at': time.time()
+        })
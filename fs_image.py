@@ -0,0 +1,149 @@
+"""Single-file disk image for FileSystem.
+
+Layout (all integers little-endian):
+
+    superblock | inode table | directory entries | chunk references |
+    chunk table | names | data
+
+* superblock  - magic, version, chunk size, counts and section offsets,
+  plus the stored/logical byte totals of the chunk store,
+* inode       - kind (directory or file), binary flag, entry count, index of
+  the first directory entry (directories) or chunk reference (files), size,
+* dirent      - inode number, name offset and length in the names region,
+* chunk ref   - index into the chunk table,
+* chunk       - digest, data offset, length and reference count.
+
+Every record has a fixed size, so any inode, entry or chunk can be read
+directly from the mapped image without scanning the sections before it.
+"""
+import mmap
+import os
+import struct
+from collections import deque
+
+MAGIC = b'HSOFSIMG'
+VERSION = 1
+
+SUPERBLOCK = struct.Struct('<8sII11Q')
+INODE = struct.Struct('<BBxxIQQ')
+DIRENT = struct.Struct('<QQI')
+CHUNK_REF = struct.Struct('<Q')
+CHUNK = struct.Struct('<16sQQQ')
+
+KIND_DIRECTORY = 1
+KIND_FILE = 2
+
+
+class DiskImage:
+    """Read-only view of an image file, mapped into memory."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.chunk_size, self.inode_count, self.inode_offset,
+         self.dirent_count, self.dirent_offset, self.chunk_ref_count, self.chunk_ref_offset,
+         self.chunk_count, self.chunk_offset, self.names_offset,
+         self.stored_bytes, self.logical_bytes) = SUPERBLOCK.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a file system image: {path}")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported image version: {version}")
+
+    def inode(self, number):
+        """Return (kind, binary, count, first, size)."""
+        return INODE.unpack_from(self._map, self.inode_offset + number * INODE.size)
+
+    def dirents(self, first, count):
+        """Yield (name, inode number) of a directory's entries."""
+        for index in range(first, first + count):
+            inode, name_offset, name_length = DIRENT.unpack_from(self._map, self.dirent_offset + index * DIRENT.size)
+            start = self.names_offset + name_offset
+            yield self._map[start:start + name_length].decode('utf-8'), inode
+
+    def chunk_refs(self, first, count):
+        """Return the chunk table indexes of a file."""
+        offset = self.chunk_ref_offset + first * CHUNK_REF.size
+        return [ref for (ref,) in CHUNK_REF.iter_unpack(self._map[offset:offset + count * CHUNK_REF.size])]
+
+    def chunk(self, index):
+        """Return (digest, data offset, length, refs)."""
+        return CHUNK.unpack_from(self._map, self.chunk_offset + index * CHUNK.size)
+
+    def read(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def close(self):
+        if not self._map.closed:
+            self._map.close()
+            self._file.close()
+
+
+def write_image(file_system, path):
+    """Write the whole file system to `path` atomically (temp file + rename)."""
+    store = file_system.chunks
+    inodes = [None]
+    dirents = []
+    chunk_refs = []
+    chunk_index = {}
+    chunk_refcounts = []
+    names = bytearray()
+
+    # Inodes are numbered in BFS order so each directory's entries are contiguous
+    queue = deque([(file_system.root, 0)])
+    while queue:
+        node, number = queue.popleft()
+        if hasattr(node, 'children'):
+            first = len(dirents)
+            for name, child in node.children.items():
+                child_number = len(inodes)
+                inodes.append(None)
+                encoded = name.encode('utf-8')
+                dirents.append((child_number, len(names), len(encoded)))
+                names += encoded
+                queue.append((child, child_number))
+            inodes[number] = (KIND_DIRECTORY, 0, len(node.children), first, 0)
+        else:
+            first = len(chunk_refs)
+            for chunk_id in node.chunks:
+                index = chunk_index.get(chunk_id)
+                if index is None:
+                    index = len(chunk_refcounts)
+                    chunk_index[chunk_id] = index
+                    chunk_refcounts.append(0)
+                chunk_refcounts[index] += 1
+                chunk_refs.append(index)
+            inodes[number] = (KIND_FILE, int(node.binary), len(node.chunks), first, node.size)
+
+    chunk_ids = list(chunk_index)
+    lengths = [store.chunk_length(chunk_id) for chunk_id in chunk_ids]
+    inode_offset = SUPERBLOCK.size
+    dirent_offset = inode_offset + len(inodes) * INODE.size
+    chunk_ref_offset = dirent_offset + len(dirents) * DIRENT.size
+    chunk_offset = chunk_ref_offset + len(chunk_refs) * CHUNK_REF.size
+    names_offset = chunk_offset + len(chunk_ids) * CHUNK.size
+    data_offset = names_offset + len(names)
+    stored_bytes = sum(lengths)
+    logical_bytes = sum(length * refs for length, refs in zip(lengths, chunk_refcounts))
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as image:
+        image.write(SUPERBLOCK.pack(
+            MAGIC, VERSION, store.chunk_size, len(inodes), inode_offset,
+            len(dirents), dirent_offset, len(chunk_refs), chunk_ref_offset,
+            len(chunk_ids), chunk_offset, names_offset, stored_bytes, logical_bytes))
+        image.write(b''.join(INODE.pack(*inode) for inode in inodes))
+        image.write(b''.join(DIRENT.pack(*dirent) for dirent in dirents))
+        image.write(b''.join(CHUNK_REF.pack(ref) for ref in chunk_refs))
+        offset = data_offset
+        for chunk_id, length, refs in zip(chunk_ids, lengths, chunk_refcounts):
+            image.write(CHUNK.pack(chunk_id, offset, length, refs))
+            offset += length
+        image.write(names)
+        for chunk_id in chunk_ids:
+            image.write(store.get(chunk_id))
+        image.flush()
+        os.fsync(image.fileno())
+    os.replace(temp_path, path)
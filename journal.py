@@ -0,0 +1,209 @@
+import atexit
+import json
+import os
+import threading
+
+
+class BlockJournal:
+    """Append-only store of JSON records with group commit and compaction.
+
+    Writes only update the in-memory state and queue a journal entry. A
+    background thread appends the queued entries to `journal.log` every
+    `flush_interval` seconds (0 means every write is flushed immediately).
+    Once the journal holds more than `compact_after` entries, the state is
+    rewritten to `snapshot.json` and the journal is truncated. On start the
+    snapshot is loaded and the journal replayed; a torn last line left by a
+    crash is dropped.
+
+    Keys put or deleted are also kept in a change feed, from which
+    snapshots read what changed since they last looked (`changes_since`).
+    """
+    JOURNAL_FILE = "journal.log"
+    SNAPSHOT_FILE = "snapshot.json"
+
+    def __init__(self, directory, flush_interval=0.05, compact_after=10000, fsync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+        self.records = {}
+        self._pending = []
+        self._journal_entries = 0
+        # Change feed: keys put or deleted, _changes[0] having position _changes_start
+        self._changes = []
+        self._changes_start = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = None
+
+        self._replay()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        """Rebuild the state from the snapshot and the journal."""
+        if os.path.isfile(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                self.records = json.load(file)
+        if not os.path.isfile(self.journal_path):
+            return
+        valid_size = 0
+        with open(self.journal_path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # Unterminated: the write was cut off, and the next append would join onto it
+                    break
+                try:
+                    op, key, value = json.loads(line)
+                except ValueError:
+                    break
+                if op == "put":
+                    self.records[key] = value
+                else:
+                    self.records.pop(key, None)
+                valid_size += len(line)
+                self._journal_entries += 1
+        if valid_size != os.path.getsize(self.journal_path):
+            # The last entry was cut off mid-write
+            with open(self.journal_path, 'r+b') as file:
+                file.truncate(valid_size)
+
+    def put(self, key, value):
+        """Store a record under a key."""
+        with self._lock:
+            self.records[key] = value
+            self._pending.append(("put", key, value))
+            self._changed(key)
+        self._schedule_flush()
+
+    def delete(self, key):
+        """Remove a record if it exists."""
+        with self._lock:
+            if key not in self.records:
+                return
+            del self.records[key]
+            self._pending.append(("del", key, None))
+            self._changed(key)
+        self._schedule_flush()
+
+    def get(self, key, default=None):
+        return self.records.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def items(self):
+        """A consistent copy of all (key, record) pairs."""
+        with self._lock:
+            return list(self.records.items())
+
+    def replace(self, records):
+        """Replace the whole state (e.g. when restoring a snapshot) and compact the journal."""
+        with self._io_lock:
+            with self._lock:
+                self.records = dict(records)
+                self._pending = []
+                # Every key may have changed: leave every earlier position behind
+                self._changes_start += len(self._changes) + 1
+                self._changes = []
+            self._compact()
+
+    def _changed(self, key):
+        # Called under the lock; the feed is trimmed once it outgrows the records
+        self._changes.append(key)
+        if len(self._changes) > 2 * len(self.records) + 1024:
+            dropped = len(self._changes) // 2
+            del self._changes[:dropped]
+            self._changes_start += dropped
+
+    def changes_since(self, position):
+        """Return (keys changed since `position`, current position).
+
+        The keys are None when `position` is None or older than the feed
+        reaches back; the caller then has to treat every key as changed.
+        """
+        with self._lock:
+            end = self._changes_start + len(self._changes)
+            if position is None or position < self._changes_start:
+                return None, end
+            return set(self._changes[position - self._changes_start:]), end
+
+    def _schedule_flush(self):
+        if self.flush_interval <= 0:
+            self.flush()
+        elif self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Append queued entries to the journal in one write (group commit)."""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch or self._journal.closed:
+                return
+            self._journal.write("".join(json.dumps(entry) + "\n" for entry in batch))
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._journal_entries += len(batch)
+            if self._journal_entries > self.compact_after:
+                self._compact()
+
+    def compact(self):
+        """Write a snapshot of the state and truncate the journal."""
+        self.flush()
+        with self._io_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            state = json.dumps(self.records)
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(state)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        self._journal_entries = 0
+
+    def close(self):
+        """Flush queued entries and close the journal."""
+        self.flush()
+        self._closed = True
+        self._wakeup.set()
+        with self._io_lock:
+            self._journal.close()
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def open_journal(directory, **options):
+    """Return the shared journal for a directory, creating it on first use."""
+    path = os.path.abspath(directory)
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = BlockJournal(directory, **options)
+            _journals[path] = journal
+        return journal
+
+
+@atexit.register
+def _flush_all():
+    for journal in list(_journals.values()):
+        journal.close()
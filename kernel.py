@@ -1,17 +1,67 @@
 import json
 import os
+import threading
+import time
 from datetime import datetime
+import bulk_ops
+import metrics
+import snapshot
+from accounting import Accounting, QuotaExceeded
+from events import EventChannel
+from compaction import Compactor
+from concurrent_allocator import ConcurrentAllocator
 from files_log import FilesLog
+from ram_device import RamDevice
+from virtual_memory import VirtualMemory
+
+ALLOCATE_TIME = metrics.histogram("kernel.allocate")
+ALLOCATE_SCAN_TIME = metrics.histogram("kernel.allocate.scan")
+ALLOCATE_LOG_TIME = metrics.histogram("kernel.allocate.files_log")
+DEALLOCATE_TIME = metrics.histogram("kernel.deallocate")
+READ_TIME = metrics.histogram("kernel.read")
+WRITE_TIME = metrics.histogram("kernel.write")
+TSC_COUNT = metrics.counter("kernel.tsc")
+LIVE_PROCESSES = metrics.gauge("kernel.processes_with_memory")
+
+DEFAULT_SNAPSHOT_PATH = os.path.join("data", "snapshots", "kernel.snap")
+
 
 class Kernel:
-    def __init__(self):
+    def __init__(self, ram_image=None, ram_pages=None, arenas=1, events=None, hard_quota=None, soft_quota=None,
+                 snapshot_path=None):
         self.files_log = FilesLog()
+        # Output goes through the event channel; EventChannel() without handlers is silent
+        self.events = events if events is not None else EventChannel.console()
         self.memory_size = 1024
+        # Optional mmap-backed RAM: data goes to the image, self.memory keeps owners
+        self.ram = None
+        if ram_image is not None:
+            self.ram = RamDevice(ram_image, ram_pages)
+            self.memory_size = self.ram.size
         self.memory = [None] * self.memory_size
+        # Thread-safe allocator: per-arena locks and thread-local caches
+        self.allocator = ConcurrentAllocator(self.memory_size, arenas)
+        # process_id -> list of (address, amount) ranges owned by the process
+        self.process_extents = {}
+        self._extents_lock = threading.Lock()
+        # Per-process usage, peaks and quotas, charged on allocate and released on deallocate
+        self.accounting = Accounting(hard_quota, soft_quota)
+        # Relocates live ranges when memory is free but not contiguous
+        self.compactor = Compactor(self.allocator, self.process_extents, self._extents_lock, self._move_extent)
         self.version = "1.0.0"
         self.processes = {}
         self.tsc_count = 0
         self.recovery_mode = False
+        # Paged virtual memory, off until enable_paging() is called
+        self.vm = None
+        # Recovery restores the last snapshot; none is used until a path is given or one is taken
+        self.snapshot_path = snapshot_path
+        self._snapshots = None
+        # Pages written since the last snapshot, so that a snapshot encodes only those
+        self._dirty_memory = snapshot.DirtyPages(snapshot.CELLS_PER_PAGE)
+        self._dirty_ram = snapshot.DirtyPages(snapshot.PAGE_SIZE)
+        self._snapshot_changes = snapshot.Changes(self.files_log.memory_journal,
+                                                  memory=self._dirty_memory, ram=self._dirty_ram)
 
     def allocate_memory(self, process_id, amount):
         """Allocate memory for a process."""
@@ -19,67 +69,326 @@ class Kernel:
             self._trigger_tsc("Invalid memory amount for allocation.")
             return
 
-        for i in range(self.memory_size):
-            if self.memory[i] is None:
-                if amount <= self.memory_size - i:
-                    for j in range(i, i + amount):
-                        self.memory[j] = process_id
-                    self.files_log.create_memory_block(i, amount, process_id)
-                    print(f"Memory allocated at address {i} for process {process_id}")
-                    return
-        self._trigger_tsc("Not enough memory to allocate.")
+        started = time.perf_counter() if metrics.enabled else None
+        try:
+            self.accounting.reserve(process_id, amount)
+        except QuotaExceeded:
+            self._trigger_tsc(f"Memory quota exceeded for process {process_id}.")
+            return
+        try:
+            address = self.allocator.allocate(amount)
+        except MemoryError:
+            # Free blocks may be scattered: compact until a large enough hole exists
+            if not self.compactor.compact(wanted=amount):
+                self.accounting.cancel(process_id, amount)
+                self._trigger_tsc("Not enough memory to allocate.")
+                return
+            try:
+                address = self.allocator.allocate(amount)
+            except MemoryError:
+                # The hole was taken by another thread after compaction
+                self.accounting.cancel(process_id, amount)
+                self._trigger_tsc("Not enough memory to allocate.")
+                return
+        over_soft_quota = self.accounting.commit(process_id, amount)
+        if started is not None:
+            scanned = time.perf_counter()
+            ALLOCATE_SCAN_TIME.record(scanned - started)
+
+        bulk_ops.fill(self.memory, address, amount, process_id)
+        self._dirty_memory.mark(address, amount)
+        with self._extents_lock:
+            self.process_extents.setdefault(process_id, []).append((address, amount))
+            self.compactor.track(process_id, address, amount)
+        if started is not None:
+            logging = time.perf_counter()
+            self.files_log.create_memory_block(address, amount, process_id)
+            finished = time.perf_counter()
+            ALLOCATE_LOG_TIME.record(finished - logging)
+            ALLOCATE_TIME.record(finished - started)
+            LIVE_PROCESSES.set(len(self.process_extents))
+        else:
+            self.files_log.create_memory_block(address, amount, process_id)
+        self.events.emit("memory.allocated", address=address, process_id=process_id)
+        if over_soft_quota:
+            self.events.emit("memory.soft_quota", process_id=process_id,
+                             usage=self.accounting.usage(process_id), quota=self.accounting.quota(process_id)[1])
+        return address
 
     def deallocate_memory(self, process_id):
         """Deallocate memory for a process."""
-        for i in range(self.memory_size):
-            if self.memory[i] == process_id:
-                self.memory[i] = None
-                self.files_log.remove_memory_block(i)
-        print(f"Memory deallocated for process {process_id}")
+        started = time.perf_counter() if metrics.enabled else None
+        with self._extents_lock:
+            extents = self.process_extents.pop(process_id, ())
+            for address, _ in extents:
+                self.compactor.untrack(address)
+        for address, amount in extents:
+            bulk_ops.fill(self.memory, address, amount, None)
+            self._dirty_memory.mark(address, amount)
+            self.allocator.free(address, amount)
+            self.files_log.delete_memory_block(address)
+        self.accounting.release(process_id, sum(amount for _, amount in extents))
+        if self.vm is not None:
+            self.vm.free(process_id)
+        if started is not None:
+            DEALLOCATE_TIME.record(time.perf_counter() - started)
+            LIVE_PROCESSES.set(len(self.process_extents))
+        self.events.emit("memory.deallocated", process_id=process_id)
+        return sum(amount for _, amount in extents)
 
     def write_memory(self, address, data):
         """Write data to memory."""
+        started = time.perf_counter() if metrics.enabled else None
         if address < 0 or address >= self.memory_size:
             self._trigger_tsc("Invalid memory address for write.")
             return
 
+        if self.ram is not None:
+            try:
+                self.ram.write(address, data)
+            except (TypeError, ValueError):
+                self._trigger_tsc("Invalid data for memory write.")
+                return
+            self._dirty_ram.mark(address, len(data))
+            if started is not None:
+                WRITE_TIME.record(time.perf_counter() - started)
+            self.events.emit("memory.written", address=address, length=len(data))
+            return len(data)
+
         if not isinstance(data, list) or len(data) + address > self.memory_size:
             self._trigger_tsc("Invalid data for memory write.")
             return
 
-        for i in range(len(data)):
-            self.memory[address + i] = data[i]
-        print("Data written to memory")
+        self.memory[address:address + len(data)] = data
+        self._dirty_memory.mark(address, len(data))
+        if started is not None:
+            WRITE_TIME.record(time.perf_counter() - started)
+        self.events.emit("memory.written", address=address, length=len(data))
+        return len(data)
 
     def read_memory(self, address, length):
         """Read data from memory."""
+        started = time.perf_counter() if metrics.enabled else None
         if address < 0 or address + length > self.memory_size:
             self._trigger_tsc("Invalid memory range for read.")
             return
 
+        if self.ram is not None:
+            data = self.ram.read(address, length)
+            if started is not None:
+                READ_TIME.record(time.perf_counter() - started)
+            self.events.emit("memory.read", address=address, data=data)
+            return data
+
         data = self.memory[address:address + length]
-        print(f"Data read from memory: {data}")
+        if started is not None:
+            READ_TIME.record(time.perf_counter() - started)
+        self.events.emit("memory.read", address=address, data=data)
+        return data
+
+    def enable_paging(self, frames=None, page_size=64, policy="lru", tlb_size=64, swap_path=None):
+        """Give processes paged virtual address spaces (LRU, CLOCK or ARC replacement).
+
+        The virtual memory gets its own pool of `frames` physical frames,
+        by default as many as fit in memory_size; pages that do not fit
+        are swapped to a file under data/swap.
+        """
+        if self.vm is not None:
+            self.vm.close()
+        frames = frames or max(1, self.memory_size // page_size)
+        swap_path = swap_path or os.path.join(self.files_log.data_dir, 'swap', 'kernel.swap')
+        self.vm = VirtualMemory(frames, page_size, policy, swap_path, tlb_size)
+        return self.vm
+
+    def virtual_allocate(self, process_id, amount):
+        """Reserve `amount` cells in a process address space and return the virtual address."""
+        if self.vm is None:
+            self._trigger_tsc("Paging is not enabled.")
+            return
+        try:
+            address = self.vm.allocate(process_id, amount)
+        except ValueError:
+            self._trigger_tsc("Invalid memory amount for allocation.")
+            return
+        self.events.emit("memory.allocated", address=address, process_id=process_id)
+        return address
+
+    def virtual_read(self, process_id, address, length):
+        """Read bytes from a process virtual address space."""
+        if self.vm is None:
+            self._trigger_tsc("Paging is not enabled.")
+            return
+        try:
+            data = self.vm.read(process_id, address, length)
+        except ValueError as e:
+            self._trigger_tsc(str(e))
+            return
+        self.events.emit("memory.read", address=address, data=data)
         return data
 
+    def virtual_write(self, process_id, address, data):
+        """Write bytes to a process virtual address space."""
+        if self.vm is None:
+            self._trigger_tsc("Paging is not enabled.")
+            return
+        try:
+            written = self.vm.write(process_id, address, data)
+        except (TypeError, ValueError) as e:
+            self._trigger_tsc(str(e))
+            return
+        self.events.emit("memory.written", address=address, length=written)
+        return written
+
+    def _move_extent(self, process_id, source, target, length):
+        """Move a process range down to `target` (called by the compactor under the extents lock).
+
+        The ranges may overlap; only the part of the old range that the new
+        one does not cover is cleared.
+        """
+        vacated = max(source, target + length)
+        bulk_ops.memmove(self.memory, target, source, length)
+        bulk_ops.fill(self.memory, vacated, source + length - vacated, None)
+        self._dirty_memory.mark(target, source + length - target)
+        if self.ram is not None:
+            bulk_ops.memmove(self.ram.view, target, source, length)
+            self.ram.fill(vacated, source + length - vacated)
+            self._dirty_ram.mark(target, source + length - target)
+        self.files_log.delete_memory_block(source)
+        self.files_log.create_memory_block(target, length, process_id)
+
+    def add_relocation_listener(self, callback):
+        """Call `callback(process_id, old_address, new_address, amount)` whenever compaction moves a range.
+
+        An address returned by allocate_memory is valid until its range is
+        moved; callers that keep addresses follow the moves through this.
+        """
+        self.compactor.add_listener(callback)
+
+    def remove_relocation_listener(self, callback):
+        """Stop calling a callback added with add_relocation_listener."""
+        self.compactor.remove_listener(callback)
+
+    def set_memory_quota(self, process_id, hard=None, soft=None):
+        """Set the hard and soft memory quota (in blocks) of a process; None uses the kernel default."""
+        self.accounting.set_quota(process_id, hard, soft)
+
+    def get_memory_usage(self, process_id):
+        """Current and peak memory, allocation counts and quotas of a process."""
+        return self.accounting.get(process_id)
+
+    def get_fragmentation(self):
+        """Largest free extent, external fragmentation ratio and free-extent histogram."""
+        return {
+            "free_blocks": self.allocator.free_total,
+            "cached_blocks": self.allocator.cached_total,
+            "largest_free_extent": self.allocator.largest_free,
+            "fragmentation": self.allocator.fragmentation,
+            "free_extent_histogram": self.allocator.free_histogram()
+        }
+
+    def _data_buffer(self):
+        return self.ram.view if self.ram is not None else self.memory
+
+    def _dirty_data(self):
+        return self._dirty_ram if self.ram is not None else self._dirty_memory
+
+    def _valid_range(self, address, length):
+        return length >= 0 and address >= 0 and address + length <= self.memory_size
+
+    def copy_memory(self, destination, source, length):
+        """Copy a memory range (memmove: ranges may overlap)."""
+        if not self._valid_range(destination, length) or not self._valid_range(source, length):
+            self._trigger_tsc("Invalid memory range for copy.")
+            return
+        bulk_ops.memmove(self._data_buffer(), destination, source, length)
+        self._dirty_data().mark(destination, length)
+
+    def compare_memory(self, first, second, length):
+        """Compare two memory ranges like memcmp."""
+        if not self._valid_range(first, length) or not self._valid_range(second, length):
+            self._trigger_tsc("Invalid memory range for compare.")
+            return
+        buffer = self._data_buffer()
+        return bulk_ops.memcmp(buffer, first, buffer, second, length)
+
+    def fill_memory(self, address, length, value):
+        """Fill a memory range with a single value."""
+        if not self._valid_range(address, length):
+            self._trigger_tsc("Invalid memory range for fill.")
+            return
+        if self.ram is not None and value is not None and \
+                not (isinstance(value, int) and 0 <= value <= 255):
+            # RAM cells are bytes
+            self._trigger_tsc("Invalid value for memory fill.")
+            return
+        bulk_ops.fill(self._data_buffer(), address, length, value)
+        self._dirty_data().mark(address, length)
+
+    def find_process_memory(self, process_id, address=0, length=None):
+        """Find the first range owned by a process, as (address, length).
+
+        Ownership comes from the process's extents: without a RAM image,
+        memory cells hold written data rather than their owner.
+        """
+        stop = self.memory_size if length is None else address + length
+        with self._extents_lock:
+            ranges = sorted(self.process_extents.get(process_id, ()))
+        found = None
+        for start, amount in ranges:
+            begin, end = max(start, address), min(start + amount, stop)
+            if begin >= end:
+                continue
+            if found is None:
+                found = [begin, end]
+            elif begin == found[1]:
+                # Adjacent ranges of one process form one run
+                found[1] = end
+            else:
+                break
+        return None if found is None else (found[0], found[1] - found[0])
+
+    def memory_histogram(self, address=0, length=None):
+        """Count cells per owner in a memory range (None for free cells), from the process extents."""
+        stop = self.memory_size if length is None else address + length
+        histogram = {}
+        with self._extents_lock:
+            for process_id, ranges in self.process_extents.items():
+                cells = sum(max(0, min(start + amount, stop) - max(start, address)) for start, amount in ranges)
+                if cells:
+                    histogram[process_id] = cells
+        free = stop - address - sum(histogram.values())
+        if free > 0:
+            histogram[None] = free
+        return histogram
+
     def display_memory_status(self):
         """Display memory status."""
-        free_blocks = sum(1 for block in self.memory if block is None)
+        free_blocks = self.allocator.free_total
         occupied_blocks = self.memory_size - free_blocks
-        print("Memory Status:")
-        print(f"Free blocks: {free_blocks}")
-        print(f"Occupied blocks: {occupied_blocks}")
+        status = {
+            'total_blocks': self.memory_size,
+            'free_blocks': free_blocks,
+            'occupied_blocks': occupied_blocks
+        }
+        self.events.emit("memory.status", **status)
+        return status
+
+    def sync_memory(self):
+        """Flush the RAM image to disk."""
+        if self.ram is not None:
+            self.ram.flush()
 
     def update_kernel(self, new_version):
         """Update kernel version."""
         self.version = new_version
-        print(f"Kernel version updated to {new_version}")
+        self.events.emit("kernel.updated", version=new_version)
 
     def _trigger_tsc(self, error_message):
         """Trigger a tragic system crash (TSC)."""
         self.tsc_count += 1
-        print("\nTSC (Tragic System Crash)")
-        print(f"Error Message: {error_message}")
-        print(f"Error Code: TSC-{self.tsc_count}")
+        if metrics.enabled:
+            TSC_COUNT.inc()
+        self.events.emit("kernel.tsc", message=error_message, count=self.tsc_count)
         if self.tsc_count >= 3:
             self.enter_recovery_mode()
         else:
@@ -87,25 +396,59 @@ class Kernel:
 
     def reboot_system(self):
         """Reboot the system."""
-        print("System rebooting...")
+        self.events.emit("system.rebooting")
         # Here you would add actual reboot logic if needed
 
     def enter_recovery_mode(self):
         """Enter recovery mode."""
         if not self.recovery_mode:
             self.recovery_mode = True
-            print("Entering Recovery Mode...")
+            self.events.emit("system.recovery")
             self.scan_and_repair()
             self.reboot_system()
+            # Crashes are counted again from the restored state
+            self.tsc_count = 0
+            self.recovery_mode = False
 
     def scan_and_repair(self):
-        """Scan for missing files and attempt repair."""
-        print("Scanning for missing files and attempting repair...")
-        missing_files = self.files_log.check_for_missing_files()
-        if missing_files:
-            for file in missing_files:
-                self.files_log.recover_file(file)
-            print("Files recovered.")
+        """Restore the last snapshot, if one was taken or configured; return its generation."""
+        self.events.emit("system.scan")
+        if self.snapshot_path is None:
+            self.events.emit("system.no_snapshot")
+            return None
+        try:
+            return self.restore_snapshot()
+        except ValueError as e:
+            # A damaged or mismatched snapshot must not break out of recovery
+            self.events.emit("system.restore_failed", error=e)
+            return None
+
+    def _snapshot_file(self, path=None):
+        if path is not None:
+            self.snapshot_path = path
+        elif self.snapshot_path is None:
+            self.snapshot_path = DEFAULT_SNAPSHOT_PATH
+        if self._snapshots is None or self._snapshots.path != self.snapshot_path:
+            self._snapshots = snapshot.SnapshotFile(self.snapshot_path)
+            # Nothing of the state is in the new file yet
+            self._snapshot_changes.reset()
+        return self._snapshots
+
+    def take_snapshot(self, path=None):
+        """Save memory, the process table, accounting and the memory log; only changes since the last snapshot are written."""
+        stats = snapshot.save(self._snapshot_file(path), snapshot.capture_kernel, self, self._snapshot_changes)
+        self.events.emit("system.snapshot", path=self.snapshot_path, **stats)
+        return stats
+
+    def restore_snapshot(self, path=None):
+        """Load the latest snapshot; return its generation, or None if there is none."""
+        restored = snapshot.restore(self._snapshot_file(path), snapshot.restore_kernel, self, self._snapshot_changes)
+        if restored is None:
+            self.events.emit("system.no_snapshot")
+            return None
+        generation, elapsed = restored
+        self.events.emit("system.restored", generation=generation, milliseconds=elapsed * 1000)
+        return generation
 
     def self_tsc(self):
         """Manually trigger a TSC."""
@@ -120,8 +463,12 @@ class Kernel:
         info = {
             "version": self.version,
             "memory_size": self.memory_size,
-            "processes": self.processes
+            "processes": self.processes,
+            "fragmentation": self.get_fragmentation(),
+            "memory_accounting": self.accounting.stats()
         }
+        if self.vm is not None:
+            info["paging"] = self.vm.stats()
         return info
 
 if __name__ == "__main__":
@@ -130,6 +477,7 @@ if __name__ == "__main__":
     kernel.allocate_memory(1, 10)
     kernel.write_memory(0, [1, 2, 3, 4, 5])
     kernel.read_memory(0, 5)
+    kernel.take_snapshot()
     kernel.deallocate_memory(1)
     kernel.update_kernel("2.0.0")
     kernel.self_tsc()
@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _format_record(record):
+    """Turn a float `created_at` (time.time()) into the readable log format."""
+    created_at = record.get('created_at')
+    if isinstance(created_at, float):
+        record = dict(record, created_at=datetime.fromtimestamp(created_at).strftime(TIME_FORMAT))
+    return record
+
+
+class LogWriter:
+    """Background writer for FilesLog records.
+
+    Callers only enqueue. A dedicated thread takes records off a bounded
+    queue in batches of up to `max_batch`, and writes them either as lines
+    of the newline-delimited JSON log at `path` or as whole JSON files
+    (the last write to a file within a batch wins). Timestamps are
+    formatted on the writer thread.
+
+    Flush policy: with `flush_interval > 0` the writer waits up to that
+    long to fill a batch; with 0 it writes whatever is queued right away.
+    A full queue blocks the caller (back-pressure). Pending records are
+    written on flush(), close() and interpreter exit.
+
+    A record that can not be written (unserializable data, a target that
+    is a directory, a full disk) is reported on stderr and counted in
+    `errors`; the writer thread keeps draining the queue, so flush() and
+    close() always return.
+    """
+
+    def __init__(self, path, flush_interval=0.05, max_batch=1024, max_queue=65536):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._queue = queue.Queue(max_queue)
+        # JSON file writes not on disk yet, so reads can see them
+        self._pending_files = {}
+        self._pending_lock = threading.Lock()
+        self._closed = False
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Queue a record for the NDJSON log."""
+        self._queue.put(('append', None, record))
+
+    def write_json(self, path, data):
+        """Queue writing `data` as the JSON file `path`."""
+        with self._pending_lock:
+            self._pending_files[path] = data
+        self._queue.put(('json', path, data))
+
+    def remove(self, path):
+        """Queue removing the file `path`."""
+        with self._pending_lock:
+            self._pending_files[path] = None
+        self._queue.put(('remove', path, None))
+
+    def pending_file(self, path):
+        """Return (True, data) for a file write not yet on disk (data None = removal)."""
+        with self._pending_lock:
+            if path in self._pending_files:
+                data = self._pending_files[path]
+                return True, None if data is None else _format_record(data)
+        return False, None
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch and batch[-1][0] != 'stop':
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._write(batch)
+            except Exception as error:
+                self._report(f"batch of {len(batch)} records", error)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if any(kind == 'stop' for kind, _, _ in batch):
+                return
+
+    def _report(self, target, error):
+        self.errors += 1
+        print(f"LogWriter: could not write {target}: {error!r}", file=sys.stderr)
+
+    def _write(self, batch):
+        lines = []
+        files = {}
+        for kind, path, data in batch:
+            if kind == 'append':
+                try:
+                    lines.append(json.dumps(_format_record(data)))
+                except (TypeError, ValueError) as error:
+                    self._report(f"a record to {self.path}", error)
+            elif kind in ('json', 'remove'):
+                files[path] = data if kind == 'json' else None
+        if lines:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as log:
+                    log.write('\n'.join(lines) + '\n')
+            except OSError as error:
+                self._report(f"{len(lines)} records to {self.path}", error)
+        for path, data in files.items():
+            try:
+                if data is None:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                else:
+                    # Serialize first, so a bad value does not leave a truncated file behind
+                    text = json.dumps(_format_record(data))
+                    with open(path, 'w') as file:
+                        file.write(text)
+            except (OSError, TypeError, ValueError) as error:
+                self._report(path, error)
+        with self._pending_lock:
+            for path, data in files.items():
+                if self._pending_files.get(path, data) is data:
+                    self._pending_files.pop(path, None)
+
+    def flush(self):
+        """Block until everything queued so far is written."""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """Write pending records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('stop', None, None))
+        self._thread.join()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def open_writer(path, **options):
+    """Return the shared writer for a log file, creating it on first use."""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = LogWriter(path, **options)
+            _writers[key] = writer
+        return writer
+
+
+@atexit.register
+def _close_all():
+    for writer in list(_writers.values()):
+        writer.close()
@@ -0,0 +1,351 @@
+"""Memory traces: a compact binary format, a CSV importer and a replay engine.
+
+A trace file is the 16-byte header ``<8sHHI`` (magic ``HSOTRACE``, format
+version, record size, reserved) followed by fixed 17-byte records
+``<BIQI``: operation, process id and two arguments.
+
+    ALLOCATE pid amount 0
+    FREE     pid 0      0
+    READ     pid offset length
+    WRITE    pid offset length
+
+Read and write offsets are relative to the process's latest allocation,
+so one trace can drive allocators that place memory differently; the
+replay follows allocations that compaction moves. Traces
+are read in chunks by `iter_trace`, so replaying never loads a whole
+trace into memory.
+"""
+import argparse
+import csv
+import json
+import random
+import struct
+import sys
+import tempfile
+import time
+
+MAGIC = b'HSOTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')
+RECORD = struct.Struct('<BIQI')
+
+ALLOCATE, FREE, READ, WRITE = 1, 2, 3, 4
+OPERATIONS = {'allocate': ALLOCATE, 'free': FREE, 'read': READ, 'write': WRITE}
+# Names accepted by the CSV importer
+OPERATION_ALIASES = dict(OPERATIONS, alloc=ALLOCATE, malloc=ALLOCATE, deallocate=FREE, dealloc=FREE, r=READ, w=WRITE)
+
+
+class TraceWriter:
+    """Appends records to a trace file through a write buffer."""
+
+    def __init__(self, path, buffer_records=4096):
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        self._buffer = bytearray()
+        self._limit = buffer_records * RECORD.size
+        self.count = 0
+
+    def append(self, operation, process_id, first=0, second=0):
+        self._buffer += RECORD.pack(operation, process_id, first, second)
+        self.count += 1
+        if len(self._buffer) >= self._limit:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def write_trace(path, events):
+    """Write (operation, pid, first, second) tuples to `path`; return the record count."""
+    with TraceWriter(path) as writer:
+        for event in events:
+            writer.append(*event)
+        return writer.count
+
+
+def iter_trace(path, chunk_records=4096):
+    """Yield (operation, pid, first, second) tuples from a trace file, one chunk at a time."""
+    with open(path, 'rb') as file:
+        magic, version, record_size, _ = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a memory trace: {path}")
+        if version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"Unsupported trace version {version} in {path}")
+        chunk_size = chunk_records * RECORD.size
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            usable = len(chunk) - len(chunk) % RECORD.size
+            yield from RECORD.iter_unpack(chunk[:usable])
+            if usable < len(chunk):
+                return
+
+
+def import_csv(csv_path, trace_path):
+    """Convert a CSV trace (columns: op, pid, arg1, arg2; header optional) to the binary format.
+
+    Missing trailing columns count as 0; a row with an unknown operation,
+    a non-numeric or negative value or extra columns raises ValueError
+    naming its line.
+    """
+    def events():
+        with open(csv_path, newline='') as file:
+            reader = csv.reader(file)
+            for row in reader:
+                if not row or row[0].startswith('#'):
+                    continue
+                operation = OPERATION_ALIASES.get(row[0].strip().lower())
+                if operation is None:
+                    if row[0].strip().lower() in ('op', 'operation'):
+                        continue
+                    raise ValueError(f"Unknown trace operation on line {reader.line_num}: {row[0]}")
+                if len(row) > 4:
+                    raise ValueError(f"Too many columns on line {reader.line_num}: {row}")
+                try:
+                    values = [int(value) for value in row[1:]]
+                except ValueError:
+                    raise ValueError(f"Invalid number on line {reader.line_num}: {row}") from None
+                if any(value < 0 for value in values):
+                    raise ValueError(f"Negative value on line {reader.line_num}: {row}")
+                values += [0] * (3 - len(values))
+                yield operation, values[0], values[1], values[2]
+    return write_trace(trace_path, events())
+
+
+def generate(count, processes=64, max_amount=64, seed=0):
+    """Yield a seeded synthetic trace: allocation churn mixed with reads and writes."""
+    rng = random.Random(seed)
+    live = {}
+    for _ in range(count):
+        choice = rng.random()
+        if not live or choice < 0.3:
+            pid = rng.randrange(processes)
+            if pid in live:
+                yield FREE, pid, 0, 0
+                del live[pid]
+            else:
+                amount = rng.randint(1, max_amount)
+                live[pid] = amount
+                yield ALLOCATE, pid, amount, 0
+        else:
+            pid = rng.choice(list(live))
+            offset = rng.randrange(live[pid])
+            yield (READ if choice < 0.7 else WRITE), pid, offset, rng.randint(1, live[pid] - offset)
+
+
+class MemoryManagerBackend:
+    """Replays a trace on a MemoryManager.
+
+    A manager created here keeps its block journal in `memory_dir`, by
+    default a new temporary directory, so replays never write to ./data.
+    """
+    name = "memory_manager"
+
+    def __init__(self, manager=None, size=1 << 16, policy=None, memory_dir=None):
+        if manager is None:
+            from memory import MemoryManager
+            options = {} if policy is None else {'policy': policy}
+            memory_dir = memory_dir or tempfile.mkdtemp(prefix='mem_trace_')
+            manager = MemoryManager(size=size, memory_dir=memory_dir, **options)
+        self.manager = manager
+        self.total = len(manager.blocks)
+
+    @property
+    def allocator(self):
+        # Looked up every time: restoring a snapshot replaces the manager's allocator
+        return self.manager.allocator
+
+    def allocate(self, process_id, amount):
+        try:
+            blocks = self.manager.allocate(process_id, amount)
+        except MemoryError:
+            return None
+        return blocks.start, len(blocks)
+
+    def free(self, process_id):
+        self.manager.deallocate(process_id)
+
+    def read(self, address, length):
+        self.manager.read_memory(address, length)
+
+    def write(self, address, length):
+        self.manager.write_memory(address, bytes(length))
+
+    def add_relocation_listener(self, callback):
+        self.manager.add_relocation_listener(callback)
+
+    def remove_relocation_listener(self, callback):
+        self.manager.remove_relocation_listener(callback)
+
+
+class KernelBackend:
+    """Replays a trace on a Kernel (with a silent event channel unless one is given)."""
+    name = "kernel"
+
+    def __init__(self, kernel=None):
+        if kernel is None:
+            from events import EventChannel
+            from kernel import Kernel
+            kernel = Kernel(events=EventChannel())
+        self.kernel = kernel
+        self.total = kernel.memory_size
+
+    @property
+    def allocator(self):
+        # Looked up every time: restoring a snapshot replaces the kernel's allocator
+        return self.kernel.allocator
+
+    def allocate(self, process_id, amount):
+        address = self.kernel.allocate_memory(process_id, amount)
+        return None if address is None else (address, amount)
+
+    def free(self, process_id):
+        self.kernel.deallocate_memory(process_id)
+
+    def read(self, address, length):
+        self.kernel.read_memory(address, length)
+
+    def write(self, address, length):
+        self.kernel.write_memory(address, [0] * length)
+
+    def add_relocation_listener(self, callback):
+        self.kernel.add_relocation_listener(callback)
+
+    def remove_relocation_listener(self, callback):
+        self.kernel.remove_relocation_listener(callback)
+
+
+BACKENDS = {backend.name: backend for backend in (MemoryManagerBackend, KernelBackend)}
+
+
+def fragmentation(backend):
+    """Free space, blocks in thread caches, largest free extent and external fragmentation of the arenas."""
+    allocator = backend.allocator
+    return {
+        'free': allocator.free_total,
+        'cached': allocator.cached_total,
+        'largest_free': allocator.largest_free,
+        'fragmentation': allocator.fragmentation
+    }
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def iter_replay(events, backend, window=10000):
+    """Replay events on a backend and yield statistics for every `window` operations."""
+    extents = {}
+    latencies = []
+    failed = 0
+    operations = 0
+    total = 0
+    clock = time.perf_counter
+    window_started = clock()
+
+    def relocated(process_id, source, target, length):
+        extent = extents.get(process_id)
+        if extent is not None and extent[0] == source:
+            extents[process_id] = (target, extent[1])
+
+    backend.add_relocation_listener(relocated)
+    try:
+        for operation, process_id, first, second in events:
+            if operation == ALLOCATE:
+                started = clock()
+                extent = backend.allocate(process_id, first)
+                latencies.append(clock() - started)
+                if extent is None:
+                    failed += 1
+                else:
+                    extents[process_id] = extent
+            elif operation == FREE:
+                backend.free(process_id)
+                extents.pop(process_id, None)
+            else:
+                extent = extents.get(process_id)
+                if extent is not None:
+                    base, size = extent
+                    offset = first % size
+                    length = max(1, min(second, size - offset))
+                    if operation == READ:
+                        backend.read(base + offset, length)
+                    else:
+                        backend.write(base + offset, length)
+            operations += 1
+
+            if operations == window:
+                total += operations
+                yield _window_stats(backend, total, operations, clock() - window_started, latencies, failed)
+                latencies = []
+                failed = 0
+                operations = 0
+                window_started = clock()
+
+        if operations:
+            total += operations
+            yield _window_stats(backend, total, operations, clock() - window_started, latencies, failed)
+    finally:
+        backend.remove_relocation_listener(relocated)
+
+
+def _window_stats(backend, total, operations, elapsed, latencies, failed):
+    latencies.sort()
+    stats = {
+        'end': total,
+        'operations': operations,
+        'ops_per_second': operations / elapsed if elapsed else 0.0,
+        'allocations': len(latencies),
+        'failed_allocations': failed,
+        'alloc_p50_us': _percentile(latencies, 0.50) * 1e6,
+        'alloc_p99_us': _percentile(latencies, 0.99) * 1e6,
+    }
+    stats.update(fragmentation(backend))
+    return stats
+
+
+def replay(path, backend="memory_manager", window=10000, **options):
+    """Replay a trace file; return the list of per-window statistics."""
+    if isinstance(backend, str):
+        backend = BACKENDS[backend](**options)
+    return list(iter_replay(iter_trace(path), backend, window))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory trace tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="convert a CSV trace to the binary format")
+    importer.add_argument("csv")
+    importer.add_argument("trace")
+    generator = commands.add_parser("generate", help="write a synthetic trace")
+    generator.add_argument("trace")
+    generator.add_argument("-n", "--count", type=int, default=1_000_000)
+    generator.add_argument("-s", "--seed", type=int, default=0)
+    replayer = commands.add_parser("replay", help="replay a trace and print JSON lines per window")
+    replayer.add_argument("trace")
+    replayer.add_argument("-b", "--backend", choices=sorted(BACKENDS), default="memory_manager")
+    replayer.add_argument("-w", "--window", type=int, default=10000)
+    options = parser.parse_args(argv)
+
+    if options.command == "import":
+        print(f"{import_csv(options.csv, options.trace)} records written")
+    elif options.command == "generate":
+        print(f"{write_trace(options.trace, generate(options.count, seed=options.seed))} records written")
+    else:
+        backend = BACKENDS[options.backend]()
+        for stats in iter_replay(iter_trace(options.trace), backend, options.window):
+            sys.stdout.write(json.dumps(stats) + "\n")
+
+
+if __name__ == "__main__":
+    main()
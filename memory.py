@@ -1,24 +1,65 @@
-import json
 import os
+import threading
+import time
+from array import array
 from datetime import datetime
+import bulk_ops
+import metrics
+import snapshot
+from accounting import Accounting
+from compaction import Compactor
+from concurrent_allocator import ConcurrentAllocator
+from extent_allocator import FIRST_FIT, BUDDY
+from journal import open_journal
+
+ALLOCATE_TIME = metrics.histogram("memory.allocate")
+DEALLOCATE_TIME = metrics.histogram("memory.deallocate")
+READ_TIME = metrics.histogram("memory.read")
+WRITE_TIME = metrics.histogram("memory.write")
+JOURNAL_TIME = metrics.histogram("memory.journal")
+ALLOCATE_FAILURES = metrics.counter("memory.allocate_failures")
+OCCUPIED_BLOCKS = metrics.gauge("memory.occupied_blocks")
+COMPACTION_TIME = metrics.histogram("memory.compaction")
 
 class MemoryBlock:
-    def __init__(self, block_id, size):
+    """Lekki widok na jeden wiersz tabeli BlockTable."""
+    __slots__ = ('table', 'block_id')
+
+    def __init__(self, table, block_id):
+        self.table = table
         self.block_id = block_id
-        self.size = size
-        self.allocated = False
-        self.process_id = None
-        self.timestamp = None
+
+    @property
+    def size(self):
+        return self.table.block_size
+
+    @property
+    def allocated(self):
+        return bool(self.table.allocated[self.block_id])
+
+    @property
+    def process_id(self):
+        return self.table.owner_of(self.block_id)
+
+    @property
+    def timestamp(self):
+        stamp = self.table.timestamps[self.block_id]
+        return datetime.fromtimestamp(stamp).isoformat() if stamp else None
+
+    @property
+    def data(self):
+        return self.table.data.get(self.block_id)
+
+    @data.setter
+    def data(self, value):
+        self.table.data[self.block_id] = value
+        self.table.dirty.mark(self.block_id, 1)
 
     def allocate(self, process_id):
-        self.allocated = True
-        self.process_id = process_id
-        self.timestamp = datetime.now().isoformat()
+        self.table.fill(self.block_id, 1, process_id)
 
     def deallocate(self):
-        self.allocated = False
-        self.process_id = None
-        self.timestamp = None
+        self.table.clear(self.block_id, 1)
 
     def to_dict(self):
         return {
@@ -29,75 +70,332 @@ class MemoryBlock:
             'timestamp': self.timestamp
         }
 
+class BlockTable:
+    """Kolumnowa tabela bloków: flagi, właściciele i znaczniki czasu w tablicach."""
+    NO_OWNER = -1
+
+    def __init__(self, count, block_size):
+        self.block_size = block_size
+        self.allocated = bytearray(count)
+        self.owners = array('q', [self.NO_OWNER]) * count
+        self.timestamps = array('d', bytes(8 * count))
+        # Dane zapisane do bloków (tylko bloki, do których coś zapisano)
+        self.data = {}
+        self.allocated_count = 0
+        # Identyfikatory procesów są internowane, żeby kolumna właścicieli była tablicą liczb
+        self._owner_slots = {}
+        self._owner_ids = []
+        # Zakresy są rozłączne, więc blokada chroni tylko wspólne liczniki
+        self._lock = threading.Lock()
+        # Strony wierszy zmienione od ostatniej migawki
+        self.dirty = snapshot.DirtyPages(snapshot.BLOCKS_PER_PAGE)
+
+    def __len__(self):
+        return len(self.allocated)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [MemoryBlock(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("block index out of range")
+        return MemoryBlock(self, index)
+
+    def __iter__(self):
+        return (MemoryBlock(self, i) for i in range(len(self)))
+
+    def owner_of(self, block_id):
+        slot = self.owners[block_id]
+        return None if slot == self.NO_OWNER else self._owner_ids[slot]
+
+    def _owner_slot(self, process_id):
+        slot = self._owner_slots.get(process_id)
+        if slot is None:
+            with self._lock:
+                slot = self._owner_slots.get(process_id)
+                if slot is None:
+                    slot = len(self._owner_ids)
+                    self._owner_ids.append(process_id)
+                    self._owner_slots[process_id] = slot
+        return slot
+
+    def fill(self, start, length, process_id):
+        """Oznacza zakres bloków jako przydzielony procesowi."""
+        stop = start + length
+        newly_allocated = length - self.allocated[start:stop].count(1)
+        with self._lock:
+            self.allocated_count += newly_allocated
+        self.allocated[start:stop] = b'\x01' * length
+        self.owners[start:stop] = array('q', [self._owner_slot(process_id)]) * length
+        self.timestamps[start:stop] = array('d', [time.time()]) * length
+        self.dirty.mark(start, length)
+
+    def clear(self, start, length):
+        """Zwalnia zakres bloków i zwraca bloki, z których usunięto dane."""
+        stop = start + length
+        released = self.allocated[start:stop].count(1)
+        with self._lock:
+            self.allocated_count -= released
+        self.allocated[start:stop] = bytes(length)
+        self.owners[start:stop] = array('q', [self.NO_OWNER]) * length
+        self.timestamps[start:stop] = array('d', bytes(8 * length))
+        self.dirty.mark(start, length)
+        data = self.data
+        if length < len(data):
+            written = [block_id for block_id in range(start, stop) if block_id in data]
+        else:
+            written = [block_id for block_id in list(data) if start <= block_id < stop]
+        for block_id in written:
+            data.pop(block_id, None)
+        return written
+
+    def move(self, source, target, length):
+        """Przenosi wiersze zakresu bloków niżej (target < source, zakresy mogą się nakładać); zwraca nowe id bloków z danymi."""
+        source_stop = source + length
+        target_stop = target + length
+        self.allocated[target:target_stop] = self.allocated[source:source_stop]
+        self.owners[target:target_stop] = self.owners[source:source_stop]
+        self.timestamps[target:target_stop] = self.timestamps[source:source_stop]
+        # Zwalniana jest tylko część źródła, której nie przykrył cel
+        vacated = max(source, target_stop)
+        self.allocated[vacated:source_stop] = bytes(source_stop - vacated)
+        self.owners[vacated:source_stop] = array('q', [self.NO_OWNER]) * (source_stop - vacated)
+        self.timestamps[vacated:source_stop] = array('d', bytes(8 * (source_stop - vacated)))
+        self.dirty.mark(target, source_stop - target)
+        data = self.data
+        # Rosnąco, żeby przy nakładaniu nie nadpisać danych, które jeszcze nie zostały przeniesione
+        if length < len(data):
+            written = [block_id for block_id in range(source, source_stop) if block_id in data]
+        else:
+            written = sorted(block_id for block_id in data if source <= block_id < source_stop)
+        moved = []
+        for block_id in written:
+            moved.append(block_id - source + target)
+            data[moved[-1]] = data.pop(block_id)
+        return moved
+
+    def first_unallocated(self, start, length):
+        """Zwraca pierwszy nieprzydzielony blok w zakresie albo None."""
+        index = self.allocated.find(0, start, start + length)
+        return None if index == -1 else index
+
 class MemoryManager:
-    def __init__(self, size=1024, block_size=1):
+    def __init__(self, size=1024, block_size=1, policy=FIRST_FIT, ram_device=None, arenas=1,
+                 hard_quota=None, soft_quota=None, memory_dir="data/memory"):
         self.total_size = size
         self.block_size = block_size
-        self.blocks = [MemoryBlock(i, block_size) for i in range(size // block_size)]
-        self.memory_dir = "data/memory"
+        self.blocks = BlockTable(size // block_size, block_size)
+        # Opcjonalna pamięć RAM (RamDevice): dane bloków jako bajty w obrazie mmap
+        self.ram = ram_device
+        if ram_device is not None and ram_device.size < len(self.blocks) * block_size:
+            raise ValueError("RAM device is smaller than the managed memory")
+        # Strony RAM zapisane od ostatniej migawki
+        self.dirty_ram = snapshot.DirtyPages(snapshot.PAGE_SIZE)
+        # Alokator bezpieczny wątkowo: areny z osobnymi blokadami i cache'e wątków
+        self.allocator = ConcurrentAllocator(len(self.blocks), arenas, policy)
+        # process_id -> list of (start, length) extents owned by the process
+        self.process_extents = {}
+        self._extents_lock = threading.Lock()
+        # Kompaktowanie w locie, gdy brakuje ciągłego obszaru (buddy nie pozwala wybrać miejsca)
+        self.compactor = None
+        if policy != BUDDY:
+            self.compactor = Compactor(self.allocator, self.process_extents, self._extents_lock, self._move_extent)
+        # Zużycie pamięci przez procesy i limity (w blokach)
+        self.accounting = Accounting(hard_quota, soft_quota)
+        # Katalog dziennika bloków (domyślnie wspólny z FilesLog)
+        self.memory_dir = memory_dir
         if not os.path.exists(self.memory_dir):
             os.makedirs(self.memory_dir)
+        self.journal = open_journal(self.memory_dir)
 
     def allocate(self, process_id, amount):
+        started = time.perf_counter() if metrics.enabled else None
         required_blocks = amount // self.block_size
         if amount % self.block_size != 0:
             required_blocks += 1
 
-        free_blocks = [block for block in self.blocks if not block.allocated]
-        if len(free_blocks) < required_blocks:
-            raise MemoryError("Not enough memory available")
+        if required_blocks == 0:
+            return range(0)
+        try:
+            self.accounting.reserve(process_id, required_blocks)
+            try:
+                if self.allocator.free_total < self.allocator.footprint(required_blocks):
+                    raise MemoryError("Not enough memory available")
+                start = self._allocate_extent(required_blocks)
+            except MemoryError:
+                self.accounting.cancel(process_id, required_blocks)
+                raise
+        except MemoryError:
+            if started is not None:
+                ALLOCATE_FAILURES.inc()
+            raise
+        self.accounting.commit(process_id, required_blocks)
+        with self._extents_lock:
+            # Wiersze i wpis w dzienniku muszą być gotowe, zanim Compactor zobaczy zakres i zdoła go przenieść
+            self.blocks.fill(start, required_blocks, process_id)
+            journal_started = time.perf_counter() if started is not None else None
+            self.journal.put(f"memory_block_{start}", {
+                'block_id': start,
+                'amount': required_blocks,
+                'process_id': process_id,
+                'created_at': time.time()
+            })
+            self.process_extents.setdefault(process_id, []).append((start, required_blocks))
+            if self.compactor is not None:
+                self.compactor.track(process_id, start, required_blocks)
+
+        if started is not None:
+            finished = time.perf_counter()
+            JOURNAL_TIME.record(finished - journal_started)
+            ALLOCATE_TIME.record(finished - started)
+            OCCUPIED_BLOCKS.set(self.blocks.allocated_count)
+        return range(start, start + required_blocks)
 
-        allocated_blocks = free_blocks[:required_blocks]
-        for block in allocated_blocks:
-            block.allocate(process_id)
-            self.save_block(block)
+    def _allocate_extent(self, length):
+        try:
+            return self.allocator.allocate(length)
+        except MemoryError:
+            # Enough free blocks, but scattered: compact until a large enough hole exists
+            if self.compactor is None:
+                raise
+            started = time.perf_counter() if metrics.enabled else None
+            compacted = self.compactor.compact(wanted=length)
+            if started is not None:
+                COMPACTION_TIME.record(time.perf_counter() - started)
+            if not compacted:
+                raise
+            return self.allocator.allocate(length)
 
-        return [block.block_id for block in allocated_blocks]
+    def _move_extent(self, process_id, source, target, length):
+        """Przenosi zakres przydzielony procesowi niżej, na target (wywoływane przez Compactor pod blokadą).
+
+        Zakresy mogą się nakładać; czyszczona jest tylko ta część starego
+        zakresu, której nie przykrył nowy.
+        """
+        moved = self.blocks.move(source, target, length)
+        if self.ram is not None:
+            block_size = self.block_size
+            vacated = max(source, target + length)
+            bulk_ops.memmove(self.ram.view, target * block_size, source * block_size, length * block_size)
+            self.ram.fill(vacated * block_size, (source + length - vacated) * block_size)
+            self.dirty_ram.mark(target * block_size, (source + length - target) * block_size)
+        self.delete_block(source)
+        self.journal.put(f"memory_block_{target}", {
+            'block_id': target,
+            'amount': length,
+            'process_id': process_id,
+            'created_at': self.blocks.timestamps[target]
+        })
+        for block_id in moved:
+            self.delete_block(block_id - target + source)
+            self.save_block(self.blocks[block_id])
+
+    def get_fragmentation(self):
+        """Zwraca największy wolny obszar, współczynnik fragmentacji i histogram wolnych obszarów."""
+        return {
+            'free_blocks': self.allocator.free_total,
+            'cached_blocks': self.allocator.cached_total,
+            'largest_free_extent': self.allocator.largest_free,
+            'fragmentation': self.allocator.fragmentation,
+            'free_extent_histogram': self.allocator.free_histogram()
+        }
+
+    def compact(self, budget=None):
+        """Wykonuje jeden ograniczony krok kompaktowania; zwraca liczbę przeniesionych bloków."""
+        return self.compactor.step(budget) if self.compactor is not None else 0
+
+    def add_relocation_listener(self, callback):
+        """Rejestruje callback(process_id, stary_start, nowy_start, długość) wywoływany po każdym przeniesieniu zakresu.
+
+        Zakres zwrócony przez allocate jest ważny do chwili, gdy kompaktowanie
+        go przeniesie; kto przechowuje adresy, śledzi przeniesienia tym callbackiem.
+        """
+        if self.compactor is not None:
+            self.compactor.add_listener(callback)
+
+    def remove_relocation_listener(self, callback):
+        """Wyrejestrowuje callback dodany przez add_relocation_listener."""
+        if self.compactor is not None:
+            self.compactor.remove_listener(callback)
 
     def deallocate(self, process_id):
-        for block in self.blocks:
-            if block.allocated and block.process_id == process_id:
-                block.deallocate()
-                self.delete_block(block.block_id)
+        started = time.perf_counter() if metrics.enabled else None
+        with self._extents_lock:
+            extents = self.process_extents.pop(process_id, ())
+            if self.compactor is not None:
+                for start, _ in extents:
+                    self.compactor.untrack(start)
+        for start, length in extents:
+            for block_id in self.blocks.clear(start, length):
+                self.delete_block(block_id)
+            self.delete_block(start)
+            if self.ram is not None:
+                self.ram.fill(start * self.block_size, length * self.block_size)
+                self.dirty_ram.mark(start * self.block_size, length * self.block_size)
+            self.allocator.free(start, length)
+        self.accounting.release(process_id, sum(length for _, length in extents))
+        if started is not None:
+            DEALLOCATE_TIME.record(time.perf_counter() - started)
+            OCCUPIED_BLOCKS.set(self.blocks.allocated_count)
 
     def write_memory(self, address, data):
+        started = time.perf_counter() if metrics.enabled else None
         if address < 0 or address >= len(self.blocks):
             raise ValueError("Invalid address")
         block = self.blocks[address]
         if not block.allocated:
             raise ValueError("Memory block is not allocated")
-        block.data = data
+        if self.ram is not None:
+            self._write_ram(address, data)
+        else:
+            block.data = data
         self.save_block(block)
+        if started is not None:
+            WRITE_TIME.record(time.perf_counter() - started)
+
+    def _write_ram(self, address, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        length = -(-len(data) // self.block_size)
+        if address + length > len(self.blocks):
+            raise ValueError("Data does not fit in memory")
+        unallocated = self.blocks.first_unallocated(address, length)
+        if unallocated is not None:
+            raise ValueError(f"Memory block at address {unallocated} is not allocated")
+        self.ram.write(address * self.block_size, data)
+        self.dirty_ram.mark(address * self.block_size, len(data))
 
     def read_memory(self, address, length):
+        started = time.perf_counter() if metrics.enabled else None
         if address < 0 or address + length > len(self.blocks):
             raise ValueError("Invalid address or length")
-        data = []
-        for i in range(address, address + length):
-            block = self.blocks[i]
-            if not block.allocated:
-                raise ValueError(f"Memory block at address {i} is not allocated")
-            data.append(block.data)
+        unallocated = self.blocks.first_unallocated(address, length)
+        if unallocated is not None:
+            raise ValueError(f"Memory block at address {unallocated} is not allocated")
+        if self.ram is not None:
+            data = self.ram.read(address * self.block_size, length * self.block_size)
+        else:
+            stored = self.blocks.data
+            data = [stored.get(i) for i in range(address, address + length)]
+        if started is not None:
+            READ_TIME.record(time.perf_counter() - started)
         return data
 
     def get_memory_status(self):
-        free_blocks = [block for block in self.blocks if not block.allocated]
-        occupied_blocks = [block for block in self.blocks if block.allocated]
+        # Wolne bloki według alokatora: buddy zajmuje więcej, niż proces zażądał
+        free_blocks = self.allocator.free_total
         return {
             'total_blocks': len(self.blocks),
-            'free_blocks': len(free_blocks),
-            'occupied_blocks': len(occupied_blocks)
+            'free_blocks': free_blocks,
+            'occupied_blocks': len(self.blocks) - free_blocks
         }
 
     def save_block(self, block):
-        block_file = os.path.join(self.memory_dir, f"memory_block_{block.block_id}.json")
-        with open(block_file, 'w') as f:
-            json.dump(block.to_dict(), f)
+        self.journal.put(f"memory_block_{block.block_id}", block.to_dict())
 
     def delete_block(self, block_id):
-        block_file = os.path.join(self.memory_dir, f"memory_block_{block_id}.json")
-        if os.path.exists(block_file):
-            os.remove(block_file)
+        self.journal.delete(f"memory_block_{block_id}")
 
 # Testowanie funkcji w memory.py
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""Counters, gauges and latency histograms for the hot paths.
+
+Instrumented code looks metrics up once (``ALLOCATIONS = metrics.counter(...)``)
+and guards the timing calls with ``if metrics.enabled:``, so a disabled
+registry costs one attribute lookup per operation. Collection is on unless
+the HSO_METRICS environment variable is "0"; `enable()` and `disable()`
+switch it at run time.
+
+Updates are not locked: under heavy thread contention a counter can lose
+an increment, which is accepted in exchange for the low overhead.
+"""
+import json
+import os
+import time
+
+enabled = os.environ.get("HSO_METRICS", "1") != "0"
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return {"type": self.kind, "value": self.value}
+
+    def reset(self):
+        self.value = 0
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {"type": self.kind, "value": self.value}
+
+    def reset(self):
+        self.value = 0
+
+
+def _bucket_index(value):
+    """Log-linear bucket for a non-negative int (about 3% relative error)."""
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_value(index):
+    """Middle of the value range covered by a bucket."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    low = (index - shift * SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class Histogram:
+    """HDR-style histogram of durations, recorded in nanoseconds.
+
+    Values below 64 ns are exact; above that every power of two is split
+    into 32 buckets, so percentiles are accurate to about 3% while the
+    histogram stays a few hundred integers in size.
+    """
+    kind = "histogram"
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1e9)
+        if value < 0:
+            value = 0
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Approximate value (seconds) below which `fraction` of the samples fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, fraction * self.count)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_value(index), self.max) / 1e9
+        return self.max / 1e9
+
+    def snapshot(self):
+        return {
+            "type": self.kind,
+            "count": self.count,
+            "mean": self.total / self.count / 1e9 if self.count else 0.0,
+            "max": self.max / 1e9,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "p999": self.percentile(0.999),
+        }
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+_metrics = {}
+_started = time.monotonic()
+_last_rates = (_started, {})
+
+
+def _get(name, cls):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = cls(name)
+    elif not isinstance(metric, cls):
+        raise TypeError(f"Metric '{name}' is a {metric.kind}, not a {cls.kind}")
+    return metric
+
+
+def counter(name):
+    return _get(name, Counter)
+
+
+def gauge(name):
+    return _get(name, Gauge)
+
+
+def histogram(name):
+    return _get(name, Histogram)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Zero every metric (they stay registered)."""
+    global _started, _last_rates
+    for metric in _metrics.values():
+        metric.reset()
+    _started = time.monotonic()
+    _last_rates = (_started, {})
+
+
+def snapshot():
+    """Return {name: values} for every metric."""
+    return {name: metric.snapshot() for name, metric in sorted(_metrics.items())}
+
+
+def rates():
+    """Per-second rate of every counter and histogram since the previous call."""
+    global _last_rates
+    now = time.monotonic()
+    since, previous = _last_rates
+    current = {}
+    for name, metric in _metrics.items():
+        if isinstance(metric, Counter):
+            current[name] = metric.value
+        elif isinstance(metric, Histogram):
+            current[name] = metric.count
+    elapsed = now - since
+    _last_rates = (now, current)
+    return {name: (value - previous.get(name, 0)) / elapsed if elapsed else 0.0
+            for name, value in sorted(current.items())}
+
+
+def export_json(indent=None):
+    return json.dumps({"enabled": enabled, "uptime": time.monotonic() - _started, "metrics": snapshot()},
+                      indent=indent)
+
+
+def export_text():
+    """Human-readable table: rates since the previous export, and percentiles in microseconds."""
+    per_second = rates()
+    lines = [f"Metrics ({'enabled' if enabled else 'disabled'}):"]
+    for name, values in snapshot().items():
+        if values["type"] == "histogram":
+            if not values["count"]:
+                continue
+            lines.append(f"{name:<36} n={values['count']:<9} {per_second[name]:>10.1f}/s  "
+                         f"p50={values['p50'] * 1e6:.1f}us p99={values['p99'] * 1e6:.1f}us "
+                         f"max={values['max'] * 1e6:.1f}us")
+        elif values["type"] == "counter":
+            lines.append(f"{name:<36} {values['value']:<11} {per_second[name]:>10.1f}/s")
+        else:
+            lines.append(f"{name:<36} {values['value']}")
+    return "\n".join(lines)
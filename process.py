@@ -1,8 +1,17 @@
+import cpu_scheduling
+
 class Process:
-    def __init__(self, pid, name):
+    def __init__(self, pid, name, burst_time=1, arrival_time=0, priority=0):
         self.pid = pid
         self.name = name
         self.state = "ready"
+        # Parametry symulacji szeregowania (czas symulowany)
+        self.burst_time = burst_time
+        self.arrival_time = arrival_time
+        self.priority = priority
+        self.remaining = burst_time
+        self.start_time = None
+        self.finish_time = None
 
     def __str__(self):
         return f"Process(pid={self.pid}, name={self.name}, state={self.state})"
@@ -12,10 +21,10 @@ class ProcessManager:
         self.processes = {}
         self.next_pid = 1
 
-    def create_process(self, name):
+    def create_process(self, name, burst_time=1, arrival_time=0, priority=0):
         pid = self.next_pid
         self.next_pid += 1
-        process = Process(pid, name)
+        process = Process(pid, name, burst_time, arrival_time, priority)
         self.processes[pid] = process
         return process
 
@@ -36,3 +45,10 @@ class ProcessManager:
             print(f"Process {pid} removed.")
         else:
             print(f"No process with pid {pid} found.")
+
+    def simulate(self, policy="round_robin", **options):
+        """Symuluje szeregowanie procesów (poza zatrzymanymi) wybraną polityką."""
+        if isinstance(policy, str):
+            policy = cpu_scheduling.POLICIES[policy](**options)
+        runnable = [process for process in self.processes.values() if process.state != "stopped"]
+        return cpu_scheduling.simulate(runnable, policy)
@@ -1,21 +1,84 @@
 import threading
+from collections import OrderedDict
+from scheduler import Scheduler, CancellationToken, accepts_token
+
+class ProcessEntry:
+    def __init__(self, future, token, priority):
+        self.future = future
+        self.token = token
+        self.priority = priority
 
 class ProcessManager:
-    def __init__(self):
+    """Tabela procesów uruchamianych w Scheduler.
+
+    Wątki robocze są wątkami demona: procesy, które nie skończyły się przed
+    wyjściem z interpretera, przepadają bez ostrzeżenia. Żeby poczekać na
+    wszystkie zakolejkowane procesy, trzeba wywołać shutdown().
+
+    Procesy kończą się na wątkach roboczych, więc tabela procesów i lista
+    zakończonych są chronione blokadą menedżera.
+    """
+
+    def __init__(self, workers=4, process_workers=0, finished_limit=1024):
         self.processes = {}
+        # Zakończone procesy (ostatnie finished_limit), żeby join() mógł zwrócić ich wynik
+        self.finished = OrderedDict()
+        self.finished_limit = finished_limit
+        self._lock = threading.Lock()
+        self.scheduler = Scheduler(workers, process_workers)
 
-    def start_process(self, process_id, process_function, *args):
-        if process_id in self.processes:
+    def start_process(self, process_id, process_function, *args, priority=0, cpu_bound=False):
+        with self._lock:
+            running = self.processes.get(process_id)
+            if running is None:
+                token = CancellationToken()
+                kwargs = {}
+                if not cpu_bound and accepts_token(process_function):
+                    # Funkcja procesu może sprawdzać token, żeby zakończyć się na żądanie
+                    kwargs['cancel_token'] = token
+                future = self.scheduler.submit(process_function, args, kwargs, priority, cpu_bound)
+                entry = ProcessEntry(future, token, priority)
+                self.processes[process_id] = entry
+        if running is not None:
             print(f"Process {process_id} already running.")
-        else:
-            process_thread = threading.Thread(target=process_function, args=args)
-            self.processes[process_id] = process_thread
-            process_thread.start()
-            print(f"Process {process_id} started.")
+            return running.future
+        # Poza blokadą: dla już zakończonego future callback wywoła się od razu
+        future.add_done_callback(lambda _: self._reap(process_id, entry))
+        print(f"Process {process_id} started.")
+        return future
+
+    def _reap(self, process_id, entry):
+        """Przenosi zakończony proces z tabeli procesów do zakończonych (wywoływane na wątku roboczym)."""
+        with self._lock:
+            if self.processes.get(process_id) is entry:
+                del self.processes[process_id]
+                self.finished.pop(process_id, None)
+                self.finished[process_id] = entry
+                if len(self.finished) > self.finished_limit:
+                    self.finished.popitem(last=False)
 
     def stop_process(self, process_id):
-        if process_id in self.processes:
-            # This is a simplified approach. To stop a thread, you would need to use a proper mechanism.
-            print(f"Stopping process {process_id} is not implemented in this simple version.")
-        else:
+        with self._lock:
+            entry = self.processes.get(process_id)
+        if entry is None:
             print(f"Process {process_id} not found.")
+            return
+        entry.token.cancel()
+        entry.future.cancel()
+        print(f"Process {process_id} stopped.")
+
+    def join(self, process_id, timeout=None):
+        """Czeka na zakończenie procesu i zwraca jego wynik (albo zgłasza jego wyjątek).
+
+        Działa też dla procesów już zakończonych; dla nieznanego id zgłasza KeyError.
+        """
+        with self._lock:
+            entry = self.processes.get(process_id)
+            if entry is None:
+                entry = self.finished.get(process_id)
+        if entry is None:
+            raise KeyError(f"Unknown process: {process_id}")
+        return entry.future.result(timeout)
+
+    def shutdown(self, wait=True):
+        self.scheduler.shutdown(wait)
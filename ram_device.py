@@ -0,0 +1,88 @@
+import mmap
+import os
+
+PAGE_SIZE = 4096
+
+
+class RamDevice:
+    """Byte-addressable simulated RAM backed by a memory-mapped image file.
+
+    The image is a plain file of `pages * page_size` bytes. Reopening an
+    existing image maps it as-is, so the contents survive restarts without
+    any deserialization. Reads return memoryview slices of the mapping.
+    """
+
+    def __init__(self, path, pages=None, page_size=PAGE_SIZE):
+        self.path = path
+        self.page_size = page_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        exists = os.path.isfile(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        current_size = os.fstat(self._file.fileno()).st_size
+        if pages is None:
+            pages = max(1, -(-current_size // page_size))
+        self.pages = pages
+        self.size = pages * page_size
+        if current_size != self.size:
+            self._file.truncate(self.size)
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        self.view = memoryview(self._map)
+
+    def _check_range(self, address, length):
+        if address < 0 or length < 0 or address + length > self.size:
+            raise ValueError("Invalid address or length")
+
+    def read(self, address, length):
+        """Return a zero-copy view of `length` bytes starting at `address`.
+
+        The view points into the mapping: copy it with bytes() if it has to
+        outlive the device, and release it when done so `close` can unmap.
+        """
+        self._check_range(address, length)
+        return self.view[address:address + length]
+
+    def write(self, address, data):
+        """Copy a bytes-like object into RAM at `address`."""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        self._check_range(address, len(data))
+        self.view[address:address + len(data)] = data
+
+    def fill(self, address, length, value=0):
+        """Set `length` bytes starting at `address` to `value`."""
+        self._check_range(address, length)
+        self.view[address:address + length] = bytes([value]) * length
+
+    def page(self, page_number):
+        """Return a view of a whole page."""
+        return self.read(page_number * self.page_size, self.page_size)
+
+    def flush(self):
+        """Write dirty pages back to the image file."""
+        self._map.flush()
+
+    def close(self):
+        """Flush and unmap the image.
+
+        While views returned by `read` or `page` are still alive the mapping
+        can not be unmapped; it is then unmapped when the last view is gone.
+        The data is flushed either way.
+        """
+        if self._map.closed:
+            return
+        self.view.release()
+        self._map.flush()
+        self._file.close()
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
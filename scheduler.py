@@ -0,0 +1,123 @@
+import heapq
+import inspect
+import itertools
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+class ProcessCancelled(Exception):
+    """Raised by CancellationToken.raise_if_cancelled()."""
+
+
+class CancellationToken:
+    """Cooperative cancellation flag passed to process functions."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise ProcessCancelled()
+
+    def wait(self, timeout=None):
+        """Sleep up to `timeout` seconds; return True if cancelled meanwhile."""
+        return self._event.wait(timeout)
+
+
+def accepts_token(function):
+    """Check whether a function takes a `cancel_token` keyword argument."""
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'cancel_token' in parameters or any(
+        parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values())
+
+
+class Scheduler:
+    """Bounded worker pool with a priority run queue.
+
+    Tasks with a lower priority value run first; tasks with equal priority
+    run in submission order. Worker threads are started on demand up to
+    `workers`. CPU-bound tasks can be sent to a process pool of
+    `process_workers` processes instead.
+
+    Workers are daemon threads, so tasks still queued or running when the
+    interpreter exits are dropped; call `shutdown()` (wait=True) first to
+    drain the queue.
+    """
+
+    def __init__(self, workers=4, process_workers=0):
+        self.max_workers = workers
+        self.process_workers = process_workers
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._idle = 0
+        self._shutdown = False
+        self._process_pool = None
+
+    def submit(self, function, args=(), kwargs=None, priority=0, cpu_bound=False):
+        """Queue a task and return a Future for its result."""
+        kwargs = kwargs or {}
+        if cpu_bound and self.process_workers:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(self.process_workers)
+            return self._process_pool.submit(function, *args, **kwargs)
+
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            heapq.heappush(self._queue, (priority, next(self._sequence), future, function, args, kwargs))
+            if self._idle == 0 and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            else:
+                self._condition.notify()
+        return future
+
+    def pending(self):
+        """Number of tasks waiting in the run queue."""
+        with self._condition:
+            return len(self._queue)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._queue and not self._shutdown:
+                    self._condition.wait()
+                self._idle -= 1
+                if not self._queue:
+                    return
+                _, _, future, function, args, kwargs = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait=True):
+        """Stop accepting tasks; workers exit once the queue is drained."""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
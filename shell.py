@@ -1,56 +1,105 @@
 import os
+import io
+import sys
 import json
+import time
+import argparse
 import platform
 import datetime
+import contextlib
+import metrics
+from credentials import Credentials
+from events import EventChannel, render
 from files_log import FilesLog
 from kernel import Kernel
 
 class Shell:
     def __init__(self, kernel):
         self.kernel = kernel
+        # Shell is the presentation layer: it renders the kernel's events
+        self.events = EventChannel(self.render_event)
+        self.kernel.events = self.events
         self.files_log = FilesLog()
+        self.credentials = Credentials(self.files_log)
+        self.commands = {}
+        self._register_builtin_commands()
+
+    def render_event(self, name, fields):
+        print(render(name, fields))
+
+    def set_quiet(self, quiet=True):
+        """In quiet mode kernel events are dropped without being formatted."""
+        self.events.handlers = [] if quiet else [self.render_event]
+
+    def register(self, name, handler):
+        """Registers a command; the handler gets the list of arguments."""
+        self.commands[name] = handler
+
+    def _register_builtin_commands(self):
+        self.register("allocate", self.allocate_memory)
+        self.register("deallocate", self.deallocate_memory)
+        self.register("write", self.write_memory)
+        self.register("read", self.read_memory)
+        self.register("mem", lambda args: self.kernel.display_memory_status())
+        self.register("ver", lambda args: print(f"Simulated OS Version: {self.kernel.version}"))
+        self.register("compt", lambda args: self.display_computer_info())
+        self.register("help", lambda args: self.display_help())
+        self.register("settings", lambda args: self.change_settings())
+        self.register("update_kernel", self.update_kernel)
+        self.register("time", lambda args: self.display_time())
+        self.register("date", lambda args: self.display_date())
+        self.register("stats", self.display_stats)
+        self.register("snapshot", self.snapshot)
+        self.register("snakeexit (NOT SNAKE GAME)", lambda args: self.run_snake_game())
+
+    def execute(self, line):
+        """Runs one command line; returns False for `exit`."""
+        command = line.strip().split()
+        if not command:
+            return True
+
+        cmd = command[0]
+        args = command[1:]
+
+        if cmd == "exit":
+            return False
+        handler = self.commands.get(cmd)
+        if handler is None:
+            print("Unknown command")
+        else:
+            handler(args)
+        return True
 
     def start(self):
         self.login()
         print("Welcome to the simulated OS!")
-        while True:
-            command = input(">> ").strip().split()
-            if not command:
-                continue
+        while self.execute(input(">> ")):
+            pass
 
-            cmd = command[0]
-            args = command[1:]
+    def run_script(self, stream, output=None):
+        """Runs commands from a stream without prompts and returns timing statistics.
 
-            if cmd == "exit":
-                break
-            elif cmd == "allocate":
-                self.allocate_memory(args)
-            elif cmd == "deallocate":
-                self.deallocate_memory(args)
-            elif cmd == "write":
-                self.write_memory(args)
-            elif cmd == "read":
-                self.read_memory(args)
-            elif cmd == "mem":
-                self.kernel.display_memory_status()
-            elif cmd == "ver":
-                print(f"Simulated OS Version: {self.kernel.version}")
-            elif cmd == "compt":
-                self.display_computer_info()
-            elif cmd == "help":
-                self.display_help()
-            elif cmd == "settings":
-                self.change_settings()
-            elif cmd == "update_kernel":
-                self.update_kernel(args)
-            elif cmd == "time":
-                self.display_time()
-            elif cmd == "date":
-                self.display_date()
-            elif cmd == "snakeexit (NOT SNAKE GAME)":
-                self.run_snake_game()
-            else:
-                print("Unknown command")
+        Command output is collected in a buffer and written to `output`
+        (stdout by default) once the script ends. Empty lines and lines
+        starting with '#' are skipped.
+        """
+        output = output or sys.stdout
+        buffer = io.StringIO()
+        latencies = {}
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(buffer):
+            for line in stream:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                command_started = time.perf_counter()
+                running = self.execute(line)
+                latencies.setdefault(line.split()[0], []).append(time.perf_counter() - command_started)
+                if not running:
+                    break
+        elapsed = time.perf_counter() - started
+        output.write(buffer.getvalue())
+        return script_stats(latencies, elapsed)
 
     def allocate_memory(self, args):
         if len(args) < 2:
@@ -95,6 +144,27 @@ class Shell:
             except ValueError:
                 print("Invalid address or length")
 
+    def display_stats(self, args):
+        """Shows metrics: rates since the last `stats`, latency percentiles (`stats json|reset|on|off`)."""
+        option = args[0] if args else ""
+        if option == "json":
+            print(metrics.export_json(indent=2))
+        elif option == "reset":
+            metrics.reset()
+            print("Metrics reset")
+        elif option in ("on", "off"):
+            metrics.enable() if option == "on" else metrics.disable()
+            print(f"Metrics {'enabled' if metrics.enabled else 'disabled'}")
+        else:
+            print(metrics.export_text())
+
+    def snapshot(self, args):
+        """Saves an incremental snapshot of the kernel (`snapshot restore` loads the latest one)."""
+        if args and args[0] == "restore":
+            self.kernel.restore_snapshot()
+        else:
+            self.kernel.take_snapshot()
+
     def display_computer_info(self):
         print("Computer Information:")
         print(f"System: {platform.system()}")
@@ -118,6 +188,8 @@ class Shell:
         print("update_kernel <new_version> - Update the kernel version")
         print("time - Display current time")
         print("date - Display current date")
+        print("stats [json|reset|on|off] - Display performance metrics")
+        print("snapshot [restore] - Save a snapshot of the system (or restore the latest one)")
         print("snake - Play the Snake game")
         print("exit - Exit the shell")
 
@@ -152,18 +224,68 @@ class Shell:
             if user_data is None:
                 print("User not found. Creating new user.")
                 password = input("Create a password: ").strip()
-                self.files_log.save_user(username, password)
+                self.credentials.register(username, password)
                 print("User created successfully. Please log in.")
                 continue
             
             password = input("Password: ").strip()
-            if user_data['password'] == password:
+            if self.credentials.verify(username, password):
                 print(f"Welcome, {username}!")
                 break
             else:
                 print("Incorrect Password. Please try again.")
 
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def script_stats(latencies, elapsed):
+    """Builds the run_script report from per-command latencies (seconds)."""
+    def summarize(values):
+        ordered = sorted(values)
+        return {
+            'count': len(ordered),
+            'p50_ms': _percentile(ordered, 0.50) * 1000,
+            'p95_ms': _percentile(ordered, 0.95) * 1000,
+            'p99_ms': _percentile(ordered, 0.99) * 1000
+        }
+
+    every = [value for values in latencies.values() for value in values]
+    stats = {
+        'commands': len(every),
+        'seconds': elapsed,
+        'commands_per_second': len(every) / elapsed if elapsed else 0.0,
+        'by_command': {name: summarize(values) for name, values in sorted(latencies.items())}
+    }
+    if every:
+        stats.update(summarize(every))
+    return stats
+
+
+def format_script_stats(stats):
+    lines = [f"{stats['commands']} commands in {stats['seconds']:.3f} s ({stats['commands_per_second']:,.0f} commands/s)"]
+    for name, command in [('all', stats)] + list(stats['by_command'].items()):
+        if command.get('count'):
+            lines.append(f"  {name:<14} n={command['count']:<8} p50={command['p50_ms']:.3f} ms  "
+                         f"p95={command['p95_ms']:.3f} ms  p99={command['p99_ms']:.3f} ms")
+    return "\n".join(lines)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated OS shell")
+    parser.add_argument("--script", help="run commands from a file ('-' for stdin) without logging in")
+    parser.add_argument("--quiet", action="store_true", help="do not render kernel output")
+    options = parser.parse_args()
+
     kernel = Kernel()
     shell = Shell(kernel)
-    shell.start()
+    shell.set_quiet(options.quiet)
+    if options.script:
+        if options.script == "-":
+            stats = shell.run_script(sys.stdin)
+        else:
+            with open(options.script, 'r') as script:
+                stats = shell.run_script(script)
+        print(format_script_stats(stats), file=sys.stderr)
+    else:
+        shell.start()
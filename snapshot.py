@@ -0,0 +1,740 @@
+"""Incremental binary snapshots of Kernel and Core state.
+
+A snapshot file starts with the header ``<8sHH`` (magic ``HSOSNAPS``,
+format version, reserved) and holds a chain of generations. Every
+generation is one zlib-compressed frame, ``<IIQd`` (payload length, CRC-32
+of the payload, generation number, timestamp) followed by the payload.
+
+State is captured as sections: {name: {key: bytes}}. Byte buffers (RAM,
+block table columns) are cut into fixed pages, cell lists and block data
+into pages of rows and records (process extents, journal entries, file
+metadata) into hash buckets, so a change only touches the entries it
+lands in. Cells and records are JSON with type tags for the values JSON
+has no type for (bytes, tuples, sets, dicts with non-string keys), so
+they come back as they were written. Each generation stores the entries
+whose digest changed since the previous one and the keys that
+disappeared; a value given as a callable is known not to have changed
+(content-addressed file chunks, pages no write touched) and is only
+loaded and written when its key is not in the previous generation. When
+the chain grows past `compact_ratio` times the live state, the file is
+rewritten as a single full generation.
+
+Kernel and Core mark the pages every write touches in DirtyPages
+trackers and the journal keeps a feed of changed keys (see Changes), so
+a snapshot encodes and hashes only the pages and buckets changed since
+the previous one. The small per-process sections (meta, extents,
+accounting) and the file tree are encoded whole every time.
+
+Restoring reads the file once, applies the generations in order and bulk
+loads the result: slice assignment for memory, ``frombytes`` for the
+block table and lazily registered chunks for the file system. A torn
+last frame left by a crash is dropped.
+"""
+import base64
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from functools import partial
+import metrics
+from accounting import Accounting
+from chunk_store import ChunkStore, chunk_digest
+from concurrent_allocator import ConcurrentAllocator
+from extent_allocator import BUDDY
+from file_system import DirectoryNode, FileNode
+
+MAGIC = b'HSOSNAPS'
+VERSION = 1
+HEADER = struct.Struct('<8sHH')
+FRAME = struct.Struct('<IIQd')
+SECTION = struct.Struct('<HII')     # name length, puts, deletes
+ENTRY = struct.Struct('<HI16s')     # key length, value length, digest
+KEY = struct.Struct('<H')
+
+PAGE_SIZE = 4096
+CELLS_PER_PAGE = 256
+# Block table rows per page of the core.* column and data sections
+BLOCKS_PER_PAGE = 512
+BUCKETS = 256
+# Digest stored for immutable entries, which are never compared
+IMMUTABLE = bytes(16)
+
+WRITE_TIME = metrics.histogram("snapshot.write")
+RESTORE_TIME = metrics.histogram("snapshot.restore")
+BYTES_WRITTEN = metrics.counter("snapshot.bytes_written")
+
+
+class DirtyPages:
+    """Numbers of the pages of one buffer written since the last snapshot.
+
+    The owner calls `mark` for every write, with offsets in the units the
+    buffer is paged in. Until the first `take`, and after `mark_all`,
+    every page counts as dirty (None).
+    """
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self._pages = None
+        self._lock = threading.Lock()
+
+    def mark(self, start, length):
+        if length <= 0:
+            return
+        with self._lock:
+            if self._pages is not None:
+                self._pages.update(range(start // self.page_size, (start + length - 1) // self.page_size + 1))
+
+    def mark_all(self):
+        with self._lock:
+            self._pages = None
+
+    def clear(self):
+        with self._lock:
+            self._pages = set()
+
+    def take(self):
+        """Return the dirty pages (None for all of them) and start counting afresh."""
+        with self._lock:
+            pages, self._pages = self._pages, set()
+        return pages
+
+    def put_back(self, pages):
+        """Mark pages handed out by `take` dirty again (the snapshot was not written)."""
+        with self._lock:
+            if pages is None or self._pages is None:
+                self._pages = None
+            else:
+                self._pages |= pages
+
+
+class Changes:
+    """What changed in one state since its last snapshot.
+
+    `pages` maps a name to the DirtyPages tracker of a paged section and
+    `journal` is the BlockJournal whose change feed tells which records
+    were put or deleted. `take` returns ({name: pages, "journal": keys},
+    position), None meaning everything; `commit(position)` is called once
+    the snapshot was written, `put_back` when it was not. `reset` makes
+    everything dirty (another snapshot file), `clear` nothing (the state
+    was just restored from the snapshot).
+    """
+
+    def __init__(self, journal, **pages):
+        self.journal = journal
+        self.pages = pages
+        self._position = None
+
+    def take(self):
+        keys, position = self.journal.changes_since(self._position)
+        dirty = {name: tracker.take() for name, tracker in self.pages.items()}
+        dirty["journal"] = keys
+        return dirty, position
+
+    def commit(self, position):
+        self._position = position
+
+    def put_back(self, dirty):
+        for name, tracker in self.pages.items():
+            tracker.put_back(dirty[name])
+
+    def reset(self):
+        for tracker in self.pages.values():
+            tracker.mark_all()
+        self._position = None
+
+    def clear(self):
+        for tracker in self.pages.values():
+            tracker.clear()
+        self._position = self.journal.changes_since(None)[1]
+
+
+class SnapshotFile:
+    """A chain of snapshot generations in one file."""
+
+    def __init__(self, path, compact_ratio=2.0, level=1, fsync=False):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.level = level
+        self.fsync = fsync
+        self.generation = 0
+        self.timestamp = None
+        # section -> {key: (digest, size)} of the latest generation, read on first use
+        self._index = None
+        # Uncompressed size of every generation in the file
+        self._chain_bytes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def load(self):
+        """Read the chain and return the latest state as {section: {key: bytes}}."""
+        index = {}
+        sections = {}
+        self.generation = 0
+        self.timestamp = None
+        self._chain_bytes = 0
+        if not self.exists():
+            self._index = index
+            return sections
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        magic, version, _ = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in {self.path}")
+
+        offset = valid = HEADER.size
+        while offset + FRAME.size <= len(data):
+            length, checksum, generation, timestamp = FRAME.unpack_from(data, offset)
+            start = offset + FRAME.size
+            end = start + length
+            if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+                break
+            payload = zlib.decompress(data[start:end])
+            self._chain_bytes += len(payload)
+            _apply(payload, sections, index)
+            self.generation = generation
+            self.timestamp = timestamp
+            offset = valid = end
+        if valid != len(data):
+            # The last generation was cut off mid-write
+            with open(self.path, 'r+b') as file:
+                file.truncate(valid)
+        self._index = index
+        return sections
+
+    def write(self, sections, full=False):
+        """Append a generation with the entries that changed since the previous one."""
+        started = time.perf_counter() if metrics.enabled else None
+        if self._index is None:
+            self.load()
+        full = full or not self.exists()
+        payload, index, written, deleted = _encode(sections, {} if full else self._index)
+        live_bytes = sum(size for entries in index.values() for _, size in entries.values())
+        if not full and self._chain_bytes + len(payload) > self.compact_ratio * max(live_bytes, PAGE_SIZE):
+            # Compact the chain: one generation with every live entry
+            full = True
+            payload, index, written, deleted = _encode(sections, {})
+
+        self.generation += 1
+        self.timestamp = time.time()
+        compressed = zlib.compress(payload, self.level)
+        frame = FRAME.pack(len(compressed), zlib.crc32(compressed), self.generation, self.timestamp) + compressed
+        if full:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, VERSION, 0))
+                file.write(frame)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+            self._chain_bytes = len(payload)
+        else:
+            with open(self.path, 'ab') as file:
+                file.write(frame)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            self._chain_bytes += len(payload)
+        self._index = index
+
+        if started is not None:
+            WRITE_TIME.record(time.perf_counter() - started)
+            BYTES_WRITTEN.inc(len(frame))
+        return {
+            "generation": self.generation,
+            "full": full,
+            "written": written,
+            "deleted": deleted,
+            "bytes": len(frame)
+        }
+
+
+def _encode(sections, previous):
+    """Serialize the entries of `sections` that differ from `previous`; return (payload, index, puts, deletes)."""
+    parts = []
+    index = {}
+    written = deleted = 0
+    for name in list(sections) + [name for name in previous if name not in sections]:
+        entries = sections.get(name, {})
+        old = previous.get(name, {})
+        current = index[name] = {}
+        puts = []
+        for key, value in entries.items():
+            known = old.get(key)
+            if callable(value):
+                if known is not None:
+                    current[key] = known
+                    continue
+                value = value()
+                digest = IMMUTABLE
+            else:
+                digest = chunk_digest(value)
+                if known is not None and known[0] == digest:
+                    current[key] = known
+                    continue
+            puts.append((key, value, digest))
+            current[key] = (digest, len(value))
+        deletes = [key for key in old if key not in entries]
+        if not puts and not deletes:
+            continue
+        encoded = name.encode('utf-8')
+        parts.append(SECTION.pack(len(encoded), len(puts), len(deletes)))
+        parts.append(encoded)
+        for key, value, digest in puts:
+            parts.append(ENTRY.pack(len(key), len(value), digest))
+            parts.append(key)
+            parts.append(value)
+        for key in deletes:
+            parts.append(KEY.pack(len(key)))
+            parts.append(key)
+        written += len(puts)
+        deleted += len(deletes)
+    return b''.join(parts), index, written, deleted
+
+
+def _apply(payload, sections, index):
+    """Apply one decoded generation to the state and its digest index."""
+    offset = 0
+    while offset < len(payload):
+        name_length, puts, deletes = SECTION.unpack_from(payload, offset)
+        offset += SECTION.size
+        name = payload[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+        entries = sections.setdefault(name, {})
+        digests = index.setdefault(name, {})
+        for _ in range(puts):
+            key_length, value_length, digest = ENTRY.unpack_from(payload, offset)
+            offset += ENTRY.size
+            key = payload[offset:offset + key_length]
+            offset += key_length
+            entries[key] = payload[offset:offset + value_length]
+            digests[key] = (digest, value_length)
+            offset += value_length
+        for _ in range(deletes):
+            key_length, = KEY.unpack_from(payload, offset)
+            offset += KEY.size
+            key = payload[offset:offset + key_length]
+            offset += key_length
+            entries.pop(key, None)
+            digests.pop(key, None)
+
+
+# Section encodings
+
+def _json(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _pid(value):
+    """JSON turns tuple process ids into lists; make them hashable again."""
+    return tuple(_pid(item) for item in value) if isinstance(value, list) else value
+
+
+_PLAIN = (type(None), bool, int, float, str)
+_MISSING = object()
+
+_TAGS = {
+    "$bytes": lambda value: base64.b64decode(value),
+    "$bytearray": lambda value: bytearray(base64.b64decode(value)),
+    "$tuple": lambda value: tuple(_untag(item) for item in value),
+    "$set": lambda value: set(_untag(item) for item in value),
+    "$frozenset": lambda value: frozenset(_untag(item) for item in value),
+    "$dict": lambda value: {_untag(key): _untag(item) for key, item in value},
+}
+
+
+def _tag(value):
+    """A JSON-serializable form of `value`: types JSON has no type for become {"$tag": ...}."""
+    kind = type(value)
+    if kind in _PLAIN:
+        return value
+    if kind is list:
+        return [_tag(item) for item in value]
+    if kind is tuple:
+        return {"$tuple": [_tag(item) for item in value]}
+    if kind is bytes or kind is bytearray or kind is memoryview:
+        tag = "$bytearray" if kind is bytearray else "$bytes"
+        return {tag: base64.b64encode(value).decode('ascii')}
+    if kind is set or kind is frozenset:
+        return {"$" + kind.__name__: [_tag(item) for item in value]}
+    if kind is dict:
+        if all(type(key) is str for key in value) and not (len(value) == 1 and next(iter(value)) in _TAGS):
+            return {key: _tag(item) for key, item in value.items()}
+        return {"$dict": [[_tag(key), _tag(item)] for key, item in value.items()]}
+    raise TypeError(f"Cannot snapshot a value of type {kind.__name__}")
+
+
+def _untag(value):
+    """Reverse `_tag` on a decoded JSON value."""
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (tag, item), = value.items()
+            decode = _TAGS.get(tag)
+            if decode is not None:
+                return decode(item)
+        return {key: _untag(item) for key, item in value.items()}
+    return value
+
+
+def _tagged_json(value):
+    return _json(_tag(value))
+
+
+def _pairs_json(pairs):
+    return _json([[_tag(key), _tag(value)] for key, value in pairs])
+
+
+def _row_pairs(records, first, last):
+    """The (row, value) pairs of `records` for rows first..last-1 (a row may be removed meanwhile)."""
+    pairs = []
+    for row in range(first, last):
+        value = records.get(row, _MISSING)
+        if value is not _MISSING:
+            pairs.append((row, value))
+    return pairs
+
+
+def bucket_of(key, buckets=BUCKETS):
+    """The hash bucket `record_buckets` puts `key` in."""
+    if type(key) is int:
+        return key % buckets
+    data = key.encode('utf-8', 'surrogatepass') if type(key) is str else _tagged_json(key)
+    return zlib.crc32(data) % buckets
+
+
+def byte_pages(buffer, page_size=PAGE_SIZE, dirty=None):
+    """Cut a bytes-like buffer into {page key: memoryview} pages.
+
+    With a `dirty` set of page numbers the other pages are given as
+    callables, which SnapshotFile keeps from the previous generation
+    without hashing them.
+    """
+    view = memoryview(buffer).cast('B')
+    pages = {}
+    for offset in range(0, len(view), page_size):
+        number = offset // page_size
+        page = view[offset:offset + page_size]
+        pages[b'%d' % number] = page if dirty is None or number in dirty else (lambda page=page: page)
+    return pages
+
+
+def cell_pages(cells, per_page=CELLS_PER_PAGE, dirty=None):
+    """Cut a list of cells into tagged JSON pages; `dirty` as in byte_pages."""
+    pages = {}
+    for offset in range(0, len(cells), per_page):
+        number = offset // per_page
+        page = cells[offset:offset + per_page]
+        pages[b'%d' % number] = _tagged_json(page) if dirty is None or number in dirty else partial(_tagged_json, page)
+    return pages
+
+
+def row_pages(records, rows, per_page=BLOCKS_PER_PAGE, dirty=None):
+    """Page a {row: value} dict of a table with `rows` rows: each page a JSON list of [row, value] pairs."""
+    pages = {}
+    for first in range(0, rows, per_page):
+        number = first // per_page
+        last = min(first + per_page, rows)
+        if dirty is None or number in dirty:
+            pages[b'%d' % number] = _pairs_json(_row_pairs(records, first, last))
+        else:
+            pages[b'%d' % number] = lambda first=first, last=last: _pairs_json(_row_pairs(records, first, last))
+    return pages
+
+
+def record_buckets(pairs, buckets=BUCKETS, dirty=None):
+    """Spread (key, value) pairs over hash buckets, each a tagged JSON list of pairs; `dirty` as in byte_pages."""
+    grouped = {}
+    for key, value in pairs:
+        grouped.setdefault(bucket_of(key, buckets), []).append((key, value))
+    return {b'%d' % bucket: _pairs_json(items) if dirty is None or bucket in dirty else partial(_pairs_json, items)
+            for bucket, items in grouped.items()}
+
+
+def join_pages(section):
+    return b''.join(section[key] for key in sorted(section, key=int))
+
+
+def join_cells(section):
+    cells = []
+    for key in sorted(section, key=int):
+        cells.extend(_untag(json.loads(section[key])))
+    return cells
+
+
+def join_records(section):
+    """The (key, value) pairs of record buckets or row pages."""
+    return [(_pid(_untag(key)), _untag(value)) for bucket in section.values() for key, value in json.loads(bucket)]
+
+
+def _buffer_data(target, section):
+    """The joined pages of `section`, checked against the size of `target` before anything is restored."""
+    data = join_pages(section)
+    if len(data) != memoryview(target).nbytes:
+        raise ValueError("Snapshot does not match the memory size")
+    return data
+
+
+def _report_moves(compactor, previous, extents):
+    """Tell relocation listeners about live extents that the restored state puts at other addresses."""
+    for process_id, ranges in extents.items():
+        old_ranges = previous.get(process_id)
+        if old_ranges is None or len(old_ranges) != len(ranges):
+            continue
+        for (source, old_length), (target, length) in zip(old_ranges, ranges):
+            if source != target and old_length == length:
+                compactor.notify(process_id, source, target, length)
+
+
+def _rebuild_allocator(allocator, extents):
+    """A fresh allocator of the same shape with every extent in `extents` reserved."""
+    policy = allocator.arenas[0].allocator.policy
+    if policy == BUDDY:
+        raise ValueError("Restoring a snapshot is not supported with the buddy policy")
+    rebuilt = ConcurrentAllocator(allocator.total, len(allocator.arenas), policy,
+                                  allocator.small_size, allocator.batch, allocator.cache_limit)
+    for ranges in extents.values():
+        for start, length in ranges:
+            rebuilt.reserve(start, length)
+    return rebuilt
+
+
+def _restore_accounting(section, meta):
+    accounting = Accounting(meta["hard_quota"], meta["soft_quota"])
+    accounting.load([(process_id, *values) for process_id, values in join_records(section)])
+    return accounting
+
+
+def _capture_accounting(accounting):
+    return record_buckets((row[0], row[1:]) for row in accounting.export())
+
+
+def capture_journal(journal, changed=None):
+    """Journal records in buckets; with a set of `changed` keys only their buckets are encoded."""
+    dirty = None if changed is None else {bucket_of(key) for key in changed}
+    return record_buckets(journal.items(), dirty=dirty)
+
+
+def capture_file_system(file_system):
+    """File metadata in buckets by path and file chunks keyed by digest."""
+    store = file_system.chunks
+    entries = []
+    chunks = {}
+    stack = [('', file_system.root)]
+    while stack:
+        path, node = stack.pop()
+        for name, child in node.children.items():
+            child_path = f"{path}/{name}" if path else name
+            if isinstance(child, DirectoryNode):
+                entries.append((child_path, None))
+                stack.append((child_path, child))
+            else:
+                entries.append((child_path, [int(child.binary), child.size, [chunk_id.hex() for chunk_id in child.chunks]]))
+                for chunk_id in child.chunks:
+                    if chunk_id not in chunks:
+                        chunks[chunk_id] = lambda chunk_id=chunk_id: store.get(chunk_id)
+    return {
+        "fs.tree": record_buckets(entries),
+        "fs.chunks": chunks
+    }
+
+
+def restore_file_system(file_system, sections):
+    """Rebuild the directory tree; chunk contents are registered lazily from the snapshot."""
+    chunk_data = sections.get("fs.chunks", {})
+    entries = sorted(join_records(sections.get("fs.tree", {})), key=lambda entry: entry[0].count('/'))
+    store = ChunkStore(file_system.chunks.chunk_size)
+    refs = {}
+    root = DirectoryNode('', None)
+    directories = {'': root}
+    for path, file in entries:
+        parent_path, _, name = path.rpartition('/')
+        parent = directories[parent_path]
+        if file is None:
+            node = directories[path] = DirectoryNode(name, parent)
+        else:
+            binary, size, chunk_ids = file
+            node = FileNode(name, parent, bool(binary), size)
+            node.chunks = [bytes.fromhex(chunk_id) for chunk_id in chunk_ids]
+            for chunk_id in node.chunks:
+                refs[chunk_id] = refs.get(chunk_id, 0) + 1
+        parent.children[name] = node
+
+    store.chunk_count = len(refs)
+    for chunk_id, count in refs.items():
+        data = chunk_data[chunk_id]
+        store.stored_bytes += len(data)
+        store.logical_bytes += len(data) * count
+        store.register_lazy(chunk_id, len(data), count, lambda data=data: data)
+    file_system.root = root
+    file_system.chunks = store
+    file_system._image_chunks = set()
+    file_system._reset_path_cache()
+
+
+def capture_kernel(kernel, dirty=None):
+    """Sections for the kernel's memory, RAM, process table, accounting and memory log.
+
+    `dirty` comes from Changes.take: only the pages and journal buckets in
+    it are encoded. Without it everything is.
+    """
+    dirty = dirty or {}
+    with kernel._extents_lock:
+        sections = {
+            "kernel.meta": {b'meta': _json({
+                "version": kernel.version,
+                "memory_size": kernel.memory_size,
+                "processes": list(kernel.processes.items()),
+                "hard_quota": kernel.accounting.hard_quota,
+                "soft_quota": kernel.accounting.soft_quota
+            })},
+            "kernel.memory": cell_pages(kernel.memory, dirty=dirty.get("memory")),
+            "kernel.extents": record_buckets(kernel.process_extents.items()),
+            "kernel.accounting": _capture_accounting(kernel.accounting),
+        }
+        if kernel.ram is not None:
+            sections["kernel.ram"] = byte_pages(kernel.ram.view, dirty=dirty.get("ram"))
+    sections["journal"] = capture_journal(kernel.files_log.memory_journal, dirty.get("journal"))
+    return sections
+
+
+def restore_kernel(kernel, sections):
+    meta = json.loads(sections["kernel.meta"][b'meta'])
+    if meta["memory_size"] != kernel.memory_size:
+        raise ValueError("Snapshot does not match the memory size")
+    memory = join_cells(sections["kernel.memory"])
+    extents = {process_id: [tuple(extent) for extent in ranges]
+               for process_id, ranges in join_records(sections.get("kernel.extents", {}))}
+    if len(memory) != kernel.memory_size:
+        raise ValueError("Snapshot does not match the memory size")
+    allocator = _rebuild_allocator(kernel.allocator, extents)
+    ram = None
+    if kernel.ram is not None and "kernel.ram" in sections:
+        ram = _buffer_data(kernel.ram.view, sections["kernel.ram"])
+    with kernel._extents_lock:
+        previous = {process_id: list(ranges) for process_id, ranges in kernel.process_extents.items()}
+        kernel.memory[:] = memory
+        kernel.process_extents.clear()
+        kernel.process_extents.update(extents)
+        kernel.allocator = allocator
+        kernel.compactor.reset(allocator)
+        if ram is not None:
+            kernel.ram.view[:] = ram
+        _report_moves(kernel.compactor, previous, extents)
+    kernel.accounting = _restore_accounting(sections.get("kernel.accounting", {}), meta)
+    kernel.version = meta["version"]
+    kernel.processes = {_pid(process_id): value for process_id, value in meta["processes"]}
+    kernel.files_log.memory_journal.replace(join_records(sections.get("journal", {})))
+
+
+def capture_core(core, dirty=None):
+    """Sections for the block table, RAM, accounting, file system and memory log of a Core; `dirty` as in capture_kernel."""
+    dirty = dirty or {}
+    manager = core.memory_manager
+    table = manager.blocks
+    blocks = dirty.get("blocks")
+    with manager._extents_lock:
+        sections = {
+            "core.meta": {b'meta': _json({
+                "blocks": len(table),
+                "block_size": table.block_size,
+                "owners": table._owner_ids,
+                "hard_quota": manager.accounting.hard_quota,
+                "soft_quota": manager.accounting.soft_quota
+            })},
+            "core.allocated": byte_pages(table.allocated, BLOCKS_PER_PAGE, blocks),
+            "core.owners": byte_pages(table.owners, BLOCKS_PER_PAGE * table.owners.itemsize, blocks),
+            "core.timestamps": byte_pages(table.timestamps, BLOCKS_PER_PAGE * table.timestamps.itemsize, blocks),
+            "core.data": row_pages(table.data, len(table), BLOCKS_PER_PAGE, blocks),
+            "core.extents": record_buckets(manager.process_extents.items()),
+            "core.accounting": _capture_accounting(manager.accounting),
+        }
+        if manager.ram is not None:
+            sections["core.ram"] = byte_pages(manager.ram.view, dirty=dirty.get("ram"))
+    sections.update(capture_file_system(core.file_system))
+    sections["journal"] = capture_journal(manager.journal, dirty.get("journal"))
+    return sections
+
+
+def restore_core(core, sections):
+    manager = core.memory_manager
+    table = manager.blocks
+    meta = json.loads(sections["core.meta"][b'meta'])
+    if meta["blocks"] != len(table) or meta["block_size"] != table.block_size:
+        raise ValueError("Snapshot does not match the memory size")
+    extents = {process_id: [tuple(extent) for extent in ranges]
+               for process_id, ranges in join_records(sections.get("core.extents", {}))}
+    allocator = _rebuild_allocator(manager.allocator, extents)
+    owners = array('q')
+    owners.frombytes(join_pages(sections["core.owners"]))
+    timestamps = array('d')
+    timestamps.frombytes(join_pages(sections["core.timestamps"]))
+    owner_ids = [_pid(process_id) for process_id in meta["owners"]]
+    allocated = join_pages(sections["core.allocated"])
+    if len(allocated) != len(table) or len(owners) != len(table) or len(timestamps) != len(table):
+        raise ValueError("Snapshot does not match the memory size")
+    ram = None
+    if manager.ram is not None and "core.ram" in sections:
+        ram = _buffer_data(manager.ram.view, sections["core.ram"])
+    with manager._extents_lock:
+        previous = {process_id: list(ranges) for process_id, ranges in manager.process_extents.items()}
+        table.allocated[:] = allocated
+        table.owners = owners
+        table.timestamps = timestamps
+        table.data = dict(join_records(sections.get("core.data", {})))
+        table._owner_ids = owner_ids
+        table._owner_slots = {process_id: slot for slot, process_id in enumerate(owner_ids)}
+        table.allocated_count = table.allocated.count(1)
+        manager.process_extents.clear()
+        manager.process_extents.update(extents)
+        manager.allocator = allocator
+        if ram is not None:
+            manager.ram.view[:] = ram
+        if manager.compactor is not None:
+            manager.compactor.reset(allocator)
+            _report_moves(manager.compactor, previous, extents)
+    manager.accounting = _restore_accounting(sections.get("core.accounting", {}), meta)
+    restore_file_system(core.file_system, sections)
+    manager.journal.replace(join_records(sections.get("journal", {})))
+
+
+def save(snapshots, capture, target, changes):
+    """Capture what changed in `target` since its last snapshot and append it to `snapshots`; return the write stats."""
+    dirty, position = changes.take()
+    try:
+        stats = snapshots.write(capture(target, dirty))
+    except BaseException:
+        changes.put_back(dirty)
+        raise
+    changes.commit(position)
+    return stats
+
+
+def restore(snapshots, restore_state, target, changes):
+    """Load the latest generation into `target`; return (generation, seconds) or None without a snapshot."""
+    started = time.perf_counter()
+    if not snapshots.exists():
+        return None
+    try:
+        restore_state(target, snapshots.load())
+    except BaseException:
+        # The index now follows the file, whatever the state was compared against before
+        changes.reset()
+        raise
+    changes.clear()
+    elapsed = time.perf_counter() - started
+    if metrics.enabled:
+        RESTORE_TIME.record(elapsed)
+    return snapshots.generation, elapsed
@@ -0,0 +1,210 @@
+"""Snapshot round trips: full and incremental generations, torn frames, deleted sections and recovery."""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot
+from core import Core
+from events import EventChannel
+from kernel import Kernel
+from mem_trace import KernelBackend
+
+_directory = None
+_cwd = None
+
+
+def setUpModule():
+    # Kernels keep their memory log under ./data; keep it out of the repository
+    global _directory, _cwd
+    _cwd = os.getcwd()
+    _directory = tempfile.TemporaryDirectory()
+    os.chdir(_directory.name)
+
+
+def tearDownModule():
+    Kernel(events=EventChannel()).files_log.log.flush()
+    os.chdir(_cwd)
+    _directory.cleanup()
+
+
+def kernel_state(kernel):
+    return {
+        "memory": list(kernel.memory),
+        "extents": {process_id: list(ranges) for process_id, ranges in kernel.process_extents.items()},
+        "usage": {process_id: kernel.accounting.usage(process_id) for process_id in kernel.process_extents},
+        "free_blocks": kernel.allocator.free_total,
+        "journal": dict(kernel.files_log.memory_journal.items()),
+    }
+
+
+class KernelSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir='.'), 'kernel.snap')
+        self.events = []
+        self.kernel = self.new_kernel()
+
+    def new_kernel(self):
+        return Kernel(events=EventChannel(lambda name, fields: self.events.append(name)), snapshot_path=self.path)
+
+    def restored(self):
+        kernel = self.new_kernel()
+        generation = kernel.restore_snapshot()
+        return kernel, generation
+
+    def test_full_generation_round_trip(self):
+        for process_id, amount in ((1, 10), (2, 30), (3, 5)):
+            self.kernel.allocate_memory(process_id, amount)
+        self.kernel.write_memory(0, [7, 8, 9])
+        stats = self.kernel.take_snapshot()
+        self.assertTrue(stats["full"])
+        expected = kernel_state(self.kernel)
+
+        kernel, generation = self.restored()
+        self.assertEqual(generation, 1)
+        self.assertEqual(kernel_state(kernel), expected)
+
+    def test_incremental_generation_round_trip(self):
+        for process_id in range(1, 6):
+            self.kernel.allocate_memory(process_id, 8)
+        first = self.kernel.take_snapshot()
+        self.kernel.deallocate_memory(2)
+        self.kernel.allocate_memory(6, 4)
+        second = self.kernel.take_snapshot()
+        self.assertFalse(second["full"])
+        self.assertLess(second["bytes"], first["bytes"])
+        expected = kernel_state(self.kernel)
+
+        kernel, generation = self.restored()
+        self.assertEqual(generation, 2)
+        self.assertEqual(kernel_state(kernel), expected)
+        self.assertNotIn(2, kernel.process_extents)
+
+    def test_bytes_and_tuple_cells_round_trip(self):
+        self.kernel.allocate_memory(1, 10)
+        cells = [(1, (2, 3)), b'x', bytearray(b'yz'), {1: 'one'}, {"$tuple": [4]}, frozenset({5})]
+        self.kernel.write_memory(0, cells)
+        self.kernel.take_snapshot()
+
+        kernel, _ = self.restored()
+        restored = kernel.read_memory(0, len(cells))
+        self.assertEqual(restored, cells)
+        self.assertEqual([type(cell) for cell in restored], [type(cell) for cell in cells])
+
+    def test_incremental_snapshot_encodes_only_dirty_pages(self):
+        self.kernel.allocate_memory(1, 4 * snapshot.CELLS_PER_PAGE)
+        self.kernel.take_snapshot()
+        self.kernel.write_memory(snapshot.CELLS_PER_PAGE + 1, [42])
+        self.assertEqual(self.kernel.take_snapshot()["written"], 1)
+
+        self.kernel.write_memory(0, [43])
+        dirty, _ = self.kernel._snapshot_changes.take()
+        self.assertEqual(dirty["memory"], {0})
+        pages = snapshot.capture_kernel(self.kernel, dirty)["kernel.memory"]
+        self.assertFalse(callable(pages[b'0']))
+        self.assertTrue(all(callable(pages[key]) for key in (b'1', b'2', b'3')))
+        # Handed back as if the write had failed: the next snapshot still stores the cell
+        self.kernel._snapshot_changes.put_back(dirty)
+        self.assertEqual(self.kernel.take_snapshot()["written"], 1)
+
+        expected = kernel_state(self.kernel)
+        kernel, _ = self.restored()
+        self.assertEqual(kernel_state(kernel), expected)
+
+    def test_torn_last_frame_is_dropped(self):
+        self.kernel.allocate_memory(1, 10)
+        self.kernel.take_snapshot()
+        expected = kernel_state(self.kernel)
+        valid_size = os.path.getsize(self.path)
+        self.kernel.allocate_memory(2, 10)
+        self.kernel.take_snapshot()
+        # Cut the second generation off mid-frame, as a crash during the write would
+        with open(self.path, 'r+b') as file:
+            file.truncate(os.path.getsize(self.path) - 3)
+
+        kernel, generation = self.restored()
+        self.assertEqual(generation, 1)
+        self.assertEqual(kernel_state(kernel), expected)
+        self.assertEqual(os.path.getsize(self.path), valid_size)
+
+    def test_restore_reports_moved_extents(self):
+        for process_id in (1, 2, 3):
+            self.kernel.allocate_memory(process_id, 100)
+        self.kernel.take_snapshot()
+        self.kernel.deallocate_memory(1)
+        self.kernel.compactor.compact()
+        moved = self.kernel.process_extents[3][0][0]
+        self.assertNotEqual(moved, 200)
+
+        relocations = []
+        self.kernel.add_relocation_listener(lambda *move: relocations.append(move))
+        backend = KernelBackend(self.kernel)
+        self.assertEqual(self.kernel.restore_snapshot(), 1)
+        self.assertIn((3, moved, 200, 100), relocations)
+        self.assertIs(backend.allocator, self.kernel.allocator)
+
+    def test_recovery_survives_a_mismatched_snapshot(self):
+        sections = snapshot.capture_kernel(self.kernel)
+        sections["kernel.meta"][b'meta'] = snapshot._json({
+            "version": "1.0.0", "memory_size": 2048, "processes": [], "hard_quota": None, "soft_quota": None
+        })
+        snapshot.SnapshotFile(self.path).write(sections)
+
+        self.kernel.self_recoverysys()
+        self.assertIn("system.restore_failed", self.events)
+        self.assertFalse(self.kernel.recovery_mode)
+
+
+class CoreSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir='.'), 'core.snap')
+
+    def new_core(self):
+        return Core(events=EventChannel(), snapshot_path=self.path)
+
+    def test_bytes_and_tuple_payloads_round_trip(self):
+        core = self.new_core()
+        manager = core.memory_manager
+        blocks = manager.allocate(1, 3)
+        payloads = [b'abc', (1, (2, b'x')), {(3, 4): bytearray(b'y')}]
+        for block_id, payload in zip(blocks, payloads):
+            manager.write_memory(block_id, payload)
+        core.take_snapshot()
+        manager.write_memory(blocks[0], b'def')
+        self.assertLessEqual(core.take_snapshot()["written"], 2)
+        payloads[0] = b'def'
+
+        restored = self.new_core()
+        self.assertEqual(restored.restore_snapshot(), 2)
+        data = restored.memory_manager.read_memory(blocks[0], len(blocks))
+        self.assertEqual(data, payloads)
+        self.assertEqual([type(payload) for payload in data], [type(payload) for payload in payloads])
+
+
+class SnapshotFileTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir='.'), 'state.snap')
+
+    def test_deleted_section_and_keys(self):
+        snapshots = snapshot.SnapshotFile(self.path)
+        snapshots.write({"a": {b'1': b'one', b'2': b'two'}, "b": {b'x': b'ex'}})
+        stats = snapshots.write({"a": {b'1': b'one'}})
+        self.assertFalse(stats["full"])
+        self.assertEqual(stats["written"], 0)
+        self.assertEqual(stats["deleted"], 2)
+
+        loaded = snapshot.SnapshotFile(self.path).load()
+        self.assertEqual(loaded["a"], {b'1': b'one'})
+        self.assertFalse(loaded.get("b"))
+
+    def test_not_a_snapshot_file(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'garbage' * 4)
+        with self.assertRaises(ValueError):
+            snapshot.SnapshotFile(self.path).load()
+
+
+if __name__ == "__main__":
+    unittest.main()
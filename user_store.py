@@ -0,0 +1,189 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping; `None` values cache negative lookups."""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return _MISSING
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class UserStore:
+    """Users and keys in one indexed sqlite3 file.
+
+    Lookups go through an LRU cache (missing names are cached too, so a
+    login for a new user does not hit the database twice). Writes update
+    the cache at once and are queued; they reach the database in one
+    transaction when `batch_size` of them have piled up, on flush(),
+    close() and interpreter exit. On first open, the old per-file layout
+    (data/users/*.json, data/keys/*.json and data/keys/all_keys.json) is
+    imported.
+    """
+
+    def __init__(self, path, cache_size=4096, batch_size=256, legacy_users_dir=None, legacy_keys_dir=None):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS keys (key_name TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._lock = threading.RLock()
+        self._pending = []
+        self._closed = False
+        self.users = LRUCache(cache_size)
+        self.keys = LRUCache(cache_size)
+        if not self._meta('legacy_imported'):
+            self.import_legacy(legacy_users_dir, legacy_keys_dir)
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def import_legacy(self, users_dir=None, keys_dir=None):
+        """Import per-file users and keys; return (users, keys) imported."""
+        users = []
+        keys = []
+        if users_dir and os.path.isdir(users_dir):
+            for name in os.listdir(users_dir):
+                data = _load_json(os.path.join(users_dir, name)) if name.endswith('.json') else None
+                if isinstance(data, dict) and 'username' in data:
+                    users.append((data['username'], json.dumps(data)))
+        if keys_dir and os.path.isdir(keys_dir):
+            for name in os.listdir(keys_dir):
+                if not name.endswith('.json') or name == 'all_keys.json':
+                    continue
+                data = _load_json(os.path.join(keys_dir, name))
+                if isinstance(data, dict) and 'key_name' in data:
+                    keys.append((data['key_name'], json.dumps(data)))
+            all_keys = _load_json(os.path.join(keys_dir, 'all_keys.json'))
+            if isinstance(all_keys, dict):
+                for key_name, value in all_keys.items():
+                    data = value if isinstance(value, dict) else {'key_name': key_name, 'passkey': value}
+                    keys.append((key_name, json.dumps(data)))
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO users VALUES (?, ?)", users)
+            self._db.executemany("INSERT OR REPLACE INTO keys VALUES (?, ?)", keys)
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('legacy_imported', '1')")
+        return len(users), len(keys)
+
+    def _get(self, table, column, cache, name):
+        value = cache.get(name)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            row = self._db.execute(f"SELECT data FROM {table} WHERE {column} = ?", (name,)).fetchone()
+        value = json.loads(row[0]) if row else None
+        cache.put(name, value)
+        return value
+
+    def _queue(self, table, column, cache, name, data):
+        with self._lock:
+            cache.put(name, data)
+            self._pending.append((table, column, name, data))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def get_user(self, username):
+        return self._get('users', 'username', self.users, username)
+
+    def put_user(self, username, data):
+        self._queue('users', 'username', self.users, username, data)
+
+    def delete_user(self, username):
+        self._queue('users', 'username', self.users, username, None)
+
+    def get_key(self, key_name):
+        return self._get('keys', 'key_name', self.keys, key_name)
+
+    def put_key(self, key_name, data):
+        self._queue('keys', 'key_name', self.keys, key_name, data)
+
+    def delete_key(self, key_name):
+        self._queue('keys', 'key_name', self.keys, key_name, None)
+
+    def flush(self):
+        """Write all queued changes in a single transaction."""
+        with self._lock:
+            if not self._pending or self._closed:
+                return
+            pending, self._pending = self._pending, []
+            with self._db:
+                for table, column, name, data in pending:
+                    if data is None:
+                        self._db.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+                    else:
+                        self._db.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?)", (name, json.dumps(data)))
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self.flush()
+            self._closed = True
+            self._db.close()
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, **options):
+    """Return the shared store for a database file, creating it on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = UserStore(path, **options)
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def _close_all():
+    for store in list(_stores.values()):
+        store.close()
@@ -0,0 +1,386 @@
+"""Paged virtual memory: per-process page tables, a TLB, demand paging and swap.
+
+Every process gets its own virtual address space, starting at 0. Pages
+are materialized on first access (zero-filled) into a fixed pool of
+physical frames. When the pool is full, the replacement policy picks a
+victim frame, and a dirty page is written to the swap file first. The
+address spaces together may be larger than physical memory (overcommit).
+Memory cells are bytes.
+
+Pages are identified by an int key ``pid << 32 | vpn`` so the hot path
+hashes integers, not tuples.
+"""
+import os
+import random
+import time
+from collections import OrderedDict
+
+PAGE_SIZE = 256
+VPN_BITS = 32
+
+
+class LRU:
+    """Evicts the least recently used page."""
+    name = "lru"
+
+    def __init__(self, frames):
+        self._order = OrderedDict()
+
+    def insert(self, key, frame):
+        self._order[frame] = None
+
+    def touch(self, key, frame):
+        self._order.move_to_end(frame)
+
+    def remove(self, key, frame):
+        del self._order[frame]
+
+    def victim(self, key):
+        frame, _ = self._order.popitem(last=False)
+        return frame
+
+
+class Clock:
+    """Second-chance (CLOCK): a hand sweeps the frames and clears reference bits."""
+    name = "clock"
+
+    def __init__(self, frames):
+        self._referenced = bytearray(frames)
+        self._resident = bytearray(frames)
+        self._hand = 0
+
+    def insert(self, key, frame):
+        self._resident[frame] = 1
+        self._referenced[frame] = 1
+
+    def touch(self, key, frame):
+        self._referenced[frame] = 1
+
+    def remove(self, key, frame):
+        self._resident[frame] = 0
+        self._referenced[frame] = 0
+
+    def victim(self, key):
+        referenced, resident = self._referenced, self._resident
+        frames = len(resident)
+        hand = self._hand
+        while True:
+            if resident[hand]:
+                if not referenced[hand]:
+                    self._hand = (hand + 1) % frames
+                    resident[hand] = 0
+                    return hand
+                referenced[hand] = 0
+            hand = (hand + 1) % frames
+
+
+class ARC:
+    """Adaptive Replacement Cache (Megiddo and Modha).
+
+    T1 holds pages seen once recently, T2 pages seen at least twice; B1
+    and B2 remember keys recently evicted from each. A miss that hits a
+    ghost list shifts the target size `p` of T1 towards the list that
+    would have kept the page.
+    """
+    name = "arc"
+
+    def __init__(self, frames):
+        self.capacity = frames
+        self.p = 0
+        self._t1 = OrderedDict()
+        self._t2 = OrderedDict()
+        self._b1 = OrderedDict()
+        self._b2 = OrderedDict()
+
+    def insert(self, key, frame):
+        if key in self._b1:
+            self.p = min(self.capacity, self.p + max(len(self._b2) // len(self._b1), 1))
+            del self._b1[key]
+            self._t2[key] = frame
+        elif key in self._b2:
+            self.p = max(0, self.p - max(len(self._b1) // len(self._b2), 1))
+            del self._b2[key]
+            self._t2[key] = frame
+        else:
+            if len(self._t1) + len(self._b1) >= self.capacity and self._b1:
+                self._b1.popitem(last=False)
+            elif len(self._t1) + len(self._t2) + len(self._b1) + len(self._b2) >= 2 * self.capacity and self._b2:
+                self._b2.popitem(last=False)
+            self._t1[key] = frame
+
+    def touch(self, key, frame):
+        if key in self._t2:
+            self._t2.move_to_end(key)
+        else:
+            del self._t1[key]
+            self._t2[key] = frame
+
+    def remove(self, key, frame):
+        if self._t1.pop(key, None) is None:
+            self._t2.pop(key, None)
+
+    def victim(self, key):
+        if self._t1 and (len(self._t1) > self.p or (key in self._b2 and len(self._t1) == self.p) or not self._t2):
+            evicted, frame = self._t1.popitem(last=False)
+            self._b1[evicted] = None
+        else:
+            evicted, frame = self._t2.popitem(last=False)
+            self._b2[evicted] = None
+        return frame
+
+
+POLICIES = {policy.name: policy for policy in (LRU, Clock, ARC)}
+
+
+class SwapFile:
+    """Page-sized slots in a local file; freed slots are reused."""
+
+    def __init__(self, path, page_size):
+        self.path = path
+        self.page_size = page_size
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'w+b')
+        self._free = []
+        self._next = 0
+
+    def allocate(self):
+        if self._free:
+            return self._free.pop()
+        self._next += 1
+        return self._next - 1
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def write(self, slot, data):
+        self._file.seek(slot * self.page_size)
+        self._file.write(data)
+
+    def read(self, slot):
+        self._file.seek(slot * self.page_size)
+        data = self._file.read(self.page_size)
+        return data.ljust(self.page_size, b'\0')
+
+    def close(self):
+        self._file.close()
+
+
+class VirtualMemory:
+    """Virtual address spaces backed by `frames` physical frames and a swap file."""
+
+    def __init__(self, frames, page_size=PAGE_SIZE, policy="lru", swap_path="data/swap/swap.bin", tlb_size=64):
+        if frames <= 0:
+            raise ValueError("Virtual memory needs at least one frame")
+        self.frames = frames
+        self.page_size = page_size
+        self.memory = bytearray(frames * page_size)
+        self.policy = POLICIES[policy](frames) if isinstance(policy, str) else policy
+        self.swap = SwapFile(swap_path, page_size)
+        self.tlb_size = tlb_size
+        self.tlb = {}
+        # pid -> {vpn: frame} for resident pages
+        self.page_tables = {}
+        # pid -> number of pages in the address space
+        self.sizes = {}
+        # page key -> swap slot
+        self.swapped = {}
+        self.frame_page = [None] * frames
+        self.dirty = bytearray(frames)
+        self._free_frames = list(range(frames - 1, -1, -1))
+        self.tlb_hits = 0
+        self.tlb_misses = 0
+        self.page_faults = 0
+        self.swap_ins = 0
+        self.swap_outs = 0
+
+    def allocate(self, process_id, length):
+        """Extend a process address space by `length` cells; return the first virtual address."""
+        if length <= 0:
+            raise ValueError("Allocation length must be positive")
+        pages = self.sizes.get(process_id, 0)
+        self.sizes[process_id] = pages + -(-length // self.page_size)
+        self.page_tables.setdefault(process_id, {})
+        return pages * self.page_size
+
+    def free(self, process_id):
+        """Drop a whole address space: frames, swap slots and TLB entries."""
+        pages = self.sizes.pop(process_id, 0)
+        table = self.page_tables.pop(process_id, {})
+        for vpn, frame in table.items():
+            key = process_id << VPN_BITS | vpn
+            self.policy.remove(key, frame)
+            self.tlb.pop(key, None)
+            self.frame_page[frame] = None
+            self.dirty[frame] = 0
+            self._free_frames.append(frame)
+        base = process_id << VPN_BITS
+        for vpn in range(pages):
+            slot = self.swapped.pop(base | vpn, None)
+            if slot is not None:
+                self.swap.release(slot)
+        return pages
+
+    def _frame(self, process_id, vpn, write):
+        key = process_id << VPN_BITS | vpn
+        frame = self.tlb.get(key)
+        if frame is None:
+            self.tlb_misses += 1
+            table = self.page_tables.get(process_id)
+            if table is None or vpn >= self.sizes[process_id]:
+                raise ValueError(f"Segmentation fault: process {process_id}, page {vpn}")
+            frame = table.get(vpn)
+            if frame is None:
+                frame = self._fault(process_id, vpn, key, table)
+            else:
+                self.policy.touch(key, frame)
+            if len(self.tlb) >= self.tlb_size:
+                del self.tlb[next(iter(self.tlb))]
+            self.tlb[key] = frame
+        else:
+            self.tlb_hits += 1
+            self.policy.touch(key, frame)
+        if write:
+            self.dirty[frame] = 1
+        return frame
+
+    def _fault(self, process_id, vpn, key, table):
+        """Bring a page into a frame (demand paging), evicting one if needed."""
+        self.page_faults += 1
+        if self._free_frames:
+            frame = self._free_frames.pop()
+        else:
+            frame = self._evict(key)
+        start = frame * self.page_size
+        slot = self.swapped.get(key)
+        if slot is None:
+            self.memory[start:start + self.page_size] = bytes(self.page_size)
+            self.dirty[frame] = 1
+        else:
+            # The swap slot stays assigned: a clean page is evicted without writing it again
+            self.memory[start:start + self.page_size] = self.swap.read(slot)
+            self.swap_ins += 1
+            self.dirty[frame] = 0
+        table[vpn] = frame
+        self.frame_page[frame] = key
+        self.policy.insert(key, frame)
+        return frame
+
+    def _evict(self, incoming):
+        frame = self.policy.victim(incoming)
+        key = self.frame_page[frame]
+        process_id, vpn = key >> VPN_BITS, key & ((1 << VPN_BITS) - 1)
+        if self.dirty[frame]:
+            slot = self.swapped.get(key)
+            if slot is None:
+                slot = self.swapped[key] = self.swap.allocate()
+            start = frame * self.page_size
+            self.swap.write(slot, self.memory[start:start + self.page_size])
+            self.swap_outs += 1
+        del self.page_tables[process_id][vpn]
+        self.tlb.pop(key, None)
+        return frame
+
+    def _check_range(self, process_id, address, length):
+        """Reject accesses outside the process's address space before any page is touched."""
+        if address < 0 or length < 0 or address + length > self.sizes.get(process_id, 0) * self.page_size:
+            raise ValueError(f"Segmentation fault: process {process_id}, address {address}, length {length}")
+
+    def translate(self, process_id, address):
+        """Physical address of a virtual one (faults the page in)."""
+        self._check_range(process_id, address, 1)
+        vpn, offset = divmod(address, self.page_size)
+        return self._frame(process_id, vpn, False) * self.page_size + offset
+
+    def load(self, process_id, address):
+        self._check_range(process_id, address, 1)
+        vpn, offset = divmod(address, self.page_size)
+        return self.memory[self._frame(process_id, vpn, False) * self.page_size + offset]
+
+    def store(self, process_id, address, value):
+        self._check_range(process_id, address, 1)
+        vpn, offset = divmod(address, self.page_size)
+        self.memory[self._frame(process_id, vpn, True) * self.page_size + offset] = value
+
+    def read(self, process_id, address, length):
+        """Read `length` cells starting at a virtual address, as bytes."""
+        self._check_range(process_id, address, length)
+        result = bytearray(length)
+        page_size = self.page_size
+        position = 0
+        while position < length:
+            vpn, offset = divmod(address + position, page_size)
+            count = min(page_size - offset, length - position)
+            start = self._frame(process_id, vpn, False) * page_size + offset
+            result[position:position + count] = self.memory[start:start + count]
+            position += count
+        return bytes(result)
+
+    def write(self, process_id, address, data):
+        """Write bytes (or a list of ints 0-255) at a virtual address."""
+        data = bytes(data)
+        self._check_range(process_id, address, len(data))
+        page_size = self.page_size
+        position = 0
+        while position < len(data):
+            vpn, offset = divmod(address + position, page_size)
+            count = min(page_size - offset, len(data) - position)
+            start = self._frame(process_id, vpn, True) * page_size + offset
+            self.memory[start:start + count] = data[position:position + count]
+            position += count
+        return len(data)
+
+    def stats(self):
+        lookups = self.tlb_hits + self.tlb_misses
+        return {
+            'policy': self.policy.name,
+            'frames': self.frames,
+            'resident_pages': self.frames - len(self._free_frames),
+            'swap_slots': len(self.swapped),
+            'tlb_hits': self.tlb_hits,
+            'tlb_misses': self.tlb_misses,
+            'tlb_hit_rate': self.tlb_hits / lookups if lookups else 0.0,
+            'page_faults': self.page_faults,
+            'swap_ins': self.swap_ins,
+            'swap_outs': self.swap_outs
+        }
+
+    def close(self):
+        self.swap.close()
+
+
+def access_benchmark(accesses=1_000_000, frames=64, pages=256, processes=4, seed=0, swap_path="data/swap/bench.bin"):
+    """Replay a skewed random access trace under each policy; return {policy: stats}."""
+    rng = random.Random(seed)
+    # 80% of the accesses go to 20% of the pages, with runs of sequential cells
+    hot = max(1, pages // 5)
+    trace = []
+    while len(trace) < accesses:
+        pid = rng.randrange(processes)
+        page = rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(pages)
+        base = page * PAGE_SIZE + rng.randrange(PAGE_SIZE - 16)
+        trace.extend((pid, base + step, rng.random() < 0.3) for step in range(16))
+    del trace[accesses:]
+
+    results = {}
+    for name in POLICIES:
+        vm = VirtualMemory(frames, PAGE_SIZE, name, swap_path)
+        for pid in range(processes):
+            vm.allocate(pid, pages * PAGE_SIZE)
+        load, store = vm.load, vm.store
+        started = time.perf_counter()
+        for pid, address, write in trace:
+            if write:
+                store(pid, address, 1)
+            else:
+                load(pid, address)
+        elapsed = time.perf_counter() - started
+        vm.close()
+        results[name] = dict(vm.stats(), accesses_per_second=accesses / elapsed)
+    os.remove(swap_path)
+    return results
+
+
+if __name__ == "__main__":
+    for name, stats in access_benchmark().items():
+        print(f"{name:6} {stats['accesses_per_second']:12,.0f} accesses/s  TLB hit rate {stats['tlb_hit_rate']:.3f}  "
+              f"faults {stats['page_faults']:7}  swap in/out {stats['swap_ins']}/{stats['swap_outs']}")